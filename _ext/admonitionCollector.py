@@ -0,0 +1,328 @@
+
+"""
+    Shared machinery for the purpose, question and geosciapp extensions.
+
+    Adapted from sphinx.ext.todo
+
+    https://github.com/sphinx-doc/sphinx/blob/master/sphinx/ext/todo.py
+
+    Each extension defines an admonition directive and a list directive. The
+    admonitions found while reading are recorded in the environment as small
+    ``Entry`` records (where the admonition is, not a copy of it), stored
+    per docname (``env.<name>_all_<name>s``), so
+    that purging and merging the results of parallel readers only ever
+    touches the records of the documents involved, and the lists are
+    rendered in the same (docname) order however the documents were read.
+    Nothing is written to the environment while writing, so the extensions
+    are safe for ``sphinx-build -j N`` for both reading and writing.
+
+    Once the environment is updated, and only if a document with entries or
+    a list was read again, the admonitions are taken from the cached
+    doctrees and their references are resolved once per builder, before the
+    writers start (so parallel writers inherit the index). The documents
+    with a list are then written again and their lists are expanded from
+    copies of these resolved entries; only the entries of documents that
+    were read again are re-resolved on the next build. Builds that touch no
+    entry and no list never load a doctree for them.
+    :copyright: Copyright 2007-2016 by the Sphinx team, see AUTHORS.
+    :license: BSD, see LICENSE for details.
+"""
+
+from collections import namedtuple
+
+from docutils import nodes
+from docutils.parsers.rst import directives
+
+from sphinx.locale import _
+from sphinx.environment import NoUri
+from sphinx.util.nodes import set_source_info
+from docutils.parsers.rst import Directive
+from docutils.parsers.rst.directives.admonitions import BaseAdmonition
+
+
+# bump when the records kept in the environment change: 1 was the lists of
+# node copies, 2 the per docname records and 3 the lazy references to the
+# admonitions in the doctrees
+ENV_VERSION = 3
+
+# one collected admonition: where it is, index is its position among the
+# admonitions of its kind in the document (the ids are not unique)
+Entry = namedtuple('Entry', ['docname', 'source', 'lineno', 'refid', 'index'])
+
+
+class CollectedAdmonition(BaseAdmonition):
+    """
+    An entry, displayed (if configured) in the form of an admonition.
+    Subclasses set node_class, title and name.
+    """
+
+    has_content = True
+    required_arguments = 0
+    optional_arguments = 0
+    final_argument_whitespace = False
+    option_spec = {
+        'class': directives.class_option,
+    }
+
+    title = None
+    name = None
+
+    def run(self):
+        if not self.options.get('class'):
+            self.options['class'] = ['admonition-{}'.format(self.name)]
+
+        (admonition,) = super(CollectedAdmonition, self).run()
+        if isinstance(admonition, nodes.system_message):
+            return [admonition]
+
+        admonition.insert(0, nodes.title(text=_(self.title)))
+        set_source_info(self, admonition)
+
+        targetnode = nodes.target('', '', ids=[self.name])
+        return [targetnode, admonition]
+
+
+class EntryList(Directive):
+    """
+    A list of all entries. Subclasses set list_class.
+    """
+
+    has_content = False
+    required_arguments = 0
+    optional_arguments = 0
+    final_argument_whitespace = False
+    option_spec = {}
+
+    list_class = None
+
+    def run(self):
+        # Simply insert an empty list node which will be replaced later
+        # when the collector processes the resolved doctree
+        return [self.list_class('')]
+
+
+def visit_admonition_node(self, node):
+    self.visit_admonition(node)
+
+
+def depart_admonition_node(self, node):
+    self.depart_admonition(node)
+
+
+class AdmonitionCollector(object):
+    """
+    Collects the admonitions of one kind (e.g. 'purpose') and replaces the
+    list nodes with all of them.
+    """
+
+    def __init__(self, name, node_class, list_class, directive, list_directive):
+        self.name = name
+        self.node_class = node_class
+        self.list_class = list_class
+        self.directive = directive
+        self.list_directive = list_directive
+
+        self.attr = '{0}_all_{0}s'.format(name)
+        self.list_attr = '{}_list_docs'.format(name)
+        self.include_option = '{0}_include_{0}s'.format(name)
+        self.link_only_option = '{}_link_only'.format(name)
+
+        # (builder name, docname) -> resolved copies of the entry nodes
+        self.resolved = {}
+        # docnames with entries or a list read since the index was updated
+        self.changed = set()
+
+    def store(self, env):
+        if not isinstance(getattr(env, self.attr, None), dict):
+            setattr(env, self.attr, {})
+        return getattr(env, self.attr)
+
+    def list_docs(self, env):
+        if not isinstance(getattr(env, self.list_attr, None), set):
+            setattr(env, self.list_attr, set())
+        return getattr(env, self.list_attr)
+
+    def resolved_entries(self, app, docname):
+        """
+        The entries of docname with their references resolved for the
+        current builder, as (entry, resolved node) pairs
+        """
+        env = app.builder.env
+        entries = self.store(env).get(docname, [])
+        key = (app.builder.name, docname)
+        if key not in self.resolved:
+            resolved = []
+            for entry_node in self.materialize(env, docname, entries):
+                env.resolve_references(entry_node, docname, app.builder)
+                resolved.append(entry_node)
+            self.resolved[key] = resolved
+        return zip(entries, self.resolved[key])
+
+    def materialize(self, env, docname, entries):
+        """
+        Copies (without ids) of the admonitions the entries of docname point
+        at, taken from its cached doctree
+        """
+        if not entries:
+            return []
+        admonitions = list(env.get_doctree(docname).traverse(self.node_class))
+        copies = []
+        for entry in entries:
+            newnode = admonitions[entry.index].deepcopy()
+            del newnode['ids']
+            copies.append(newnode)
+        return copies
+
+    def forget(self, docnames):
+        for key in list(self.resolved):
+            if key[1] in docnames:
+                del self.resolved[key]
+
+    def update_index(self, app, env):
+        """
+        Resolve the entries for the current builder once the environment is
+        updated, if an entry or a list changed, and return the documents
+        whose lists have to be written again
+        """
+        changed, self.changed = self.changed, set()
+        list_docs = self.list_docs(env)
+        if not changed or not list_docs:
+            return []
+
+        if app.config[self.include_option]:
+            for docname in sorted(self.store(env)):
+                self.resolved_entries(app, docname)
+        return sorted(list_docs)
+
+    def process_doctree(self, app, doctree):
+        # collect all entries in the environment
+        # this is not done in the directive itself because it some
+        # transformations must have already been run, e.g. substitutions
+        env = app.builder.env
+        entries = []
+        for index, node in enumerate(doctree.traverse(self.node_class)):
+            app.emit('{}-defined'.format(self.name), node)
+
+            try:
+                targetnode = node.parent[node.parent.index(node) - 1]
+                if not isinstance(targetnode, nodes.target):
+                    raise IndexError
+            except IndexError:
+                targetnode = None
+
+            entries.append(Entry(
+                docname=env.docname,
+                source=node.source or env.doc2path(env.docname),
+                lineno=node.line,
+                refid=targetnode.get('refid') if targetnode else None,
+                index=index,
+            ))
+
+        store = self.store(env)
+        if entries:
+            store[env.docname] = entries
+        else:
+            store.pop(env.docname, None)
+
+        if next(iter(doctree.traverse(self.list_class)), None) is not None:
+            self.list_docs(env).add(env.docname)
+        if entries or env.docname in self.list_docs(env):
+            self.changed.add(env.docname)
+
+    def backlink(self, app, entry, fromdocname):
+        """
+        Paragraph pointing from a list in fromdocname back to the entry
+        """
+        para = nodes.paragraph(classes=['{}-source'.format(self.name)])
+        if app.config[self.link_only_option]:
+            description = _('<<original entry>>')
+        else:
+            description = (
+                _('(The <<original entry>> is located in %s, line %d.)') %
+                (entry.source, entry.lineno)
+            )
+        desc1 = description[:description.find('<<')]
+        desc2 = description[description.find('>>')+2:]
+        para += nodes.Text(desc1, desc1)
+
+        # Create a reference
+        newnode = nodes.reference('', '', internal=True)
+        innernode = nodes.emphasis(_('original entry'), _('original entry'))
+        try:
+            newnode['refuri'] = app.builder.get_relative_uri(
+                fromdocname, entry.docname)
+            if entry.refid:
+                newnode['refuri'] += '#' + entry.refid
+        except NoUri:
+            # ignore if no URI can be determined, e.g. for LaTeX output
+            pass
+        newnode.append(innernode)
+        para += newnode
+        para += nodes.Text(desc2, desc2)
+        return para
+
+    def process_nodes(self, app, doctree, fromdocname):
+        include = app.config[self.include_option]
+        if not include:
+            for node in doctree.traverse(self.node_class):
+                node.parent.remove(node)
+
+        # Replace all list nodes with a list of the collected entries.
+        # Augment each entry with a backlink to the original location.
+        env = app.builder.env
+        if fromdocname not in getattr(env, self.list_attr, ()):
+            return
+
+        for node in doctree.traverse(self.list_class):
+            if not include:
+                node.replace_self([])
+                continue
+
+            content = []
+
+            for docname in sorted(self.store(env)):
+                for entry, entry_node in self.resolved_entries(app, docname):
+                    content.append(entry_node.deepcopy())
+                    content.append(self.backlink(app, entry, fromdocname))
+
+            node.replace_self(content)
+
+    def purge(self, app, env, docname):
+        if (
+            self.store(env).pop(docname, None) or
+            docname in self.list_docs(env)
+        ):
+            self.changed.add(docname)
+        self.list_docs(env).discard(docname)
+        self.forget([docname])
+
+    def merge(self, app, env, docnames, other):
+        store = self.store(env)
+        other_store = self.store(other)
+        for docname in docnames:
+            if docname in other_store:
+                store[docname] = other_store[docname]
+        list_docs = self.list_docs(other).intersection(docnames)
+        self.list_docs(env).update(list_docs)
+        self.changed.update(list_docs, set(other_store).intersection(docnames))
+        self.forget(docnames)
+
+    def setup(self, app):
+        app.add_event('{}-defined'.format(self.name))
+        app.add_config_value(self.include_option, True, 'html')
+        app.add_config_value(self.link_only_option, False, 'html')
+        app.add_config_value('{}_emit_warnings'.format(self.name), False, 'html')
+
+        handlers = (visit_admonition_node, depart_admonition_node)
+        app.add_node(self.list_class)
+        app.add_node(self.node_class,
+                     html=handlers, latex=handlers, text=handlers,
+                     man=handlers, texinfo=handlers)
+
+        app.add_directive(self.name, self.directive)
+        app.add_directive('{}list'.format(self.name), self.list_directive)
+        app.connect('doctree-read', self.process_doctree)
+        app.connect('doctree-resolved', self.process_nodes)
+        app.connect('env-purge-doc', self.purge)
+        app.connect('env-merge-info', self.merge)
+        app.connect('env-updated', self.update_index)
@@ -0,0 +1,229 @@
+"""
+Sphinx extension with a player for the animations saved by frameWriter.
+
+::
+
+    .. animation:: images/TwoSphere_Current_Anim
+        :alt: Current and charge density for each source location
+        :width: 600px
+
+The argument is the directory ``save_animation`` wrote. The frames (or
+videos and poster) are copied to ``_animations`` under content-addressed
+names, so they can be cached forever and are only downloaded once however
+many pages show them. Frame sequences are played by ``_static/animation.js``:
+the page shows the first frame as a plain image and playback starts as soon
+as it has loaded, each frame being fetched just before it is shown (and
+only while the player is on screen). Videos use a ``<video>`` element with
+the first frame as poster.
+"""
+
+import io
+import json
+import os
+
+from docutils import nodes
+from docutils.parsers.rst import Directive, directives
+from sphinx.util import logging
+from sphinx.util.osutil import relative_uri
+
+from copyImages import file_hash, hashed_name, sync_file
+from frameWriter import MANIFEST, MANIFEST_VERSION
+
+logger = logging.getLogger(__name__)
+
+OUTDIR = '_animations'
+
+
+class animation_node(nodes.General, nodes.Element):
+    pass
+
+
+class Animation(Directive):
+    """
+    Player for a frame sequence or video written by save_animation
+    """
+
+    has_content = False
+    required_arguments = 1
+    optional_arguments = 0
+    final_argument_whitespace = False
+    option_spec = {
+        'alt': directives.unchanged,
+        'width': directives.length_or_percentage_or_unitless,
+        'noloop': directives.flag,
+        'class': directives.class_option,
+    }
+
+    def run(self):
+        env = self.state.document.settings.env
+        rel, path = env.relfn2path(self.arguments[0])
+        manifest_path = os.path.join(path, MANIFEST)
+        env.note_dependency(manifest_path)
+
+        try:
+            with io.open(manifest_path, encoding='utf-8') as f:
+                manifest = json.load(f)
+        except (IOError, OSError, ValueError) as err:
+            return [self.state.document.reporter.warning(
+                'cannot read animation {}: {}'.format(rel, err),
+                line=self.lineno
+            )]
+        if manifest.get('version') != MANIFEST_VERSION:
+            return [self.state.document.reporter.warning(
+                'animation {} was saved by another version of frameWriter'
+                .format(rel), line=self.lineno
+            )]
+
+        files = getattr(env, 'animation_files', {})
+        env.animation_files = files
+        docfiles = files.setdefault(env.docname, {})
+
+        prefix = os.path.basename(os.path.normpath(path))
+
+        def add(name):
+            src = os.path.join(path, name)
+            env.note_dependency(src)
+            outname = hashed_name(
+                '{}-{}'.format(prefix, name), file_hash(src)
+            )
+            docfiles[outname] = src
+            return outname
+
+        node = animation_node()
+        node['fps'] = manifest.get('fps', 5)
+        node['frames'] = [add(name) for name in manifest.get('frames', [])]
+        node['videos'] = [
+            (add(video['src']), video['type'])
+            for video in manifest.get('videos', [])
+        ]
+        node['poster'] = (
+            add(manifest['poster']) if 'poster' in manifest else None
+        )
+        node['alt'] = self.options.get('alt', prefix)
+        node['width'] = self.options.get('width')
+        node['loop'] = 'noloop' not in self.options
+        node['classes'] += self.options.get('class', [])
+
+        if not node['frames'] and not node['videos']:
+            return [self.state.document.reporter.warning(
+                'animation {} has no frames'.format(rel), line=self.lineno
+            )]
+        return [node]
+
+
+def _uri(translator, name):
+    return relative_uri(
+        translator.builder.get_target_uri(translator.builder.current_docname),
+        '{}/{}'.format(OUTDIR, name)
+    )
+
+
+def visit_animation_html(self, node):
+    style = ''
+    if node['width']:
+        style = ' style="max-width: {}"'.format(self.attval(node['width']))
+    classes = ' '.join(['animation-player'] + node['classes'])
+
+    if node['videos']:
+        poster = ''
+        if node['poster']:
+            poster = ' poster="{}"'.format(_uri(self, node['poster']))
+        self.body.append(
+            '<div class="{}"{}><video class="animation-video" controls '
+            'autoplay muted playsinline preload="metadata"{}{} '
+            'aria-label="{}">'.format(
+                classes, style, ' loop' if node['loop'] else '', poster,
+                self.attval(node['alt'])
+            )
+        )
+        for name, mimetype in node['videos']:
+            self.body.append('<source src="{}" type="{}" />'.format(
+                _uri(self, name), mimetype))
+        self.body.append('</video></div>\n')
+        raise nodes.SkipNode
+
+    frames = [_uri(self, name) for name in node['frames']]
+    self.body.append(
+        '<div class="{}"{} data-fps="{}" data-loop="{}" data-frames="{}">'
+        '<img class="animation-frame" src="{}" alt="{}" />'
+        '<div class="animation-controls">'
+        '<button type="button" data-action="previous" '
+        'aria-label="Previous frame">&#9664;</button>'
+        '<button type="button" data-action="play" '
+        'aria-label="Play or pause">&#10074;&#10074;</button>'
+        '<button type="button" data-action="next" '
+        'aria-label="Next frame">&#9654;</button>'
+        '<input type="range" min="0" max="{}" value="0" '
+        'aria-label="Frame" />'
+        '</div></div>\n'.format(
+            classes, style, node['fps'],
+            'true' if node['loop'] else 'false',
+            self.attval(json.dumps(frames)), frames[0],
+            self.attval(node['alt']), len(frames) - 1
+        )
+    )
+    raise nodes.SkipNode
+
+
+def skip_animation(self, node):
+    raise nodes.SkipNode
+
+
+def copy_animations(app, exception):
+    if exception is not None or app.builder.format != 'html':
+        return
+
+    outdir = os.path.join(app.outdir, OUTDIR)
+    wanted = {}
+    for docfiles in getattr(app.env, 'animation_files', {}).values():
+        wanted.update(docfiles)
+    if not wanted and not os.path.isdir(outdir):
+        return
+    if not os.path.isdir(outdir):
+        os.makedirs(outdir)
+
+    copied = 0
+    for outname, src in sorted(wanted.items()):
+        dst = os.path.join(outdir, outname)
+        # the names are content-addressed: an existing file is up to date
+        if not os.path.exists(dst) and os.path.exists(src):
+            sync_file(src, dst, 'reflink')
+            copied += 1
+    for name in os.listdir(outdir):
+        if name not in wanted:
+            os.remove(os.path.join(outdir, name))
+    if copied:
+        logger.info('copied {} animation files'.format(copied))
+
+
+def purge_animations(app, env, docname):
+    getattr(env, 'animation_files', {}).pop(docname, None)
+
+
+def merge_animations(app, env, docnames, other):
+    files = getattr(env, 'animation_files', {})
+    other_files = getattr(other, 'animation_files', {})
+    for docname in docnames:
+        if docname in other_files:
+            files[docname] = other_files[docname]
+    env.animation_files = files
+
+
+def setup(app):
+    skip = (skip_animation, None)
+    app.add_node(
+        animation_node, html=(visit_animation_html, None), latex=skip,
+        text=skip, man=skip, texinfo=skip
+    )
+    app.add_directive('animation', Animation)
+
+    # renamed in Sphinx 1.8
+    add_js_file = getattr(app, 'add_js_file', None) or app.add_javascript
+    add_css_file = getattr(app, 'add_css_file', None) or app.add_stylesheet
+    add_js_file('animation.js')
+    add_css_file('animation.css')
+
+    app.connect('env-purge-doc', purge_animations)
+    app.connect('env-merge-info', merge_animations)
+    app.connect('build-finished', copy_animations)
+    return {'parallel_read_safe': True, 'parallel_write_safe': True}
@@ -1,10 +1,28 @@
+"""
+Generate the contributors and case history pages from their json files.
+
+Loaded as a Sphinx extension, the pages are generated when the builder is
+initialized. Each generated page records a hash of its own inputs (the
+json files it is made from, this module and the metadata module) and is only
+rewritten when that hash changes, so the pages, and the documents
+referencing them, are not marked as outdated by builds in which nothing
+changed.
+"""
+
 import shutil
 import os
-import json
 import io
+import hashlib
+from collections import OrderedDict
+
+import metadata
+from metadata import load_contributors, load_case_histories
+from equationBank import load_bank
 
 fName = os.path.realpath(__file__)
 
+SOURCE_HASH = u'.. autodoc-source-hash: {}\n'
+
 CONTRIB_INFO = ['affiliation', 'location', 'email', 'url', 'ORCID']
 CASEHISTORY_INFO = ['citations', 'contributors', 'tags']
 
@@ -21,14 +39,44 @@ THIS_IS_AUTOGENERATED = (
 )
 
 
+def source_hash(*fpaths):
+    """
+    hash of the json inputs of a page and of the generator and metadata
+    modules
+    """
+    sha = hashlib.sha1()
+    for path in list(fpaths) + [fName, metadata.fName]:
+        with open(path, 'rb') as f:
+            sha.update(f.read())
+    return sha.hexdigest()
+
+
+def is_up_to_date(fout, digest):
+    """
+    check whether the generated file fout was made from inputs with digest
+    """
+    if not os.path.isfile(fout):
+        return False
+    line = SOURCE_HASH.format(digest)
+    with io.open(fout, encoding='utf-8') as f:
+        for existing in f:
+            if existing == line:
+                return True
+            if existing.strip() and not existing.startswith('..'):
+                # past the header
+                return False
+    return False
+
+
 def make_formula_sheet():
 
-    # Create the examples dir in the docs folder.
+    # One entry per equation of the equation bank (see equationBank.py),
+    # shown with its bank label and reference target.
 
     EquationSheetDir = os.path.sep.join(
         fName.split(os.path.sep)[:-2] + ['content', 'equation_bank']
     )
-    files = os.listdir(EquationSheetDir)
+    bank = load_bank(EquationSheetDir)
 
     rst = os.path.sep.join(
         (fName.split(os.path.sep)[:-2] + ['content', 'equation_bank' + '.rst'])
@@ -45,17 +93,19 @@ Equation Bank
 """.format(THIS_IS_AUTOGENERATED)
 
     print('\nCreating: equation_bank.rst')
-    f = open(rst, 'w')
+    f = io.open(rst, 'w', encoding='utf-8')
     f.write(out)
 
-    for name in files:
-        out = """
+    for label in bank:
+        out = u"""
 
  - {}
 
-    .. include:: equation_bank/{}
+    .. includemath:: {}
+        :label:
+        :target:
 
-        """.format(name.rstrip('.rst'), name)
+        """.format(label, label)
         f.write(out)
 
     f.close()
@@ -65,21 +115,21 @@ Equation Bank
 
 def make_contributorslist(fpath='contributors.json',
                           fout='contributors.rst',
-                          contrib_info=CONTRIB_INFO):
+                          contrib_info=CONTRIB_INFO,
+                          force=False):
 
     fpath = os.path.sep.join(fName.split(os.path.sep)[:-2] + [fpath])
     fout = os.path.sep.join(fName.split(os.path.sep)[:-2] + [fout])
 
-    fpath = open(fpath)  # file to write to
-    contribs = json.load(fpath)  # contributors json
-    keys = contribs.keys()
+    digest = source_hash(fpath)
+    if not force and is_up_to_date(fout, digest):
+        print('contributors.rst is up to date')
+        return
+
+    contribs = load_contributors(fpath)  # validated contributor records
 
     # sort by last name
-    last_names = []
-    for key, val in iter(contribs.items()):
-        if 'name' not in val:
-            raise Exception('{} has no name!?'.format(keys))
-        last_names.append(val['name'].split(' ')[-1])
+    last_names = [val.name.split(' ')[-1] for val in contribs.values()]
 
     # # get relavent info
     # contrib_info = list(
@@ -91,17 +141,19 @@ def make_contributorslist(fpath='contributors.json',
     sorted_names = sorted(last_names)
 
     out = u"""
-{}
+{}{}
 
 .. _contibutors:
 
 Contributors
 ============
 
-""".format(THIS_IS_AUTOGENERATED)
+""".format(THIS_IS_AUTOGENERATED, SOURCE_HASH.format(digest))
 
     print('\nCreating: contributors.rst')
-    with io.open(fout, 'w', encoding='utf-8') as f:
+    # written aside and moved into place so that a failed run never leaves
+    # a partial page carrying an up to date hash
+    with io.open(fout + '.tmp', 'w', encoding='utf-8') as f:
         f.write(out)
 
         for _, key in sorted_names:
@@ -110,7 +162,7 @@ Contributors
 
             html_block = []
             for info_key in contrib_info:
-                if info_key in contrib:
+                if getattr(contrib, info_key) is not None:
                     # if info_key == 'ORCID':
                     #     html = """
                     #         <strong>ORCID:</strong><a class="reference external" href="http://orcid.org/{val}">{val}</a><br>
@@ -118,7 +170,7 @@ Contributors
                     # val = contrib[info_key]
                     # if info_key == 'ORCID':
                     #     val = "`{val} <{url}>`_".format(val=val, url=ORCID_URL+val)
-                    val = contrib[info_key]
+                    val = getattr(contrib, info_key)
                     if info_key == 'ORCID':
                                     htmlval = """
         <a class="reference external" href="{url}">{orcid}</a>
@@ -148,10 +200,10 @@ Contributors
             # join the block
             html_block = '<br>'.join(html_block)
 
-            if 'avatar' in contrib:
+            if contrib.avatar is not None:
                 avatar = u"""
         <a class="reference internal image-reference" href="{avatar}"><img alt="{avatar}" class="align-left" src="{avatar}" style="width: 120px; border-radius: 10px; vertical-align: text-middle padding-left="20px" /></a>
-                """.format(avatar=contrib['avatar'])
+                """.format(avatar=contrib.avatar)
 
             else:
                 avatar = u""
@@ -177,8 +229,8 @@ Contributors
 
 
             """.format(id=key,
-                       name=contrib['name'],
-                       underline='-'*len(contrib['name']),
+                       name=contrib.name,
+                       underline='-'*len(contrib.name),
                        namepermalink=key,
                        par='&para;',
                        avatar=avatar,
@@ -187,30 +239,36 @@ Contributors
 
             f.write(out)
 
-        f.close()
+    os.replace(fout + '.tmp', fout)
 
     print('Done writing contributors.rst\n')
 
 
 def make_case_histories(fpath='content/case_histories/case_histories.json',
                         fout='content/case_histories/case_histories.rst',
-                        casehistory_info=CASEHISTORY_INFO):
+                        casehistory_info=CASEHISTORY_INFO,
+                        force=False):
 
     fpath = os.path.sep.join(fName.split(os.path.sep)[:-2] + fpath.split('/'))
     fout = os.path.sep.join(fName.split(os.path.sep)[:-2] + fout.split('/'))
 
-    fpath = open(fpath)  # file to write to
-    casehistories = json.load(fpath)  # casehistories json
+    # the records are checked against the contributors
+    digest = source_hash(fpath, metadata._path(metadata.CONTRIBUTORS_JSON))
+    if not force and is_up_to_date(fout, digest):
+        print('case_histories.rst is up to date')
+        return
+
+    casehistories = load_case_histories(fpath)  # validated records
 
     out = u"""
 
-{}
+{}{}
 
 
-""".format(THIS_IS_AUTOGENERATED)
+""".format(THIS_IS_AUTOGENERATED, SOURCE_HASH.format(digest))
 
     print('Creating: case_histories.html')
-    f = open(fout, 'w')
+    f = io.open(fout + '.tmp', 'w', encoding='utf-8')
     f.write(out)
 
     toctree = u"""
@@ -234,35 +292,29 @@ Gallery
 -------
     """)
 
-    for key in casehistories.keys():
-        casehistory = casehistories[key]
+    for key, casehistory in casehistories.items():
 
-        if 'citation' in casehistory:
-            reference_block="- {citations}".format(
-                citations=[':cite:`citation`' for citation in casehistory['citations']])
+        if casehistory.citations:
+            reference_block = u"- References: {citations}".format(
+                citations=', '.join(
+                    ':cite:`{}`'.format(citation)
+                    for citation in casehistory.citations
+                )
+            )
         else:
-            reference_block=""
+            reference_block = u""
 
-        if 'contributors' in casehistory:
-            contrib_dict = {
-                'authors': [],
-                'editors': [],
-                'reviewers': []}
-
-            for contrib in casehistory['contributors']:
-                contrib_style = contrib['as']
-
-                contributor = ':ref:`{}`'.format(
-                        contrib['uid'].split(':')[1]
-                        )
-                if contrib_style in contrib_dict:
-                    contrib_dict[contrib_style] += ', ' + contributor
-                else:
-                    contrib_dict[contrib_style] = contributor
+        contributors_block = u""
+        if casehistory.contributors:
+            contrib_dict = OrderedDict()
+            for credit in casehistory.contributors:
+                contrib_dict.setdefault(credit.role, []).append(
+                    ':ref:`{}`'.format(credit.user)
+                )
 
             contributions = ['    - {contrib_style}: {contribs}'.format(
-                contrib_style=contrib_style, contribs=val
-                ) for contrib_style, val in iter(contrib_dict.items()) if val]
+                contrib_style=contrib_style, contribs=', '.join(val)
+                ) for contrib_style, val in contrib_dict.items()]
 
             contributions = '\n'.join(contributions)
 
@@ -271,19 +323,17 @@ Gallery
 {contributions}
 """.format(contributions=contributions)
 
-        if 'tags' in casehistory:
-            tags_dict = {}
-            for tags in casehistory['tags']:
-                tags_style = tags['as'].replace('_', ' ')
-
-                if tags_style in tags_dict:
-                    tags_dict[tags_style] += ', '+tags['uid'].replace('_', ' ')
-                else:
-                    tags_dict[tags_style] = tags['uid'].replace('_', ' ')
+        tags_block = u""
+        if casehistory.tags:
+            tags_dict = OrderedDict()
+            for tag in casehistory.tags:
+                tags_dict.setdefault(tag.kind.replace('_', ' '), []).append(
+                    tag.value.replace('_', ' ')
+                )
 
             tags_list = ['    - {tags_style}: {tag}'.format(
-                tags_style=tag_style, tag=val
-                ) for tag_style, val in iter(tags_dict.items())]
+                tags_style=tag_style, tag=', '.join(val)
+                ) for tag_style, val in tags_dict.items()]
 
             tags_list = '\n'.join(tags_list)
 
@@ -314,15 +364,11 @@ Gallery
 
         """.format(
             uid=key,
-            title=casehistory['title'],
-            description=(
-                casehistory['description'] if 'description' in
-                casehistory.keys() else
-                casehistory['title']
-            ),
-            underline='^'*len(casehistory['title']),
-            source=casehistory['source'],
-            thumbnail=casehistory['thumbnail'],
+            title=casehistory.title,
+            description=casehistory.description,
+            underline='^'*len(casehistory.title),
+            source=casehistory.source,
+            thumbnail=casehistory.thumbnail,
             references_block=reference_block,
             contributors_block=contributors_block,
             tags_block=tags_block
@@ -331,6 +377,7 @@ Gallery
         f.write(out)
 
     f.close()
+    os.replace(fout + '.tmp', fout)
 
     print('Done writing case_histories.rst')
 
@@ -352,11 +399,21 @@ Gallery
 #     </div>
 
 
+def generate_pages(app):
+    make_contributorslist()
+    make_case_histories()
+
+
+def setup(app):
+    app.connect('builder-inited', generate_pages)
+    return {'parallel_read_safe': True, 'parallel_write_safe': True}
+
+
 if __name__ == '__main__':
     """
         Run the following to create the formula sheet.
     """
 
     make_formula_sheet()
-    make_contributorslist()
-    make_case_histories()
+    make_contributorslist(force=True)
+    make_case_histories(force=True)
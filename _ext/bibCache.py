@@ -0,0 +1,213 @@
+"""
+Persistent cache for the bibliographies of sphinxcontrib-bibtex.
+
+sphinxcontrib-bibtex keeps the parsed ``.bib`` files in the environment
+only as long as the environment lives, so a fresh environment (clean
+builds, CI runners, configuration changes) parses ``references.bib``
+again, and the references are formatted again by pybtex every time a
+bibliography is read. This wraps
+
+- ``BibliographyDirective.parse_bibfile`` with a cache of the parsed
+  bibliography data keyed by the content of the ``.bib`` file, its
+  encoding and the pybtex version,
+- the pybtex formatting styles the bibliography transform uses with a
+  cache of the formatted entries keyed by the style and the content of the
+  entries being formatted,
+
+both stored as pickles in ``bib_cache_dir`` (by default ``bibcache`` next
+to the pickled environment, ``_build/doctrees``). Builds in which only the
+text of the pages changed then neither parse BibTeX nor format references.
+
+These hooks only exist in sphinxcontrib-bibtex < 2 (pinned in
+requirements.txt); with later versions the bibliographies are not cached
+and a warning says so.
+"""
+
+import hashlib
+import io
+import json
+import os
+import pickle
+
+from sphinx.util import logging
+
+logger = logging.getLogger(__name__)
+
+CACHE_VERSION = 1
+
+STYLES = 'pybtex.style.formatting'
+
+
+def pybtex_version():
+    try:
+        import pkg_resources
+        return pkg_resources.get_distribution('pybtex').version
+    except Exception:
+        return None
+
+
+class PickleCache(object):
+    """
+    Pickled values by key
+    """
+
+    def __init__(self, cachedir):
+        self.cachedir = cachedir
+
+    def path(self, key):
+        return os.path.join(self.cachedir, key[:2], key + '.pickle')
+
+    def load(self, key):
+        try:
+            with io.open(self.path(key), 'rb') as f:
+                return pickle.load(f)
+        except Exception:
+            # missing, or written by other versions of the packages
+            return None
+
+    def store(self, key, value):
+        path = self.path(key)
+        try:
+            data = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        except Exception as err:
+            logger.info('could not cache {}: {}'.format(key, err))
+            return
+        if not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        tmp = '{}.{}.tmp'.format(path, os.getpid())
+        with io.open(tmp, 'wb') as f:
+            f.write(data)
+        os.replace(tmp, path)
+
+
+def _key(*state):
+    return hashlib.sha1(json.dumps(
+        [CACHE_VERSION, pybtex_version()] + list(state)
+    ).encode('utf-8')).hexdigest()
+
+
+def bibfile_key(bibfile, encoding):
+    with io.open(bibfile, 'rb') as f:
+        digest = hashlib.sha1(f.read()).hexdigest()
+    return _key('bibfile', digest, encoding)
+
+
+def entry_state(entry):
+    """
+    json-able content of a pybtex entry
+    """
+    return [
+        entry.key, entry.type,
+        sorted((name, u'{}'.format(value))
+               for name, value in entry.fields.items()),
+        sorted((role, [u'{}'.format(person) for person in persons])
+               for role, persons in entry.persons.items()),
+    ]
+
+
+def cached_parse_bibfile(parse_bibfile, cache):
+    """
+    Wrap BibliographyDirective.parse_bibfile so that the parsed data is
+    looked up in and added to cache.
+    """
+
+    def parse(self, bibfile, encoding):
+        key = bibfile_key(bibfile, encoding)
+        data = cache.load(key)
+        if data is not None:
+            logger.info('loaded {} entries of {} from the bibtex cache'.format(
+                len(data.entries), bibfile))
+            return data
+        data = parse_bibfile(self, bibfile, encoding)
+        cache.store(key, data)
+        return data
+
+    parse.uncached = parse_bibfile
+    return parse
+
+
+class CachedStyle(object):
+    """
+    pybtex formatting style looking up the formatted entries in cache
+    """
+
+    def __init__(self, name, style, cache):
+        self.name = name
+        self.style = style
+        self.cache = cache
+
+    def format_entries(self, entries):
+        entries = list(entries)
+        # the labels depend on the other entries (alpha style suffixes)
+        key = _key('format', self.name, [entry_state(e) for e in entries])
+        formatted = self.cache.load(key)
+        if formatted is None:
+            formatted = list(self.style.format_entries(entries))
+            self.cache.store(key, formatted)
+        return formatted
+
+    def __getattr__(self, name):
+        return getattr(self.style, name)
+
+
+def cached_find_plugin(find_plugin, cache):
+    """
+    Wrap pybtex's find_plugin (as used by the bibliography transform) so
+    that the formatting styles cache their output.
+    """
+
+    def find(group, name=None, *args, **kwargs):
+        plugin = find_plugin(group, name, *args, **kwargs)
+        if group != STYLES:
+            return plugin
+
+        def style(*style_args, **style_kwargs):
+            return CachedStyle(
+                name, plugin(*style_args, **style_kwargs), cache
+            )
+
+        return style
+
+    find.uncached = find_plugin
+    return find
+
+
+def install_cache(app):
+    try:
+        from sphinxcontrib.bibtex import transforms
+        from sphinxcontrib.bibtex.directives import BibliographyDirective
+        parse_bibfile = BibliographyDirective.parse_bibfile
+        find_plugin = transforms.find_plugin
+    except (ImportError, AttributeError):
+        logger.warning(
+            'bibCache needs sphinxcontrib-bibtex < 2, the bibliographies are '
+            'not cached'
+        )
+        return
+
+    parse_bibfile = getattr(parse_bibfile, 'uncached', parse_bibfile)
+    find_plugin = getattr(find_plugin, 'uncached', find_plugin)
+
+    config = app.config
+    if not config.bib_cache:
+        BibliographyDirective.parse_bibfile = parse_bibfile
+        transforms.find_plugin = find_plugin
+        return
+
+    cache = PickleCache(
+        os.path.join(app.srcdir, config.bib_cache_dir)
+        if config.bib_cache_dir else
+        os.path.join(app.doctreedir, 'bibcache')
+    )
+    BibliographyDirective.parse_bibfile = cached_parse_bibfile(
+        parse_bibfile, cache
+    )
+    transforms.find_plugin = cached_find_plugin(find_plugin, cache)
+
+
+def setup(app):
+    app.setup_extension('sphinxcontrib.bibtex')
+    app.add_config_value('bib_cache', True, '')
+    app.add_config_value('bib_cache_dir', None, '')
+    app.connect('builder-inited', install_cache)
+    return {'parallel_read_safe': True, 'parallel_write_safe': True}
@@ -1,35 +1,309 @@
+"""
+    Incrementally sync the images stored in ``content/**/images`` into
+    ``_build/html/_images``.
+
+    A manifest kept next to the synced images records the source path, size,
+    mtime and content hash of every file that was written. On the next build
+    only new or changed sources are copied (unchanged files are recognised
+    from their size and mtime without being re-hashed) and outputs whose
+    source has disappeared are removed. Copies can be spread over a thread
+    pool and, where the filesystem supports it, replaced by reflinks or
+    hardlinks.
+
+    Two output layouts are supported. The 'flat' layout keeps the source
+    file name, so the first image found with a given name wins. The
+    'hashed' layout is content-addressed: outputs are named
+    ``<name>.<hash><ext>``, so images that share a file name no longer
+    collide and identical copies of an image are written once. The
+    hashedImages extension points the Sphinx figures at the same names.
+    Images that no image or figure directive refers to (the ones used by
+    the raw html widgets) keep a copy under their file name as well.
+"""
+
+import hashlib
+import json
 import os
+import re
 import shutil
+from concurrent.futures import ThreadPoolExecutor
+
+MANIFEST = '.copyImages.json'
+MANIFEST_VERSION = 2
+
+# ioctl request number for FICLONE (linux/fs.h)
+FICLONE = 0x40049409
+
+COPY_MODES = ['copy', 'reflink', 'hardlink']
+LAYOUTS = ['flat', 'hashed']
+
+# number of hex digits of the content hash kept in hashed file names
+HASH_LENGTH = 12
+
+# target of an image or figure directive (including substitutions)
+DIRECTIVE_RE = re.compile(
+    r'^\s*\.\.\s+(?:\|[^|]+\|\s+)?(?:image|figure)::\s*(\S+)', re.M
+)
+
+
+def file_hash(path, blocksize=1 << 20):
+    """
+    sha1 hex digest of the contents of path
+    """
+    sha = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(blocksize), b''):
+            sha.update(block)
+    return sha.hexdigest()
+
+
+def hashed_name(path, digest):
+    """
+    content-addressed file name for path, e.g. ``figure.0123456789ab.png``
+    """
+    base, ext = os.path.splitext(os.path.basename(path))
+    return '{}.{}{}'.format(base, digest[:HASH_LENGTH], ext)
+
+
+def load_manifest(buildimagesdir):
+    path = os.path.join(buildimagesdir, MANIFEST)
+    try:
+        with open(path) as f:
+            manifest = json.load(f)
+    except (IOError, OSError, ValueError):
+        return {}
+    if manifest.get('version') != MANIFEST_VERSION:
+        return {}
+    return manifest.get('files', {})
+
+
+def save_manifest(buildimagesdir, files):
+    path = os.path.join(buildimagesdir, MANIFEST)
+    tmp = path + '.tmp'
+    with open(tmp, 'w') as f:
+        json.dump(
+            {'version': MANIFEST_VERSION, 'files': files}, f,
+            indent=1, sort_keys=True
+        )
+    os.replace(tmp, path)
+
+
+def _reflink(src, dst):
+    import fcntl
+    with open(src, 'rb') as s, open(dst, 'wb') as d:
+        fcntl.ioctl(d.fileno(), FICLONE, s.fileno())
+
+
+def sync_file(src, dst, mode='copy'):
+    """
+    Write src to dst using the requested mode, falling back to a plain copy
+    when the filesystem does not support reflinks or hardlinks. Returns the
+    mode that was actually used.
+    """
+    if os.path.lexists(dst):
+        # never write through an existing (possibly hardlinked) output
+        os.remove(dst)
+
+    if mode == 'reflink':
+        try:
+            _reflink(src, dst)
+            shutil.copystat(src, dst)
+            return 'reflink'
+        except (IOError, OSError, ImportError):
+            if os.path.lexists(dst):
+                os.remove(dst)
+    elif mode == 'hardlink':
+        try:
+            os.link(src, dst)
+            return 'hardlink'
+        except OSError:
+            pass
+
+    shutil.copy2(src, dst)
+    return 'copy'
+
+
+def find_images(contentdir):
+    """
+    Yield (relative path, absolute path) of every file that lives in an
+    ``images`` directory below contentdir, in a deterministic order.
+    """
+    for root, dirList, fileList in os.walk(contentdir):
+        dirList.sort()
+        if root.endswith('images'):
+            for filename in sorted(fileList):
+                path = os.path.join(root, filename)
+                yield os.path.relpath(path, contentdir), path
+
+
+def directive_images(contentdir):
+    """
+    Set of the images (relative to contentdir) that an image or figure
+    directive in one of the rst files below contentdir refers to.
+    """
+    srcdir = os.path.dirname(os.path.abspath(contentdir))
+    images = set()
+    for root, dirList, fileList in os.walk(contentdir):
+        for filename in fileList:
+            if not filename.endswith('.rst'):
+                continue
+            with open(os.path.join(root, filename), encoding='utf-8') as f:
+                text = f.read()
+            for target in DIRECTIVE_RE.findall(text):
+                if '://' in target:
+                    continue
+                if target.startswith('/'):
+                    path = os.path.join(srcdir, target.lstrip('/'))
+                else:
+                    path = os.path.join(root, target)
+                images.add(os.path.relpath(
+                    os.path.normpath(path), contentdir
+                ).replace(os.path.sep, '/'))
+    return images
+
+
+def cached_hash(path, entry=None):
+    """
+    Content hash of path, reusing the one recorded in a manifest entry when
+    the size and mtime of the file still match it.
+    """
+    st = os.stat(path)
+    if (
+        entry is not None and entry['size'] == st.st_size and
+        entry['mtime'] == st.st_mtime_ns
+    ):
+        return entry['sha1']
+    return file_hash(path)
+
+
+def output_names(entry):
+    """
+    names written for a manifest entry (none for a missing entry)
+    """
+    if entry is None:
+        return []
+    return [entry['name']] + ([entry['flat']] if 'flat' in entry else [])
+
+
+def copyImages(contentdir=None, buildimagesdir=None, jobs=None,
+               mode='reflink', layout='flat'):
+    """
+    Sync the content images into the html build. Returns a dictionary with
+    the output names that were ``copied``, ``removed`` and left
+    ``unchanged``.
+
+    jobs is the number of copy threads (defaults to the number of cpus),
+    mode is one of 'copy', 'reflink' or 'hardlink' and layout is either
+    'flat' or 'hashed'.
+    """
+    if mode not in COPY_MODES:
+        raise ValueError(
+            'mode must be one of {}, not {}'.format(COPY_MODES, mode)
+        )
+    if layout not in LAYOUTS:
+        raise ValueError(
+            'layout must be one of {}, not {}'.format(LAYOUTS, layout)
+        )
 
-def copyImages():
     # get relevant directories
     cwd = os.getcwd()
-    contentdir = os.path.sep.join(cwd.split(os.path.sep) + ['content'])
-    buildimagesdir = os.path.sep.join(cwd.split(os.path.sep) + ['_build','html','_images'])
+    if contentdir is None:
+        contentdir = os.path.join(cwd, 'content')
+    if buildimagesdir is None:
+        buildimagesdir = os.path.join(cwd, '_build', 'html', '_images')
 
-    # check if images directory exists
     if not os.path.isdir(buildimagesdir):
-        # check if html directory exists
-        split_path = buildimagesdir.split(os.path.sep)
-        build_dir = os.path.sep.join(split_path[:-2])
-        html_dir = os.path.sep.join(split_path[:-1])
-        if not os.path.isdir(build_dir):
-            os.mkdir(build_dir)
-        if not os.path.isdir(html_dir):
-            os.mkdir(html_dir)
-        os.mkdir(buildimagesdir)
-
-    # images that have been copied
-    imnames = os.listdir(buildimagesdir)
-
-    # search for images that have been missed
-    for root, dirList, fileList in os.walk(contentdir):
-        if root.endswith('images'):
-            for filename in fileList:
-                if filename not in imnames:
-                    shutil.copy(os.path.join(root, filename),buildimagesdir)
-    return
+        os.makedirs(buildimagesdir)
+
+    # source (relative to contentdir) -> name, size, mtime and sha1
+    manifest = load_manifest(buildimagesdir)
+    files = {}
+    outputs = set()
+    todo = []
+    unchanged = []
+
+    # raw html refers to images by their file name, so images that no
+    # directive points at keep a flat copy next to the hashed one
+    referenced = directive_images(contentdir) if layout == 'hashed' else ()
+
+    for rel, src in find_images(contentdir):
+        rel = rel.replace(os.path.sep, '/')
+        st = os.stat(src)
+        prev = manifest.get(rel)
+        digest = cached_hash(src, prev)
+
+        if layout == 'hashed':
+            name = hashed_name(rel, digest)
+        else:
+            name = os.path.basename(rel)
+
+        files[rel] = {
+            'name': name,
+            'size': st.st_size,
+            'mtime': st.st_mtime_ns,
+            'sha1': digest,
+        }
+        names = [(name, layout == 'hashed')]
+        if layout == 'hashed' and rel not in referenced:
+            files[rel]['flat'] = os.path.basename(rel)
+            names.append((files[rel]['flat'], False))
+
+        for name, content_addressed in names:
+            if name in outputs:
+                # flat names: the first image with a given name wins.
+                # hashed names: an identical image is already being written
+                continue
+            outputs.add(name)
+
+            dst = os.path.join(buildimagesdir, name)
+            if os.path.exists(dst):
+                if content_addressed:
+                    # the name already says what is in the file
+                    unchanged.append(name)
+                    continue
+                if name in output_names(prev) and prev['sha1'] == digest:
+                    unchanged.append(name)
+                    continue
+                if (
+                    name not in output_names(prev) and
+                    os.path.getsize(dst) == st.st_size and
+                    file_hash(dst) == digest
+                ):
+                    # the output predates the manifest
+                    unchanged.append(name)
+                    continue
+
+            todo.append((src, dst, name))
+
+    # remove outputs whose source no longer exists or has changed name
+    removed = []
+    stale = set(
+        name for entry in manifest.values() for name in output_names(entry)
+    ) - outputs
+    for name in sorted(stale):
+        dst = os.path.join(buildimagesdir, name)
+        if os.path.lexists(dst):
+            os.remove(dst)
+        removed.append(name)
+
+    def _sync(item):
+        src, dst, name = item
+        sync_file(src, dst, mode)
+        return name
+
+    if jobs is None:
+        jobs = os.cpu_count() or 1
+
+    if jobs > 1 and len(todo) > 1:
+        with ThreadPoolExecutor(max_workers=jobs) as pool:
+            copied = list(pool.map(_sync, todo))
+    else:
+        copied = [_sync(item) for item in todo]
+
+    if copied or removed or files != manifest:
+        save_manifest(buildimagesdir, files)
+
+    return {'copied': copied, 'removed': removed, 'unchanged': unchanged}
 
 
 if __name__ == "__main__":
-    copyImages()
+    copyImages(layout='hashed')
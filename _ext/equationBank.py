@@ -0,0 +1,151 @@
+"""
+Registry of the equations of ``content/equation_bank``.
+
+Every file of the equation bank holds one equation::
+
+    .. _eq_faraday_time:
+
+    .. math::
+        \\nabla \\times \\mathbf{e} = - \\frac{\\partial \\mathbf{b}}{\\partial t}
+        :label: faraday_time
+
+and is parsed once into an ``Equation`` (its TeX, its ``:label:`` or, when
+it has none, the name of the file, and the name of its reference target).
+The equations are cached by path, size and mtime, so the ``includemath``
+directive (includeMath.py) and the formula sheet share the same records in
+a build however many pages use an equation. The options of the ``math``
+directive are recognized wherever they are in the block (the bank files
+list ``:label:`` after the equation).
+"""
+
+import io
+import os
+import re
+import textwrap
+from collections import namedtuple, OrderedDict
+
+fName = os.path.realpath(__file__)
+ROOT = os.path.sep.join(fName.split(os.path.sep)[:-2])
+
+EQUATION_BANK = 'content/equation_bank'
+
+TARGET_RE = re.compile(r'^\.\. _([^:]+):\s*$')
+MATH_RE = re.compile(r'^\.\. math::\s*(.*)$')
+OPTION_RE = re.compile(r'^:([\w-]+):\s*(.*)$')
+
+Equation = namedtuple('Equation', ['label', 'target', 'latex', 'nowrap',
+                                   'path'])
+
+
+class EquationBankError(ValueError):
+    """
+    A file of the equation bank does not hold exactly one equation, or two
+    files use the same label
+    """
+
+    def __init__(self, path, message):
+        self.path = path
+        super(EquationBankError, self).__init__(
+            '{}: {}'.format(path, message)
+        )
+
+
+def parse_equation(text, path):
+    """
+    The Equation of the text of an equation bank file
+    """
+    lines = [line.expandtabs(4).rstrip() for line in text.splitlines()]
+    target = None
+    blocks = []
+    i = 0
+    while i < len(lines):
+        match = TARGET_RE.match(lines[i])
+        if match is not None:
+            target = match.group(1)
+        match = MATH_RE.match(lines[i])
+        i += 1
+        if match is None:
+            continue
+
+        block = [match.group(1)] if match.group(1) else []
+        while i < len(lines) and (not lines[i] or lines[i][0].isspace()):
+            block.append(lines[i])
+            i += 1
+        blocks.append(block)
+
+    if len(blocks) != 1:
+        raise EquationBankError(
+            path, 'holds {} math blocks instead of one'.format(len(blocks))
+        )
+
+    options = {}
+    latex = []
+    for line in blocks[0]:
+        match = OPTION_RE.match(line.strip())
+        if match is not None:
+            options[match.group(1)] = match.group(2).strip()
+        else:
+            latex.append(line)
+    latex = textwrap.dedent('\n'.join(latex)).strip('\n')
+    if not latex.strip():
+        raise EquationBankError(path, 'the math block is empty')
+
+    stem = os.path.splitext(os.path.basename(path))[0]
+    label = options.get('label') or stem
+    return Equation(
+        label=label,
+        target=target or 'eq_{}'.format(label),
+        latex=latex,
+        nowrap='nowrap' in options,
+        path=path,
+    )
+
+
+# path -> (size, mtime, equation)
+_cache = {}
+
+
+def load_equation(path):
+    st = os.stat(path)
+    cached = _cache.get(path)
+    if cached is not None and cached[:2] == (st.st_size, st.st_mtime_ns):
+        return cached[2]
+    with io.open(path, encoding='utf-8') as f:
+        equation = parse_equation(f.read(), path)
+    _cache[path] = (st.st_size, st.st_mtime_ns, equation)
+    return equation
+
+
+def load_bank(directory=None):
+    """
+    The equations of the bank directory, by label, in file name order
+    """
+    if directory is None:
+        directory = os.path.sep.join([ROOT] + EQUATION_BANK.split('/'))
+    bank = OrderedDict()
+    for name in sorted(os.listdir(directory)):
+        if not name.endswith('.rst'):
+            continue
+        equation = load_equation(os.path.join(directory, name))
+        if equation.label in bank:
+            raise EquationBankError(
+                equation.path, 'label {} is also used by {}'.format(
+                    equation.label, bank[equation.label].path)
+            )
+        bank[equation.label] = equation
+    return bank
+
+
+def lookup(name, directory=None):
+    """
+    The equation with the label name, or of the file name(.rst). Raises a
+    KeyError when there is none.
+    """
+    bank = load_bank(directory)
+    if name in bank:
+        return bank[name]
+    stem = os.path.splitext(name)[0]
+    for equation in bank.values():
+        if os.path.splitext(os.path.basename(equation.path))[0] == stem:
+            return equation
+    raise KeyError(name)
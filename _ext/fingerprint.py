@@ -0,0 +1,308 @@
+"""
+Sphinx extension fingerprinting the static assets of the html output and
+writing their cache policy to app.yaml.
+
+When the html build finishes, every file of ``_static`` gets a copy named
+after its content (``theme.<hash>.css``, as for the images, see
+hashedImages) and the ``href``/``src`` references of the pages to these
+files are rewritten to the fingerprinted names. The ``url()`` and
+``@import`` references of the stylesheets are rewritten in their
+fingerprinted copies, so a font or image changing changes the name of the
+stylesheet using it. The original files stay in place for the scripts that
+build their urls at runtime, and the fingerprinted copies of previous
+versions of the files are removed.
+
+The cache policies of ``fingerprint_cache_policies`` are written between
+the ``BEGIN``/``END`` markers of app.yaml: fingerprinted assets and images
+can be cached forever, everything else (the pages in particular) is only
+cached for the ``default_expiration`` of app.yaml. App Engine sends an
+``ETag`` with every static file, so an expired page is revalidated rather
+than downloaded again when it did not change. This is only done when
+``fingerprint_app_yaml`` is set, so that building the html leaves the
+tracked app.yaml alone: ``make appyaml`` sets it when deploying.
+"""
+
+import hashlib
+import io
+import os
+import posixpath
+import re
+from concurrent.futures import ThreadPoolExecutor
+
+from sphinx.util import logging
+
+from copyImages import HASH_LENGTH, file_hash, hashed_name, sync_file
+from staticHandlers import write_block
+
+logger = logging.getLogger(__name__)
+
+STATIC = '_static'
+
+BEGIN = '# BEGIN cache policy'
+END = '# END cache policy'
+
+IMMUTABLE = 'public, max-age=31536000, immutable'
+
+# suffixes of the compressed copies of the files (see precompress)
+COMPRESSED = ('.gz', '.br')
+
+# (description, directory of _build/html, file name regex, expiration,
+#  Cache-Control)
+CACHE_POLICIES = [
+    (
+        'fingerprinted static assets (name.<hash>.ext) never change',
+        '_static', r'.*\.[0-9a-f]{12}\.[a-z0-9]+', '365d', IMMUTABLE
+    ),
+    (
+        'content-addressed animation frames and videos never change',
+        '_animations', r'.*\.[0-9a-f]{12}\.(png|jpg|webp|webm|mp4)',
+        '365d', IMMUTABLE
+    ),
+    (
+        'content-addressed images (name.<hash>.ext) never change',
+        '_images', r'.*\.[0-9a-f]{12}(\.[0-9]+w)?\.(gif|png|jpg|ico|webp)',
+        '365d', IMMUTABLE
+    ),
+]
+
+HASHED_RE = re.compile(
+    r'^(?P<base>.+)\.[0-9a-f]{%d}(?P<ext>\.[^./]+)$' % HASH_LENGTH
+)
+ATTRIBUTE_RE = re.compile(r'''(\b(?:href|src)=)(["'])([^"'<>]+)\2''')
+CSS_URL_RE = re.compile(
+    r'''(url\(\s*)(["']?)([^"')\s]+)\2(\s*\))|(@import\s+)(["'])([^"']+)\6'''
+)
+
+
+def _split(url):
+    """
+    (path, suffix) of a relative url, suffix being its query and fragment,
+    or None for urls that do not point at a file of the output
+    """
+    if (
+        not url or url.startswith(('/', '#', 'data:')) or
+        re.match(r'^[a-zA-Z][a-zA-Z0-9+.-]*:', url)
+    ):
+        return None
+    for separator in '?#':
+        if separator in url:
+            index = url.index(separator)
+            return url[:index], url[index:]
+    return url, ''
+
+
+class Fingerprints(object):
+    """
+    Fingerprinted names of the files of the static directory, as paths
+    relative to the output directory ('_static/css/theme.<hash>.css')
+    """
+
+    def __init__(self, outdir):
+        self.outdir = outdir
+        self.names = {}
+        self.sources = set()
+        for root, dirList, fileList in os.walk(os.path.join(outdir, STATIC)):
+            dirList.sort()
+            present = set(fileList)
+            for filename in sorted(fileList):
+                if HASHED_RE.match(filename) or filename.endswith('.tmp'):
+                    continue
+                if filename.endswith(COMPRESSED) and (
+                    os.path.splitext(filename)[0] in present
+                ):
+                    # a copy written by precompress
+                    continue
+                path = os.path.relpath(os.path.join(root, filename), outdir)
+                self.sources.add(path.replace(os.path.sep, '/'))
+
+    def _abspath(self, rel):
+        return os.path.join(self.outdir, *rel.split('/'))
+
+    def source(self, rel):
+        """
+        static file rel refers to (rel being possibly an outdated
+        fingerprinted name), or None
+        """
+        if rel in self.sources:
+            return rel
+        match = HASHED_RE.match(rel)
+        if match is not None:
+            rel = match.group('base') + match.group('ext')
+            if rel in self.sources:
+                return rel
+        return None
+
+    def fingerprint(self, rel, visiting=()):
+        if rel in self.names:
+            return self.names[rel]
+
+        src = self._abspath(rel)
+        if rel.endswith('.css') and rel not in visiting:
+            with io.open(src, 'rb') as f:
+                css = f.read().decode('utf-8', 'surrogateescape')
+            css = self.rewrite(
+                CSS_URL_RE, css, posixpath.dirname(rel), visiting + (rel,)
+            )
+            data = css.encode('utf-8', 'surrogateescape')
+            digest = hashlib.sha1(data).hexdigest()
+            name = posixpath.join(
+                posixpath.dirname(rel), hashed_name(rel, digest)
+            )
+            dst = self._abspath(name)
+            if not os.path.exists(dst):
+                with io.open(dst + '.tmp', 'wb') as f:
+                    f.write(data)
+                os.replace(dst + '.tmp', dst)
+        else:
+            name = posixpath.join(
+                posixpath.dirname(rel), hashed_name(rel, file_hash(src))
+            )
+            dst = self._abspath(name)
+            if not os.path.exists(dst):
+                sync_file(src, dst, 'reflink')
+
+        self.names[rel] = name
+        return name
+
+    def rewrite(self, pattern, text, basedir, visiting=()):
+        """
+        text with the references matched by pattern (relative to basedir)
+        pointing at the fingerprinted files
+        """
+
+        def replace(match):
+            groups = match.groups()
+            # (prefix, quote, url, suffix) of either alternative
+            if pattern is CSS_URL_RE and groups[0] is None:
+                prefix, quote, url, end = groups[4], groups[5], groups[6], ''
+            elif pattern is CSS_URL_RE:
+                prefix, quote, url, end = groups[:4]
+            else:
+                prefix, quote, url = groups
+                end = ''
+            split = _split(url)
+            if split is None:
+                return match.group(0)
+            path, suffix = split
+            source = self.source(
+                posixpath.normpath(posixpath.join(basedir, path))
+            )
+            if source is None or source in visiting:
+                # not a static file, or an import cycle
+                return match.group(0)
+            name = self.fingerprint(source, visiting)
+            newurl = posixpath.relpath(name, basedir or '.') + suffix
+            return '{}{}{}{}{}'.format(prefix, quote, newurl, quote, end)
+
+        return pattern.sub(replace, text)
+
+    def remove_unused(self):
+        """
+        Remove the fingerprinted copies of previous versions of the files
+        """
+        used = set(self.names.values())
+        removed = []
+        for root, dirList, fileList in os.walk(
+            os.path.join(self.outdir, STATIC)
+        ):
+            for filename in fileList:
+                if not HASHED_RE.match(filename):
+                    continue
+                path = os.path.join(root, filename)
+                rel = os.path.relpath(path, self.outdir)
+                if rel.replace(os.path.sep, '/') not in used:
+                    os.remove(path)
+                    removed.append(rel)
+        return removed
+
+
+def find_html(outdir):
+    for root, dirList, fileList in os.walk(outdir):
+        dirList[:] = sorted(
+            d for d in dirList if root != outdir or d not in (STATIC, '_images')
+        )
+        for filename in sorted(fileList):
+            if filename.endswith('.html'):
+                yield os.path.join(root, filename)
+
+
+def rewrite_page(fingerprints, outdir, path):
+    """
+    Point the references of the page path at the fingerprinted files.
+    Returns whether the page changed.
+    """
+    with io.open(path, 'rb') as f:
+        html = f.read().decode('utf-8', 'surrogateescape')
+    basedir = os.path.relpath(os.path.dirname(path), outdir)
+    basedir = '' if basedir == '.' else basedir.replace(os.path.sep, '/')
+    updated = fingerprints.rewrite(ATTRIBUTE_RE, html, basedir)
+    if updated == html:
+        return False
+    with io.open(path + '.tmp', 'wb') as f:
+        f.write(updated.encode('utf-8', 'surrogateescape'))
+    os.replace(path + '.tmp', path)
+    return True
+
+
+def cache_policy_handlers(policies):
+    """
+    The app.yaml handlers, as text, of the cache policies
+    """
+    handlers = []
+    for policy in policies:
+        description, directory, pattern, expiration, cache_control = policy
+        handlers.append(
+            '# {0}\n'
+            '- url: /{1}/({2})\n'
+            '  static_files: _build/html/{1}/\\1\n'
+            '  upload: _build/html/{1}/({2})\n'
+            '  expiration: "{3}"\n'
+            '  http_headers:\n'
+            '    Cache-Control: {4}\n'
+            '  secure: always\n'.format(
+                description, directory, pattern, expiration, cache_control
+            )
+        )
+    return '\n'.join(handlers)
+
+
+def fingerprint_assets(app, exception):
+    if exception is not None or app.builder.format != 'html':
+        return
+    config = app.config
+
+    if config.fingerprint_static:
+        outdir = app.outdir
+        fingerprints = Fingerprints(outdir)
+        # fingerprint the stylesheets (and what they use) first: the pages
+        # are then rewritten from a complete table
+        for rel in sorted(fingerprints.sources):
+            fingerprints.fingerprint(rel)
+
+        pages = list(find_html(outdir))
+        with ThreadPoolExecutor(max_workers=config.fingerprint_jobs) as pool:
+            changed = sum(pool.map(
+                lambda path: rewrite_page(fingerprints, outdir, path), pages
+            ))
+        removed = fingerprints.remove_unused()
+        logger.info(
+            'fingerprinted {} static files, rewrote {} pages, removed {} '
+            'unused copies'.format(
+                len(fingerprints.names), changed, len(removed))
+        )
+
+    if config.fingerprint_app_yaml:
+        write_block(
+            os.path.join(app.confdir, config.fingerprint_app_yaml),
+            cache_policy_handlers(config.fingerprint_cache_policies),
+            BEGIN, END
+        )
+
+
+def setup(app):
+    app.add_config_value('fingerprint_static', True, 'html')
+    app.add_config_value('fingerprint_jobs', None, '')
+    app.add_config_value('fingerprint_app_yaml', None, '')
+    app.add_config_value('fingerprint_cache_policies', CACHE_POLICIES, '')
+    app.connect('build-finished', fingerprint_assets)
+    return {'parallel_read_safe': True, 'parallel_write_safe': True}
@@ -0,0 +1,159 @@
+"""
+Save matplotlib animations for the ``animation`` directive.
+
+JSAnimation's ``HTMLWriter(embed_frames=True)`` inlines every frame of an
+animation in the page as base64, which makes the frames a third larger and
+the page unusable until all of them are downloaded. ``save_animation``
+writes an animation as
+
+- ``mode='frames'``: one image per frame (``frame0000.png``, ...), which
+  the player fetches one after the other, so playback starts as soon as the
+  first frame has arrived, and which are cached separately,
+- ``mode='video'``: a WebM and an MP4 encoded by a local ``ffmpeg``, with
+  the first frame as poster image,
+
+in a directory with a ``manifest.json`` describing them, e.g.::
+
+    save_animation(anim, 'images/TwoSphere_Current_Anim', fps=1)
+
+and in the documentation::
+
+    .. animation:: images/TwoSphere_Current_Anim
+
+Only matplotlib is needed, so the figure scripts can import this module
+without Sphinx.
+"""
+
+import io
+import json
+import os
+
+from matplotlib import animation
+
+MANIFEST = 'manifest.json'
+MANIFEST_VERSION = 1
+
+MODES = ['frames', 'video']
+
+# (file name, mime type, ffmpeg codec, extra ffmpeg arguments)
+VIDEOS = [
+    ('animation.webm', 'video/webm', 'libvpx-vp9',
+     ['-b:v', '0', '-crf', '33', '-pix_fmt', 'yuv420p']),
+    ('animation.mp4', 'video/mp4', 'h264',
+     ['-pix_fmt', 'yuv420p', '-movflags', '+faststart']),
+]
+
+
+class FramesWriter(animation.AbstractMovieWriter):
+    """
+    Movie writer saving each frame as an image in the output directory
+    """
+
+    def __init__(self, fps=5, fmt='png', metadata=None):
+        self.fps = fps
+        self.metadata = metadata if metadata is not None else {}
+        self.fmt = fmt
+        self.frames = []
+
+    def setup(self, fig, outfile, dpi=None):
+        self.fig = fig
+        self.outfile = outfile
+        self.dpi = dpi if dpi is not None else fig.dpi
+        self.frames = []
+        if not os.path.isdir(outfile):
+            os.makedirs(outfile)
+
+    def grab_frame(self, **savefig_kwargs):
+        name = 'frame{:04d}.{}'.format(len(self.frames), self.fmt)
+        self.fig.savefig(
+            os.path.join(self.outfile, name), format=self.fmt, dpi=self.dpi,
+            **savefig_kwargs
+        )
+        self.frames.append(name)
+
+    def finish(self):
+        pass
+
+
+class PosterWriter(animation.FFMpegWriter):
+    """
+    ffmpeg writer also saving the first frame as an image (the poster)
+    """
+
+    def __init__(self, poster, fmt='png', **kwargs):
+        super(PosterWriter, self).__init__(**kwargs)
+        self.poster = poster
+        self.fmt = fmt
+
+    def grab_frame(self, **savefig_kwargs):
+        if self.poster is not None:
+            self.fig.savefig(self.poster, format=self.fmt, dpi=self.dpi,
+                             **savefig_kwargs)
+            self.poster = None
+        super(PosterWriter, self).grab_frame(**savefig_kwargs)
+
+
+def _write_manifest(outdir, manifest):
+    path = os.path.join(outdir, MANIFEST)
+    with io.open(path + '.tmp', 'w', encoding='utf-8') as f:
+        f.write(json.dumps(manifest, indent=1, sort_keys=True))
+    os.replace(path + '.tmp', path)
+
+
+def _remove_stale(outdir, keep):
+    for name in os.listdir(outdir):
+        if name not in keep and (
+            name.startswith('frame') or name.startswith('animation.')
+        ):
+            os.remove(os.path.join(outdir, name))
+
+
+def save_animation(anim, outdir, fps=5, mode='frames', dpi=None, fmt='png',
+                   savefig_kwargs=None):
+    """
+    Save the FuncAnimation anim into the directory outdir for the
+    animation directive. mode is 'frames' or 'video' (which needs ffmpeg).
+    Returns the manifest.
+    """
+    if mode not in MODES:
+        raise ValueError(
+            'mode must be one of {}, not {}'.format(MODES, mode)
+        )
+
+    savefig_kwargs = savefig_kwargs or {}
+    manifest = {'version': MANIFEST_VERSION, 'fps': fps}
+
+    if mode == 'frames':
+        writer = FramesWriter(fps=fps, fmt=fmt)
+        anim.save(outdir, writer=writer, dpi=dpi,
+                  savefig_kwargs=savefig_kwargs)
+        manifest['frames'] = writer.frames
+    else:
+        if not animation.writers.is_available('ffmpeg'):
+            raise RuntimeError(
+                'ffmpeg is needed to save videos, save frames instead'
+            )
+        if not os.path.isdir(outdir):
+            os.makedirs(outdir)
+        # the first frame is shown until the video can play
+        poster = 'frame0000.{}'.format(fmt)
+        manifest['poster'] = poster
+        manifest['videos'] = []
+        for name, mimetype, codec, args in VIDEOS:
+            video = PosterWriter(
+                os.path.join(outdir, poster) if not manifest['videos']
+                else None,
+                fmt=fmt, fps=fps, codec=codec, extra_args=args
+            )
+            anim.save(os.path.join(outdir, name), writer=video, dpi=dpi,
+                      savefig_kwargs=savefig_kwargs)
+            manifest['videos'].append({'src': name, 'type': mimetype})
+
+    keep = set(manifest.get('frames', []))
+    keep.update(video['src'] for video in manifest.get('videos', []))
+    if 'poster' in manifest:
+        keep.add(manifest['poster'])
+    _remove_stale(outdir, keep)
+
+    _write_manifest(outdir, manifest)
+    return manifest
@@ -0,0 +1,61 @@
+"""
+Sphinx extension giving the images copied to ``_images`` content-addressed
+names (``<name>.<hash><ext>``).
+
+Sphinx flattens every image it copies into ``_images`` and resolves name
+clashes by appending a counter, which changes the served name whenever
+another image with the same name is added. Once the environment is updated
+this renames every entry of ``env.images`` to its hashed name, so the
+``image`` and ``figure`` URIs written by the HTML builder point at the
+hashed files. Identical images stored in several places map to the same
+name and are written and served once, and the names can be cached forever.
+
+Hashes are taken from the copyImages manifest when the file is unchanged,
+so no image is read twice.
+"""
+
+import os
+
+from copyImages import cached_hash, hashed_name, load_manifest
+
+
+def hash_image_names(app, env):
+    if not app.config.hashed_images:
+        return
+
+    manifest = load_manifest(os.path.join(app.outdir, '_images'))
+    contentdir = app.config.hashed_images_contentdir
+    done = getattr(env, 'hashed_images', {})
+
+    for key, (docnames, name) in list(env.images.items()):
+        if done.get(key) == name:
+            continue
+
+        path = os.path.join(app.srcdir, key)
+        if not os.path.isfile(path):
+            continue
+
+        rel = os.path.relpath(path, os.path.join(app.srcdir, contentdir))
+        digest = cached_hash(path, manifest.get(rel.replace(os.path.sep, '/')))
+        newname = hashed_name(key, digest)
+
+        # keep the FilenameUniqDict bookkeeping in step so that purged
+        # documents release their names (private, absent in other versions)
+        existing = getattr(env.images, '_existing', None)
+        if existing is not None:
+            existing.discard(name)
+            existing.add(newname)
+        env.images[key] = (docnames, newname)
+        done[key] = newname
+
+    for key in list(done):
+        if key not in env.images:
+            del done[key]
+    env.hashed_images = done
+
+
+def setup(app):
+    app.add_config_value('hashed_images', True, 'html')
+    app.add_config_value('hashed_images_contentdir', 'content', 'html')
+    app.connect('env-updated', hash_image_names)
+    return {'parallel_read_safe': True}
@@ -1,52 +1,94 @@
-
 """
-    Adapted from sphinx.ext.purpose
+Sphinx extension including the equations of the equation bank in pages.
+
+::
+
+    .. includemath:: faraday_time
+
+shows the equation labelled ``faraday_time`` (or of the file
+``faraday_time.rst``) of ``equation_bank_dir``. It is unnumbered unless it
+gets a label, the label of the equation bank (``:label:`` without value) or
+another one, e.g. when the equation is numbered on several pages::
+
+    .. includemath:: faraday_time
+        :label:
 
-    https://github.com/sphinx-doc/sphinx/blob/master/sphinx/ext/purpose.py
+    .. includemath:: faraday_time
+        :label: faraday_time_fdem
 
-    Allow purposes to be inserted into your documentation.  Inclusion of purposes can
-    be switched of by a configuration variable.  The purposelist directive collects
-    all purposes of your project and lists them along with a backlink to the
-    original location.
-    :copyright: Copyright 2007-2016 by the Sphinx team, see AUTHORS.
-    :license: BSD, see LICENSE for details.
+``:target:`` also adds the reference target of the bank file
+(``.. _eq_faraday_time:``). The equations are parsed once per build by the
+registry of equationBank.py, and an equation shown on several pages is
+typeset once (see mathPrerender).
 """
 
-from docutils import nodes
-from docutils.parsers.rst import directives
+import os
 
-import sphinx
-# from sphinx.locale import _
-# from sphinx.environment import NoUri
-# from sphinx.util.nodes import set_source_info
-# from docutils.parsers.rst import Directive
-# from docutils.parsers.rst.directives.admonitions import BaseAdmonition
+from docutils import nodes
+from docutils.parsers.rst import Directive, directives
+from docutils.statemachine import ViewList
 
-from docutils.parsers.rst.directives.misc import Include
+from equationBank import EquationBankError, lookup
 
-from sphinx.ext.mathbase import setup_math
 
-class IncludeMath(setup_math):
+class IncludeMath(Directive):
     """
-    Includes equations and allows them to be labeled
+    Includes an equation of the equation bank and allows it to be labeled
     """
 
+    has_content = False
+    required_arguments = 1
+    optional_arguments = 0
+    final_argument_whitespace = False
+    option_spec = {
+        'label': directives.unchanged,
+        'nowrap': directives.flag,
+        'target': directives.flag,
+    }
+
     def run(self):
-        # type: () -> List[nodes.Node]
-        print(self.options)
         env = self.state.document.settings.env
-        # if self.arguments[0].startswith('<') and \
-        #    self.arguments[0].endswith('>'):
-        #     # docutils "standard" includes, do not do path processing
-        #     return Include.run(self)
-        rel_filename, filename = env.relfn2path(self.arguments[0])
-        self.arguments[0] = filename
-        print(dir(env))
-        env.note_included(filename)
-        nodes = Include.run(self)
-        print(dir(nodes))
-        return nodes
+        directory = os.path.join(env.srcdir, env.config.equation_bank_dir)
+        try:
+            equation = lookup(self.arguments[0], directory)
+        except KeyError:
+            return [self.state.document.reporter.warning(
+                'no equation {} in the equation bank'.format(
+                    self.arguments[0]),
+                line=self.lineno
+            )]
+        except (EquationBankError, IOError, OSError) as err:
+            return [self.state.document.reporter.warning(
+                str(err), line=self.lineno
+            )]
+        env.note_dependency(equation.path)
+
+        lines = []
+        if 'target' in self.options:
+            lines += ['.. _{}:'.format(equation.target), '']
+        lines.append('.. math::')
+        label = self.options.get('label')
+        if label is not None:
+            lines.append('    :label: {}'.format(label or equation.label))
+        if equation.nowrap or 'nowrap' in self.options:
+            lines.append('    :nowrap:')
+        lines.append('')
+        lines += [
+            '    ' + line if line else ''
+            for line in equation.latex.split('\n')
+        ]
+
+        source = ViewList()
+        for line in lines:
+            source.append(line, equation.path)
+        node = nodes.Element()
+        self.state.nested_parse(source, self.content_offset, node)
+        return node.children
 
 
 def setup(app):
-    directives.register_directive('includemath', IncludeMath)
+    app.add_config_value(
+        'equation_bank_dir', os.path.join('content', 'equation_bank'), 'env'
+    )
+    app.add_directive('includemath', IncludeMath)
+    return {'parallel_read_safe': True, 'parallel_write_safe': True}
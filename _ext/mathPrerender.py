@@ -0,0 +1,330 @@
+"""
+Sphinx extension typesetting the math of the html pages at build time.
+
+With ``sphinx.ext.mathjax`` every ``.. math::`` block and ``:math:`` role
+(about a thousand of them) is typeset by MathJax in the reader's browser on
+every page load, and the pages made of equations (maxwell1_fundamentals,
+maxwell3_fdem, ...) stall until it is done. This renderer replaces it:
+
+- when a document is read, the expressions it uses are collected,
+- once all documents are read, the expressions missing from the cache are
+  typeset to SVG by ``math_prerender_command`` (MathJax itself, through
+  ``tex2svg`` of mathjax-node-cli, by default) on a thread pool,
+- the pages embed the SVG of their equations and do not load MathJax.
+
+The SVGs are cached in ``math_prerender_cache_dir`` (``_build/.mathcache``)
+under the hash of the command and the expression, so an expression used on
+several pages is typeset once and only new or changed expressions are
+typeset by later builds. An expression the command fails on (or every
+expression, when the command is not installed) is left to MathJax, which is
+then only loaded by the pages that need it. Only TeX errors (the command
+exiting with an error message) are cached: timeouts and a missing or
+broken command are tried again by the next build.
+"""
+
+import hashlib
+import io
+import json
+import os
+import shutil
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+
+from docutils import nodes
+from sphinx.util import logging
+
+logger = logging.getLogger(__name__)
+
+CACHE_VERSION = 1
+
+COMMAND = ['tex2svg']
+INLINE_ARGS = ['--inline']
+
+MATHJAX_PATH = (
+    'https://cdnjs.cloudflare.com/ajax/libs/mathjax/2.7.1/MathJax.js'
+    '?config=TeX-AMS-MML_HTMLorMML'
+)
+
+# inline math, and display math before and after Sphinx 1.8
+INLINE = 'math'
+DISPLAY = ['displaymath', 'math_block']
+
+
+def node_latex(node):
+    """
+    The TeX typeset for a math node, display math being wrapped as
+    sphinx.ext.mathjax does (split for multi-line, aligned for several
+    equations)
+    """
+    latex = node['latex'] if 'latex' in node else node.astext()
+    if node.tagname == INLINE or node.get('nowrap'):
+        return latex
+
+    parts = [part for part in latex.split('\n\n') if part.strip()]
+    body = []
+    for part in parts:
+        if r'\\' in part:
+            body.append(r'\begin{split}' + part + r'\end{split}')
+        else:
+            body.append(part)
+    if len(parts) > 1:
+        return (
+            r'\begin{align}\begin{aligned}' + r'\\'.join(body) +
+            r'\end{aligned}\end{align}'
+        )
+    return ''.join(body)
+
+
+def expression_key(command, display, latex):
+    return hashlib.sha1(json.dumps(
+        [CACHE_VERSION, command, display, latex]
+    ).encode('utf-8')).hexdigest()
+
+
+class MathCache(object):
+    """
+    SVGs by key, and the TeX errors of the expressions that could not be
+    typeset (so that they are not tried again by every build)
+    """
+
+    def __init__(self, cachedir):
+        self.cachedir = cachedir
+        self.loaded = {}
+
+    def path(self, key, ext):
+        return os.path.join(self.cachedir, key[:2], key + ext)
+
+    def has(self, key):
+        return (
+            os.path.exists(self.path(key, '.svg')) or
+            os.path.exists(self.path(key, '.err'))
+        )
+
+    def load(self, key):
+        """
+        The SVG of key, or None
+        """
+        if key not in self.loaded:
+            try:
+                with io.open(self.path(key, '.svg'), encoding='utf-8') as f:
+                    self.loaded[key] = f.read()
+            except (IOError, OSError):
+                self.loaded[key] = None
+        return self.loaded[key]
+
+    def store(self, key, ext, text):
+        path = self.path(key, ext)
+        if not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        tmp = '{}.{}.tmp'.format(path, os.getpid())
+        with io.open(tmp, 'w', encoding='utf-8') as f:
+            f.write(text)
+        os.replace(tmp, path)
+
+
+def typeset(command, inline_args, display, latex, timeout):
+    """
+    SVG of latex, typeset by command
+    """
+    # a leading space keeps the expression from being read as an option
+    if latex.startswith('-'):
+        latex = ' ' + latex
+    args = list(command) + ([] if display else list(inline_args)) + [latex]
+    result = subprocess.run(
+        args, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+        timeout=timeout, check=True
+    )
+    svg = result.stdout.decode('utf-8')
+    if '<svg' not in svg:
+        raise ValueError('no svg in the output of {}'.format(command[0]))
+    return svg[svg.index('<svg'):].strip()
+
+
+def collect_math(app, doctree):
+    env = app.env
+    expressions = getattr(env, 'math_expressions', {})
+    env.math_expressions = expressions
+    expressions[env.docname] = set(
+        (node.tagname != INLINE, node_latex(node))
+        for node in doctree.traverse(
+            lambda node: node.tagname == INLINE or node.tagname in DISPLAY
+        )
+    )
+
+
+def purge_math(app, env, docname):
+    getattr(env, 'math_expressions', {}).pop(docname, None)
+
+
+def merge_math(app, env, docnames, other):
+    expressions = getattr(env, 'math_expressions', {})
+    other_expressions = getattr(other, 'math_expressions', {})
+    for docname in docnames:
+        if docname in other_expressions:
+            expressions[docname] = other_expressions[docname]
+    env.math_expressions = expressions
+
+
+def install_cache(app):
+    config = app.config
+    app.math_cache = MathCache(
+        os.path.join(app.srcdir, config.math_prerender_cache_dir)
+    )
+    app.math_fallback_docs = set()
+
+
+def prerender_math(app, env):
+    config = app.config
+    if not config.math_prerender or app.builder.format != 'html':
+        return
+    cache = app.math_cache
+    command = list(config.math_prerender_command)
+
+    todo = {}
+    for expressions in getattr(env, 'math_expressions', {}).values():
+        for display, latex in expressions:
+            key = expression_key(command, display, latex)
+            if key not in todo and not cache.has(key):
+                todo[key] = (display, latex)
+    if not todo:
+        return
+
+    # not warnings: the pages stay correct (and -W builds pass) with MathJax
+    if shutil.which(command[0]) is None:
+        logger.info(
+            '{} is not installed: {} expressions are left to MathJax'.format(
+                command[0], len(todo))
+        )
+        return
+
+    def render(item):
+        key, (display, latex) = item
+        try:
+            svg = typeset(
+                command, config.math_prerender_inline_args, display, latex,
+                config.math_prerender_timeout
+            )
+        except subprocess.CalledProcessError as err:
+            if err.stderr:
+                # the expression itself is wrong: do not try it again
+                cache.store(key, '.err', u'{}\n{}\n{}'.format(
+                    latex, err, err.stderr.decode('utf-8', 'replace')))
+            return latex
+        except (OSError, ValueError, subprocess.SubprocessError):
+            # timeouts, a broken command: tried again by the next build
+            return latex
+        cache.store(key, '.svg', svg)
+        return None
+
+    logger.info('typesetting {} math expressions'.format(len(todo)))
+    with ThreadPoolExecutor(max_workers=config.math_prerender_jobs) as pool:
+        failed = [
+            latex for latex in pool.map(render, sorted(todo.items()))
+            if latex is not None
+        ]
+    if failed:
+        logger.info(
+            '{} could not typeset {} expressions (left to MathJax), e.g. '
+            '{}'.format(command[0], len(failed), failed[0])
+        )
+
+
+def _svg(self, node):
+    """
+    The cached SVG of a math node, or None when it is left to MathJax
+    """
+    config = self.builder.config
+    app = self.builder.app
+    if not config.math_prerender:
+        svg = None
+    else:
+        display = node.tagname != INLINE
+        svg = app.math_cache.load(expression_key(
+            list(config.math_prerender_command), display, node_latex(node)
+        ))
+    if svg is None:
+        app.math_fallback_docs.add(self.builder.current_docname)
+    return svg
+
+
+def _equation_number(self, node):
+    try:
+        # Sphinx >= 1.8
+        from sphinx.util.math import get_node_equation_number
+    except ImportError:
+        return node['number']
+    return get_node_equation_number(self, node)
+
+
+def html_visit_math(self, node):
+    svg = _svg(self, node)
+    self.body.append(self.starttag(node, 'span', '', CLASS='math'))
+    if svg is not None:
+        self.body.append(svg)
+    else:
+        self.body.append(r'\(' + self.encode(node_latex(node)) + r'\)')
+    self.body.append('</span>')
+    raise nodes.SkipNode
+
+
+def html_visit_displaymath(self, node):
+    svg = _svg(self, node)
+    self.body.append(self.starttag(node, 'div', CLASS='math'))
+    if node.get('number'):
+        self.body.append(
+            '<span class="eqno">({})'.format(_equation_number(self, node))
+        )
+        self.add_permalink_ref(node, 'Permalink to this equation')
+        self.body.append('</span>')
+    if svg is not None:
+        self.body.append(svg)
+    else:
+        self.body.append(r'\[' + self.encode(node_latex(node)) + r'\]')
+    self.body.append('</div>\n')
+    raise nodes.SkipNode
+
+
+def add_mathjax(app, pagename, templatename, context, doctree):
+    if pagename in getattr(app, 'math_fallback_docs', ()):
+        context['script_files'] = list(context.get('script_files', [])) + [
+            app.config.math_prerender_mathjax_path
+        ]
+
+
+def select_renderer(app, config):
+    if config.html_math_renderer is None:
+        config.html_math_renderer = 'prerender'
+
+
+def setup(app):
+    app.add_config_value('math_prerender', True, 'html')
+    app.add_config_value('math_prerender_command', COMMAND, 'html')
+    app.add_config_value('math_prerender_inline_args', INLINE_ARGS, 'html')
+    app.add_config_value('math_prerender_timeout', 60, '')
+    app.add_config_value('math_prerender_jobs', None, '')
+    app.add_config_value(
+        'math_prerender_cache_dir', os.path.join('_build', '.mathcache'), ''
+    )
+    app.add_config_value('math_prerender_mathjax_path', MATHJAX_PATH, 'html')
+
+    inline = (html_visit_math, None)
+    display = (html_visit_displaymath, None)
+    if hasattr(app, 'add_html_math_renderer'):
+        # Sphinx >= 1.8 (where sphinx.ext.mathjax is always loaded)
+        app.add_html_math_renderer('prerender', inline, display)
+        app.connect('config-inited', select_renderer)
+    else:
+        from sphinx.ext.mathbase import setup_math
+        setup_math(app, inline, display)
+
+    # add_css_file was add_stylesheet before Sphinx 1.8
+    add_css_file = getattr(app, 'add_css_file', None) or app.add_stylesheet
+    add_css_file('math.css')
+
+    app.connect('builder-inited', install_cache)
+    app.connect('doctree-read', collect_math)
+    app.connect('env-purge-doc', purge_math)
+    app.connect('env-merge-info', merge_math)
+    app.connect('env-updated', prerender_math)
+    app.connect('html-page-context', add_mathjax)
+    return {'parallel_read_safe': True, 'parallel_write_safe': True}
@@ -0,0 +1,260 @@
+"""
+Validated access to the contributors and case history metadata.
+
+``contributors.json`` and ``content/case_histories/case_histories.json`` are
+checked against the schemas below (a subset of JSON schema: ``type``,
+``required``, ``properties``, ``additionalProperties``, ``items``,
+``minLength`` and ``pattern``) when they are loaded, so a missing or
+misspelled key is reported with its location in the file instead of
+failing half way through writing a page. The case history contributors
+must also be listed in ``contributors.json``.
+
+The files are parsed once and the records are cached by path, size and
+mtime, so every generator asking for them in a build shares the same
+immutable records.
+"""
+
+import io
+import json
+import os
+import re
+from collections import namedtuple, OrderedDict
+
+fName = os.path.realpath(__file__)
+ROOT = os.path.sep.join(fName.split(os.path.sep)[:-2])
+
+CONTRIBUTORS_JSON = 'contributors.json'
+CASE_HISTORIES_JSON = 'content/case_histories/case_histories.json'
+
+_string = {'type': 'string', 'minLength': 1}
+
+CONTRIBUTORS_SCHEMA = {
+    'type': 'object',
+    'additionalProperties': {
+        'type': 'object',
+        'required': ['name'],
+        'properties': {
+            'name': _string,
+            'affiliation': _string,
+            'location': _string,
+            'email': _string,
+            'url': _string,
+            'avatar': _string,
+            'ORCID': {
+                'type': 'string',
+                'pattern': r'^\d{4}-\d{4}-\d{4}-\d{3}[\dX]$'
+            },
+        },
+        'additionalProperties': False,
+    },
+}
+
+CASE_HISTORIES_SCHEMA = {
+    'type': 'object',
+    'additionalProperties': {
+        'type': 'object',
+        'required': ['title', 'source', 'thumbnail'],
+        'properties': {
+            'title': _string,
+            'description': _string,
+            'source': _string,
+            'thumbnail': _string,
+            'citations': {'type': 'array', 'items': _string},
+            'contributors': {
+                'type': 'array',
+                'items': {
+                    'type': 'object',
+                    'required': ['as', 'uid'],
+                    'properties': {
+                        'as': _string,
+                        'uid': {'type': 'string', 'pattern': r'^user:\S+$'},
+                    },
+                    'additionalProperties': False,
+                },
+            },
+            'tags': {
+                'type': 'array',
+                'items': {
+                    'type': 'object',
+                    'required': ['as', 'uid'],
+                    'properties': {'as': _string, 'uid': _string},
+                    'additionalProperties': False,
+                },
+            },
+        },
+        'additionalProperties': False,
+    },
+}
+
+Contributor = namedtuple(
+    'Contributor',
+    ['uid', 'name', 'affiliation', 'location', 'email', 'url', 'avatar',
+     'ORCID']
+)
+
+# role is e.g. 'author' or 'reviewer', user the key in contributors.json
+Credit = namedtuple('Credit', ['role', 'user'])
+
+Tag = namedtuple('Tag', ['kind', 'value'])
+
+CaseHistory = namedtuple(
+    'CaseHistory',
+    ['uid', 'title', 'description', 'source', 'thumbnail', 'citations',
+     'contributors', 'tags']
+)
+
+
+class MetadataError(ValueError):
+    """
+    A metadata file does not match its schema
+    """
+
+    def __init__(self, path, location, message):
+        self.path = path
+        self.location = location
+        super(MetadataError, self).__init__(
+            '{}: {}: {}'.format(path, location or '<root>', message)
+        )
+
+
+_TYPES = {
+    'object': dict,
+    'array': list,
+    'string': str,
+}
+
+
+def validate(instance, schema, location=''):
+    """
+    Yield (location, message) for every way instance does not match schema
+    """
+    expected = schema.get('type')
+    if expected is not None and not isinstance(instance, _TYPES[expected]):
+        yield location, 'expected {}, got {}'.format(
+            expected, type(instance).__name__)
+        return
+
+    if isinstance(instance, str):
+        if len(instance) < schema.get('minLength', 0):
+            yield location, 'must not be empty'
+        if 'pattern' in schema and not re.search(schema['pattern'], instance):
+            yield location, '{!r} does not match {}'.format(
+                instance, schema['pattern'])
+
+    elif isinstance(instance, dict):
+        for key in schema.get('required', []):
+            if key not in instance:
+                yield location, 'missing required key {!r}'.format(key)
+        properties = schema.get('properties', {})
+        additional = schema.get('additionalProperties', True)
+        for key, value in instance.items():
+            sublocation = '{}/{}'.format(location, key)
+            if key in properties:
+                for error in validate(value, properties[key], sublocation):
+                    yield error
+            elif additional is False:
+                yield location, 'unexpected key {!r}'.format(key)
+            elif isinstance(additional, dict):
+                for error in validate(value, additional, sublocation):
+                    yield error
+
+    elif isinstance(instance, list) and 'items' in schema:
+        for i, item in enumerate(instance):
+            sublocation = '{}/{}'.format(location, i)
+            for error in validate(item, schema['items'], sublocation):
+                yield error
+
+
+def _path(path):
+    return os.path.sep.join([ROOT] + path.split('/'))
+
+
+def load_json(path, schema):
+    """
+    Parse and validate a metadata file, raising a MetadataError for the
+    first problem found
+    """
+    with io.open(path, encoding='utf-8') as f:
+        try:
+            data = json.load(f, object_pairs_hook=OrderedDict)
+        except ValueError as err:
+            raise MetadataError(path, '', 'invalid json ({})'.format(err))
+    for location, message in validate(data, schema):
+        raise MetadataError(path, location, message)
+    return data
+
+
+# path -> (size, mtime, records)
+_cache = {}
+
+
+def _cached(path, parse):
+    st = os.stat(path)
+    cached = _cache.get(path)
+    if cached is not None and cached[:2] == (st.st_size, st.st_mtime_ns):
+        return cached[2]
+    records = parse(path)
+    _cache[path] = (st.st_size, st.st_mtime_ns, records)
+    return records
+
+
+def _parse_contributors(path):
+    data = load_json(path, CONTRIBUTORS_SCHEMA)
+    return OrderedDict(
+        (uid, Contributor(uid=uid, **dict(
+            (field, info.get(field)) for field in Contributor._fields[1:]
+        )))
+        for uid, info in data.items()
+    )
+
+
+def load_contributors(path=None):
+    """
+    Contributor records of contributors.json, by uid, in file order
+    """
+    path = path or _path(CONTRIBUTORS_JSON)
+    return _cached(path, _parse_contributors)
+
+
+def _parse_case_histories(path):
+    data = load_json(path, CASE_HISTORIES_SCHEMA)
+    return OrderedDict(
+        (uid, CaseHistory(
+            uid=uid,
+            title=info['title'],
+            description=info.get('description', info['title']),
+            source=info['source'],
+            thumbnail=info['thumbnail'],
+            citations=tuple(info.get('citations', [])),
+            contributors=tuple(
+                Credit(role=c['as'], user=c['uid'].split(':', 1)[1])
+                for c in info.get('contributors', [])
+            ),
+            tags=tuple(
+                Tag(kind=t['as'], value=t['uid'])
+                for t in info.get('tags', [])
+            ),
+        ))
+        for uid, info in data.items()
+    )
+
+
+def load_case_histories(path=None, contributors=None):
+    """
+    CaseHistory records of case_histories.json, by uid, in file order.
+    Every credited contributor must be one of contributors (by default the
+    records of contributors.json).
+    """
+    path = path or _path(CASE_HISTORIES_JSON)
+    casehistories = _cached(path, _parse_case_histories)
+
+    if contributors is None:
+        contributors = load_contributors()
+    for uid, casehistory in casehistories.items():
+        for i, credit in enumerate(casehistory.contributors):
+            if credit.user not in contributors:
+                raise MetadataError(
+                    path, '/{}/contributors/{}'.format(uid, i),
+                    'unknown contributor {!r}'.format(credit.user)
+                )
+    return casehistories
@@ -0,0 +1,366 @@
+"""
+Sphinx extension that optimizes the images served from ``_images``.
+
+For every PNG and JPEG image used in the documentation this
+
+- losslessly recompresses the image (kept only when it is smaller, and
+  written under the hash of its own content, next to the original),
+- writes a WebP variant of the image,
+- writes downscaled copies (original format and WebP) for each of the
+  widths in ``optimize_images_widths`` that are narrower than the image.
+
+Encoding is done by a process pool once the environment is updated and the
+results are kept in an on-disk cache keyed by the hash of the source image
+and the encoding settings, so only new or changed images are ever
+re-encoded. The variants are written next to the images Sphinx copied to
+``_images`` when the build finishes (those of removed or changed images are
+deleted) and the HTML writer wraps each image in a ``<picture>`` element
+with ``srcset`` entries pointing at them.
+"""
+
+import hashlib
+import json
+import os
+import shutil
+from concurrent.futures import ProcessPoolExecutor
+
+from sphinx.util import logging
+
+from copyImages import cached_hash, file_hash, hashed_name, load_manifest
+
+logger = logging.getLogger(__name__)
+
+OPTIMIZED_FORMATS = {'.png': 'PNG', '.jpg': 'JPEG', '.jpeg': 'JPEG'}
+
+# bump to invalidate the cache when the encoding below changes
+ENCODER_VERSION = 2
+
+# names of the variants written to _images by the last build
+VARIANTS_MANIFEST = '.optimizeImages.json'
+
+
+def variant_name(name, width=None, ext=None):
+    """
+    name of a variant of the output image name, e.g. ``fig.480w.webp``
+    """
+    base, origext = os.path.splitext(name)
+    if width is not None:
+        base = '{}.{}w'.format(base, width)
+    return base + (ext or origext)
+
+
+def _save(img, path, fmt, quality):
+    tmp = path + '.tmp'
+    if fmt == 'WEBP':
+        if img.mode not in ('RGB', 'RGBA'):
+            img = img.convert('RGBA')
+        img.save(tmp, 'WEBP', quality=quality, method=6)
+    elif fmt == 'PNG':
+        img.save(tmp, 'PNG', optimize=True)
+    else:
+        if img.mode not in ('RGB', 'L'):
+            img = img.convert('RGB')
+        img.save(tmp, 'JPEG', quality=quality, optimize=True,
+                 progressive=True)
+    os.replace(tmp, path)
+
+
+def encode_image(src, cachedir, widths, quality):
+    """
+    Encode all variants of src into cachedir and return its metadata. Runs
+    in a worker process.
+    """
+    from PIL import Image
+
+    ext = os.path.splitext(src)[1].lower()
+    fmt = OPTIMIZED_FORMATS[ext]
+
+    tmpdir = '{}.{}.tmp'.format(cachedir, os.getpid())
+    if os.path.isdir(tmpdir):
+        shutil.rmtree(tmpdir)
+    os.makedirs(tmpdir)
+
+    img = Image.open(src)
+    img.load()
+    width, height = img.size
+    meta = {'width': width, 'height': height, 'optimized': False,
+            'widths': []}
+
+    # lossless recompression of the original
+    optimized = os.path.join(tmpdir, 'optimized' + ext)
+    if fmt == 'PNG':
+        _save(img, optimized, 'PNG', quality)
+    else:
+        # reuse the quantization tables of the source: no generation loss
+        tmp = optimized + '.tmp'
+        img.save(tmp, 'JPEG', quality='keep', optimize=True,
+                 progressive=True)
+        os.replace(tmp, optimized)
+    if os.path.getsize(optimized) < os.path.getsize(src):
+        meta['optimized'] = file_hash(optimized)
+    else:
+        os.remove(optimized)
+
+    _save(img, os.path.join(tmpdir, 'full.webp'), 'WEBP', quality)
+
+    for w in sorted(set(widths)):
+        if w >= width:
+            continue
+        h = max(1, int(round(height * float(w) / width)))
+        small = img.resize((w, h), Image.LANCZOS)
+        _save(small, os.path.join(tmpdir, '{}w{}'.format(w, ext)), fmt,
+              quality)
+        _save(small, os.path.join(tmpdir, '{}w.webp'.format(w)), 'WEBP',
+              quality)
+        meta['widths'].append(w)
+
+    with open(os.path.join(tmpdir, 'meta.json'), 'w') as f:
+        json.dump(meta, f)
+
+    try:
+        os.rename(tmpdir, cachedir)
+    except OSError:
+        # another build filled the same cache entry first
+        shutil.rmtree(tmpdir)
+    return meta
+
+
+def _settings_digest(config):
+    settings = json.dumps([
+        ENCODER_VERSION, sorted(config.optimize_images_widths),
+        config.optimize_images_quality
+    ])
+    return hashlib.sha1(settings.encode('utf-8')).hexdigest()
+
+
+def _read_meta(cachedir):
+    try:
+        with open(os.path.join(cachedir, 'meta.json')) as f:
+            return json.load(f)
+    except (IOError, OSError, ValueError):
+        return None
+
+
+def encode_images(app, env):
+    """
+    Look up or encode the variants of every image in the environment.
+    """
+    app.optimized_images = {}
+    config = app.config
+    if not config.optimize_images or app.builder.format != 'html':
+        return
+    try:
+        import PIL  # noqa
+    except ImportError:
+        logger.warning('Pillow is not installed, images are not optimized')
+        return
+
+    cache = os.path.join(app.srcdir, config.optimize_images_cache)
+    settings = _settings_digest(config)
+    manifest = load_manifest(os.path.join(app.outdir, '_images'))
+    contentdir = os.path.join(app.srcdir, config.hashed_images_contentdir)
+
+    todo = []
+    for key in sorted(env.images):
+        ext = os.path.splitext(key)[1].lower()
+        path = os.path.join(app.srcdir, key)
+        if ext not in OPTIMIZED_FORMATS or not os.path.isfile(path):
+            continue
+
+        rel = os.path.relpath(path, contentdir).replace(os.path.sep, '/')
+        digest = hashlib.sha1(
+            (cached_hash(path, manifest.get(rel)) + settings).encode('utf-8')
+        ).hexdigest()
+        cachedir = os.path.join(cache, digest[:2], digest)
+
+        meta = _read_meta(cachedir)
+        if meta is None:
+            todo.append((key, path, cachedir))
+        else:
+            app.optimized_images[key] = (meta, cachedir)
+
+    if not todo:
+        return
+
+    logger.info('optimizing {} images'.format(len(todo)))
+    args = (config.optimize_images_widths, config.optimize_images_quality)
+    with ProcessPoolExecutor(max_workers=config.optimize_images_jobs) as pool:
+        futures = [
+            (key, cachedir, pool.submit(encode_image, path, cachedir, *args))
+            for key, path, cachedir in todo
+        ]
+        for key, cachedir, future in futures:
+            try:
+                meta = future.result()
+            except Exception as err:
+                logger.warning(
+                    'could not optimize {}: {}'.format(key, err)
+                )
+                continue
+            app.optimized_images[key] = (meta, cachedir)
+
+
+def optimized_name(key, meta):
+    """
+    content-addressed name of the recompressed image of key (None if the
+    recompression did not make it smaller)
+    """
+    if not meta['optimized']:
+        return None
+    return hashed_name(key, meta['optimized'])
+
+
+def _copy_if_changed(src, dst):
+    """
+    Copy src to dst unless dst is already a copy of it (same size and
+    mtime, copies keep the mtime of their source)
+    """
+    st = os.stat(src)
+    if os.path.exists(dst):
+        existing = os.stat(dst)
+        if (
+            existing.st_size == st.st_size and
+            existing.st_mtime_ns == st.st_mtime_ns
+        ):
+            return
+    tmp = dst + '.tmp'
+    shutil.copy2(src, tmp)
+    # replace rather than overwrite: the output may be a hardlink
+    os.replace(tmp, dst)
+
+
+def load_written(imagedir):
+    try:
+        with open(os.path.join(imagedir, VARIANTS_MANIFEST)) as f:
+            return set(json.load(f))
+    except (IOError, OSError, ValueError):
+        return set()
+
+
+def save_written(imagedir, names):
+    path = os.path.join(imagedir, VARIANTS_MANIFEST)
+    with open(path + '.tmp', 'w') as f:
+        json.dump(sorted(names), f, indent=1)
+    os.replace(path + '.tmp', path)
+
+
+def write_variants(app, exception):
+    if (
+        exception is not None or app.builder.format != 'html' or
+        getattr(app, 'optimized_images', None) is None
+    ):
+        return
+
+    imagedir = os.path.join(app.outdir, app.builder.imagedir)
+    written = set()
+
+    def write(src, name):
+        _copy_if_changed(src, os.path.join(imagedir, name))
+        written.add(name)
+
+    for key, (meta, cachedir) in app.optimized_images.items():
+        if key not in app.env.images:
+            continue
+        name = app.env.images[key][1]
+        if not os.path.exists(os.path.join(imagedir, name)):
+            continue
+        ext = os.path.splitext(key)[1].lower()
+
+        # the image Sphinx copied stays as it is: its name is the hash of
+        # its content (see copyImages and hashedImages)
+        if meta['optimized']:
+            write(os.path.join(cachedir, 'optimized' + ext),
+                  optimized_name(key, meta))
+        write(os.path.join(cachedir, 'full.webp'),
+              variant_name(name, ext='.webp'))
+        for w in meta['widths']:
+            write(os.path.join(cachedir, '{}w{}'.format(w, ext)),
+                  variant_name(name, w))
+            write(os.path.join(cachedir, '{}w.webp'.format(w)),
+                  variant_name(name, w, '.webp'))
+
+    # remove the variants of images that were removed, renamed or changed
+    images = set(name for _, name in app.env.images.values())
+    for name in sorted(load_written(imagedir) - written - images):
+        path = os.path.join(imagedir, name)
+        if os.path.lexists(path):
+            os.remove(path)
+    save_written(imagedir, written)
+
+
+class PictureTranslatorMixin(object):
+    """
+    Emit ``<picture>`` elements with WebP and downscaled ``srcset`` entries
+    around images that have optimized variants.
+    """
+
+    def _srcset(self, name, meta, full=None, ext=None):
+        uri = '/'.join([self.builder.imgpath, name])
+        entries = [
+            '{} {}w'.format(variant_name(uri, w, ext), w)
+            for w in meta['widths']
+        ]
+        if full is None:
+            full = variant_name(uri, ext=ext)
+        else:
+            full = '/'.join([self.builder.imgpath, full])
+        entries.append('{} {}w'.format(full, meta['width']))
+        return ', '.join(entries)
+
+    def visit_image(self, node):
+        optimized = getattr(self.builder.app, 'optimized_images', {})
+        if not hasattr(self, 'open_pictures'):
+            self.open_pictures = []
+        uri = node['uri']
+        if uri not in optimized or uri not in self.builder.images:
+            self.open_pictures.append(False)
+            return super(PictureTranslatorMixin, self).visit_image(node)
+
+        meta, _ = optimized[uri]
+        name = self.builder.images[uri]
+        sizes = '(max-width: {0}px) 100vw, {0}px'.format(meta['width'])
+
+        self.body.append('<picture>')
+        self.body.append(
+            '<source type="image/webp" srcset="{}" sizes="{}" />'.format(
+                self._srcset(name, meta, ext='.webp'), sizes)
+        )
+        full = optimized_name(uri, meta)
+        if meta['widths'] or full is not None:
+            self.body.append(
+                '<source srcset="{}" sizes="{}" />'.format(
+                    self._srcset(name, meta, full), sizes)
+            )
+        self.open_pictures.append(True)
+        return super(PictureTranslatorMixin, self).visit_image(node)
+
+    def depart_image(self, node):
+        super(PictureTranslatorMixin, self).depart_image(node)
+        if self.open_pictures.pop():
+            self.body.append('</picture>')
+
+
+def install_translator(app):
+    if not app.config.optimize_images or app.builder.format != 'html':
+        return
+    base = app.builder.get_translator_class()
+    translator = type(
+        'Picture' + base.__name__, (PictureTranslatorMixin, base), {}
+    )
+    app.set_translator(app.builder.name, translator, override=True)
+
+
+def setup(app):
+    # variants are named after the hashed image names
+    app.setup_extension('hashedImages')
+    app.add_config_value('optimize_images', True, 'html')
+    app.add_config_value('optimize_images_widths', [480, 960, 1440], 'html')
+    app.add_config_value('optimize_images_quality', 85, 'html')
+    app.add_config_value('optimize_images_jobs', None, '')
+    app.add_config_value(
+        'optimize_images_cache', os.path.join('_build', '.imagecache'), ''
+    )
+    app.connect('builder-inited', install_translator)
+    app.connect('env-updated', encode_images)
+    app.connect('build-finished', write_variants)
+    return {'parallel_read_safe': True, 'parallel_write_safe': True}
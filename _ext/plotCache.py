@@ -0,0 +1,437 @@
+"""
+Persistent cache for the outputs of the matplotlib ``.. plot::`` directive.
+
+The plot directive only skips a figure when its output file is newer than
+the source document, so every clean build (and every CI runner) re-runs all
+of the plot code. This wraps ``plot_directive.render_figures`` with a cache
+keyed by
+
+- the plot code and the function name,
+- the content of the files next to the code in the directory it runs in
+  (data files and scripts; the documents themselves excepted),
+- the installed versions of the packages in ``plot_cache_packages``
+  (em_examples, SimPEG, numpy and matplotlib by default),
+- the rcParams the code runs with, the output formats and the other
+  ``plot_*`` settings that change what runs (pre code, base and working
+  directories).
+
+The rendered png/hires.png/pdf files are stored in ``plot_cache_dir``
+(``_build/.plotcache`` by default, which CI can keep between runs) and are
+copied into place under the output names the directive expects on a hit.
+Plots using ``:context:`` depend on the blocks before them and are always
+rendered.
+
+Before the documents are read, the plot blocks of every document that is
+about to be read are found and the ones missing from the cache are
+rendered ahead of time on a process pool (each worker with its own ``Agg``
+matplotlib state). The directive then only collects the results from the
+cache, so the plotting scales with the number of cores. Workers get all
+they need as arguments, so they do not depend on the start method (fork or
+spawn).
+"""
+
+import hashlib
+import importlib
+import io
+import json
+import os
+import re
+import shutil
+import tempfile
+import textwrap
+from concurrent.futures import ProcessPoolExecutor
+from types import SimpleNamespace
+
+from docutils.parsers.rst import directives
+from matplotlib.sphinxext import plot_directive
+from sphinx.util import logging
+
+logger = logging.getLogger(__name__)
+
+CACHE_VERSION = 2
+
+DEFAULT_PACKAGES = ['em_examples', 'SimPEG', 'numpy', 'matplotlib']
+
+# settings of the plot directive passed on to render_figures (the ones
+# missing from the installed matplotlib are left out)
+PLOT_CONFIG = [
+    'plot_include_source', 'plot_pre_code', 'plot_basedir', 'plot_formats',
+    'plot_rcparams', 'plot_apply_rcparams', 'plot_working_directory',
+    'plot_template', 'plot_html_show_formats', 'plot_html_show_source_link',
+    'plot_srcset',
+]
+
+
+def package_version(name):
+    try:
+        import pkg_resources
+        return pkg_resources.get_distribution(name).version
+    except Exception:
+        pass
+    try:
+        module = importlib.import_module(name)
+    except ImportError:
+        return None
+    return getattr(module, '__version__', None)
+
+
+def environment_digest(config):
+    """
+    Hash of everything outside of the plot code that changes the figures:
+    package versions, rcParams, output formats and the plot_* settings.
+    """
+    import matplotlib
+
+    state = [
+        CACHE_VERSION,
+        [(name, package_version(name)) for name in config.plot_cache_packages],
+        # (the backend is Agg when rendering, and its default is a sentinel
+        # object whose repr changes from run to run)
+        sorted(
+            (k, repr(v)) for k, v in matplotlib.rcParamsOrig.items()
+            if k != 'backend'
+        ),
+        sorted((k, repr(v)) for k, v in config.plot_rcparams.items()),
+        repr(config.plot_formats),
+        repr(config.plot_pre_code),
+        repr(config.plot_basedir),
+        repr(config.plot_working_directory),
+        repr(config.plot_include_source),
+    ]
+    return hashlib.sha1(json.dumps(state).encode('utf-8')).hexdigest()
+
+
+# (path, size, mtime_ns) -> sha1 of the files hashed by this process
+_file_hashes = {}
+
+
+def _file_hash(path, st):
+    key = (path, st.st_size, st.st_mtime_ns)
+    if key not in _file_hashes:
+        sha = hashlib.sha1()
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                sha.update(block)
+        _file_hashes[key] = sha.hexdigest()
+    return _file_hashes[key]
+
+
+def inputs_digest(code_path, config):
+    """
+    Hash of the files the plot code can read: the files of the directory it
+    runs in (plot_working_directory, or the directory of code_path), the
+    reST documents excepted as their code is hashed by itself. Hashed by
+    content, so that fresh checkouts still hit the cache.
+    """
+    directory = config.plot_working_directory or os.path.dirname(
+        os.path.abspath(code_path)
+    )
+    files = []
+    try:
+        names = sorted(os.listdir(directory))
+    except OSError:
+        names = []
+    for name in names:
+        path = os.path.join(directory, name)
+        if name.endswith('.rst') or name.startswith('.'):
+            continue
+        try:
+            st = os.stat(path)
+        except OSError:
+            continue
+        if os.path.isfile(path):
+            files.append([name, _file_hash(path, st)])
+    return hashlib.sha1(json.dumps(files).encode('utf-8')).hexdigest()
+
+
+def plot_key(code, function_name, envdigest, inputs):
+    return hashlib.sha1(
+        json.dumps([code, function_name, envdigest, inputs]).encode('utf-8')
+    ).hexdigest()
+
+
+class PlotCache(object):
+    """
+    Rendered plot-directive outputs stored by key. Each entry holds the
+    image files and a results.json describing the
+    ``[(code_piece, [image, ...]), ...]`` list returned by render_figures.
+    """
+
+    def __init__(self, cachedir):
+        self.cachedir = cachedir
+
+    def path(self, key):
+        return os.path.join(self.cachedir, key[:2], key)
+
+    def load(self, key, output_dir, output_base):
+        entry = self.path(key)
+        try:
+            with open(os.path.join(entry, 'results.json')) as f:
+                stored = json.load(f)
+        except (IOError, OSError, ValueError):
+            return None
+
+        if not os.path.isdir(output_dir):
+            os.makedirs(output_dir)
+
+        results = []
+        for code_piece, images in stored:
+            imgs = []
+            for suffix, formats in images:
+                img = plot_directive.ImageFile(output_base + suffix, output_dir)
+                for fmt in formats:
+                    shutil.copyfile(
+                        os.path.join(entry, 'img{}.{}'.format(suffix, fmt)),
+                        img.filename(fmt)
+                    )
+                    img.formats.append(fmt)
+                imgs.append(img)
+            results.append((code_piece, imgs))
+        return results
+
+    def store(self, key, output_base, results):
+        entry = self.path(key)
+        tmp = '{}.{}.tmp'.format(entry, os.getpid())
+        if os.path.isdir(tmp):
+            shutil.rmtree(tmp)
+        os.makedirs(tmp)
+
+        stored = []
+        for code_piece, images in results:
+            imgs = []
+            for img in images:
+                suffix = img.basename[len(output_base):]
+                for fmt in img.formats:
+                    shutil.copyfile(
+                        img.filename(fmt),
+                        os.path.join(tmp, 'img{}.{}'.format(suffix, fmt))
+                    )
+                imgs.append([suffix, list(img.formats)])
+            stored.append([code_piece, imgs])
+
+        with open(os.path.join(tmp, 'results.json'), 'w') as f:
+            json.dump(stored, f)
+
+        if os.path.isdir(entry):
+            shutil.rmtree(entry)
+        try:
+            os.rename(tmp, entry)
+        except OSError:
+            shutil.rmtree(tmp)
+
+
+def cached_render_figures(render_figures, cache, envdigest):
+    """
+    Wrap render_figures so that outputs are looked up in and added to cache.
+    """
+
+    def render(code, code_path, output_dir, output_base, context,
+               function_name, config, *args, **kwargs):
+        if context:
+            return render_figures(
+                code, code_path, output_dir, output_base, context,
+                function_name, config, *args, **kwargs
+            )
+
+        key = plot_key(
+            code, function_name, envdigest, inputs_digest(code_path, config)
+        )
+        results = cache.load(key, output_dir, output_base)
+        if results is not None:
+            return results
+
+        results = render_figures(
+            code, code_path, output_dir, output_base, context,
+            function_name, config, *args, **kwargs
+        )
+        cache.store(key, output_base, results)
+        return results
+
+    render.uncached = render_figures
+    return render
+
+
+def install_cache(app):
+    config = app.config
+    render_figures = plot_directive.render_figures
+    render_figures = getattr(render_figures, 'uncached', render_figures)
+
+    if not config.plot_cache:
+        plot_directive.render_figures = render_figures
+        return
+
+    cache = PlotCache(os.path.join(app.srcdir, config.plot_cache_dir))
+    envdigest = environment_digest(config)
+    app.plot_cache = cache
+    app.plot_cache_digest = envdigest
+    plot_directive.render_figures = cached_render_figures(
+        render_figures, cache, envdigest
+    )
+
+
+PLOT_RE = re.compile(r'^(\s*)\.\. plot::(.*)$')
+OPTION_RE = re.compile(r'^:([\w-]+):(.*)$')
+
+
+def _indent(line):
+    return len(line) - len(line.lstrip())
+
+
+def find_plots(text):
+    """
+    Yield (arguments, options, content) for every ``.. plot::`` directive
+    in the reST source text, with the content lines as docutils passes them
+    to the directive.
+    """
+    lines = [line.expandtabs(8).rstrip() for line in text.splitlines()]
+    i = 0
+    while i < len(lines):
+        match = PLOT_RE.match(lines[i])
+        i += 1
+        if match is None:
+            continue
+
+        indent = len(match.group(1))
+        block = []
+        while i < len(lines) and (
+            not lines[i] or _indent(lines[i]) > indent
+        ):
+            block.append(lines[i].strip() and lines[i])
+            i += 1
+        while block and not block[-1]:
+            block.pop()
+
+        options = {}
+        while block and OPTION_RE.match(block[0].strip()):
+            name, value = OPTION_RE.match(block[0].strip()).groups()
+            options[name] = value.strip()
+            block.pop(0)
+        while block and not block[0]:
+            block.pop(0)
+
+        yield match.group(2).split(), options, block
+
+
+def plot_code(app, docname, arguments, content):
+    """
+    (code, code_path, function_name) the plot directive will run for a
+    block, mirroring plot_directive.run
+    """
+    config = app.config
+    rst_file = app.env.doc2path(docname)
+
+    if not arguments:
+        code = textwrap.dedent('\n'.join(content))
+        return code, rst_file, None
+
+    if config.plot_basedir:
+        source_file_name = os.path.join(
+            app.srcdir, config.plot_basedir, directives.uri(arguments[0])
+        )
+    else:
+        source_file_name = os.path.join(
+            os.path.dirname(rst_file), directives.uri(arguments[0])
+        )
+    with io.open(source_file_name, 'r', encoding='utf-8') as fd:
+        code = fd.read()
+    function_name = arguments[1] if len(arguments) == 2 else None
+    return code, source_file_name, function_name
+
+
+def _prerender(code, code_path, function_name, config, cachedir,
+               envdigest):
+    """
+    Render one plot block into the cache in cachedir. Runs in a worker
+    process.
+    """
+    import matplotlib
+    matplotlib.use('Agg')
+    plot_directive.setup.config = config
+
+    render_figures = plot_directive.render_figures
+    render = cached_render_figures(
+        getattr(render_figures, 'uncached', render_figures),
+        PlotCache(cachedir), envdigest
+    )
+    output_dir = tempfile.mkdtemp()
+    try:
+        render(
+            code, code_path, output_dir, 'prerender', False, function_name,
+            config
+        )
+    finally:
+        shutil.rmtree(output_dir)
+
+
+def prerender_plots(app, env, docnames):
+    config = app.config
+    if not (config.plot_cache and config.plot_prerender):
+        return
+    cache = getattr(app, 'plot_cache', None)
+    if cache is None:
+        return
+
+    todo = {}
+    for docname in docnames:
+        with io.open(env.doc2path(docname), encoding='utf-8') as f:
+            text = f.read()
+        for arguments, options, content in find_plots(text):
+            if 'context' in options:
+                continue
+            try:
+                code, code_path, function_name = plot_code(
+                    app, docname, arguments, content
+                )
+            except (IOError, OSError):
+                # the directive reports missing files
+                continue
+            key = plot_key(
+                code, function_name, app.plot_cache_digest,
+                inputs_digest(code_path, config)
+            )
+            if not os.path.exists(
+                os.path.join(cache.path(key), 'results.json')
+            ):
+                todo[key] = (docname, code, code_path, function_name)
+
+    if not todo:
+        return
+
+    # plain picklable copy of the settings used by render_figures
+    plot_config = SimpleNamespace(**dict(
+        (name, getattr(config, name)) for name in PLOT_CONFIG
+        if name in config
+    ))
+
+    logger.info('pre-rendering {} plots'.format(len(todo)))
+    with ProcessPoolExecutor(max_workers=config.plot_prerender_jobs) as pool:
+        futures = [
+            (docname, pool.submit(
+                _prerender, code, code_path, function_name, plot_config,
+                cache.cachedir, app.plot_cache_digest
+            ))
+            for docname, code, code_path, function_name in todo.values()
+        ]
+        for docname, future in futures:
+            try:
+                future.result()
+            except Exception as err:
+                # left to the directive, which reports the error in place
+                logger.info(
+                    'could not pre-render a plot in {}: {}'.format(
+                        docname, err)
+                )
+
+
+def setup(app):
+    app.setup_extension('matplotlib.sphinxext.plot_directive')
+    app.add_config_value('plot_cache', True, '')
+    app.add_config_value(
+        'plot_cache_dir', os.path.join('_build', '.plotcache'), ''
+    )
+    app.add_config_value('plot_cache_packages', DEFAULT_PACKAGES, '')
+    app.add_config_value('plot_prerender', True, '')
+    app.add_config_value('plot_prerender_jobs', None, '')
+    app.connect('builder-inited', install_cache)
+    app.connect('env-before-read-docs', prerender_plots)
+    return {'parallel_read_safe': True, 'parallel_write_safe': True}
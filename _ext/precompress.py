@@ -0,0 +1,149 @@
+"""
+Sphinx extension writing pre-compressed copies of the text files of the
+html output.
+
+When the html build finishes, every page, script, stylesheet and other text
+file (``precompress_extensions``) larger than ``precompress_min_size`` gets
+a gzip (``.gz``) sibling and, when the ``brotli`` package is installed, a
+brotli (``.br``) sibling, so that a server can send them as they are to the
+clients accepting these encodings instead of compressing the (multi-MB
+animation) pages on every request. Files are compressed on a thread pool
+(zlib and brotli release the GIL) and only when they changed since their
+compressed copies were written; copies whose file disappeared are removed.
+
+The copies are only used locally: ``serve.py`` serves the output with them
+(``make serve``, which turns ``precompress`` on). App Engine compresses its
+static files itself, so the deployed build does not write them (and would
+not upload them, see skip_files in app.yaml). Builds with ``precompress``
+off remove the copies of earlier builds, which would be out of date.
+"""
+
+import gzip
+import io
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from sphinx.util import logging
+
+logger = logging.getLogger(__name__)
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+EXTENSIONS = [
+    '.html', '.js', '.css', '.svg', '.json', '.txt', '.xml', '.map', '.py'
+]
+
+ENCODINGS = ['.gz', '.br']
+
+
+def _is_current(src, dst):
+    return (
+        os.path.exists(dst) and
+        os.stat(dst).st_mtime_ns >= os.stat(src).st_mtime_ns
+    )
+
+
+def _write(dst, data):
+    with io.open(dst + '.tmp', 'wb') as f:
+        f.write(data)
+    os.replace(dst + '.tmp', dst)
+
+
+def compress_file(path):
+    """
+    Write the compressed siblings of path that are missing or outdated.
+    Returns the number of files written.
+    """
+    written = 0
+    data = None
+
+    if not _is_current(path, path + '.gz'):
+        with io.open(path, 'rb') as f:
+            data = f.read()
+        buf = io.BytesIO()
+        # mtime=0: the same file always compresses to the same bytes
+        with gzip.GzipFile(
+            filename='', mode='wb', fileobj=buf, compresslevel=9, mtime=0
+        ) as gz:
+            gz.write(data)
+        _write(path + '.gz', buf.getvalue())
+        written += 1
+
+    if brotli is not None and not _is_current(path, path + '.br'):
+        if data is None:
+            with io.open(path, 'rb') as f:
+                data = f.read()
+        _write(path + '.br', brotli.compress(data, quality=11))
+        written += 1
+
+    return written
+
+
+def find_files(outdir, extensions, min_size):
+    """
+    (files to compress, compressed copies of files that are gone or no
+    longer compressed)
+    """
+    files = []
+    compressed = []
+    for root, dirList, fileList in os.walk(outdir):
+        dirList.sort()
+        for filename in sorted(fileList):
+            path = os.path.join(root, filename)
+            base, ext = os.path.splitext(path)
+            if ext in ENCODINGS:
+                # leave alone e.g. downloadable .gz archives
+                if os.path.splitext(base)[1].lower() in extensions:
+                    compressed.append(path)
+            elif (
+                ext.lower() in extensions and
+                os.path.getsize(path) >= min_size
+            ):
+                files.append(path)
+    keep = set(files)
+    orphans = [
+        path for path in compressed if os.path.splitext(path)[0] not in keep
+    ]
+    return files, orphans
+
+
+def precompress(app, exception):
+    if exception is not None or app.builder.format != 'html':
+        return
+    config = app.config
+
+    files, orphans = find_files(
+        app.outdir, config.precompress_extensions,
+        config.precompress_min_size
+    )
+    if not config.precompress:
+        orphans.extend(
+            path + encoding for path in files for encoding in ENCODINGS
+            if os.path.exists(path + encoding)
+        )
+        files = []
+    for path in orphans:
+        os.remove(path)
+    if not files:
+        return
+
+    with ThreadPoolExecutor(max_workers=config.precompress_jobs) as pool:
+        written = sum(pool.map(compress_file, files))
+
+    logger.info('wrote {} compressed files{}'.format(
+        written, '' if brotli is not None else ' (brotli is not installed)'
+    ))
+
+
+def setup(app):
+    # compress the pages once their references are fingerprinted
+    app.setup_extension('fingerprint')
+    app.add_config_value('precompress', False, '')
+    app.add_config_value('precompress_extensions', EXTENSIONS, '')
+    app.add_config_value('precompress_min_size', 1024, '')
+    app.add_config_value('precompress_jobs', None, '')
+    app.connect('build-finished', precompress)
+    return {'parallel_read_safe': True, 'parallel_write_safe': True}
@@ -0,0 +1,84 @@
+"""
+Sphinx extension writing the page manifest used by emgeosci.py.
+
+When the html build finishes, every page in the output tree is listed in
+``_redirects.json``, together with
+
+- the moved pages, listed in the ``redirects`` config value as
+  ``{'old/page.html': 'new/page.html'}``,
+- the prefixes of the paths of the old Read the Docs site
+  (``redirects_legacy_prefixes``, ``en/latest`` by default).
+
+The app resolves a requested path against this manifest (see routing.py),
+so directory paths, legacy paths and moved pages are redirected to their
+page in a single hop and any path that does not lead to a page is not
+found.
+"""
+
+import io
+import json
+import os
+
+from sphinx.util import logging
+
+logger = logging.getLogger(__name__)
+
+REDIRECTS_FILE = '_redirects.json'
+REDIRECTS_VERSION = 2
+
+
+def find_pages(outdir):
+    """
+    Paths (relative to outdir, with '/' separators) of the html pages
+    """
+    for root, dirList, fileList in os.walk(outdir):
+        dirList.sort()
+        for filename in sorted(fileList):
+            if filename.endswith('.html'):
+                path = os.path.relpath(os.path.join(root, filename), outdir)
+                yield path.replace(os.path.sep, '/')
+
+
+def moved_pages(pages, moved):
+    """
+    {path: target} of the moved pages whose target exists. Paths and
+    targets are absolute ('/content/foo/index.html').
+    """
+    pages = set(pages)
+    table = {}
+    for old, new in sorted((moved or {}).items()):
+        if new not in pages:
+            logger.warning(
+                'redirect from {} to missing page {}'.format(old, new))
+            continue
+        table['/' + old.lstrip('/')] = '/' + new
+    return table
+
+
+def write_redirects(app, exception):
+    if exception is not None or app.builder.format != 'html':
+        return
+
+    pages = list(find_pages(app.outdir))
+    manifest = {
+        'version': REDIRECTS_VERSION,
+        'pages': ['/' + page for page in pages],
+        'redirects': moved_pages(pages, app.config.redirects),
+        'legacy_prefixes': list(app.config.redirects_legacy_prefixes),
+    }
+
+    path = os.path.join(app.outdir, REDIRECTS_FILE)
+    tmp = path + '.tmp'
+    with io.open(tmp, 'w', encoding='utf-8') as f:
+        f.write(json.dumps(
+            manifest, indent=0, sort_keys=True, ensure_ascii=False
+        ))
+    os.replace(tmp, path)
+    logger.info('wrote {} pages to {}'.format(len(pages), REDIRECTS_FILE))
+
+
+def setup(app):
+    app.add_config_value('redirects', {}, 'html')
+    app.add_config_value('redirects_legacy_prefixes', ['en/latest'], 'html')
+    app.connect('build-finished', write_redirects)
+    return {'parallel_read_safe': True, 'parallel_write_safe': True}
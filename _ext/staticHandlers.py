@@ -0,0 +1,173 @@
+"""
+Sphinx extension generating the static handlers of app.yaml from the html
+output, so that directory pages are served without starting the app.
+
+When the html build finishes, the block between the ``BEGIN`` and ``END``
+markers of the file ``static_handlers_app_yaml`` is replaced with
+
+- a handler sending the moved pages (the ``redirects`` config value) to the
+  app, ahead of the static html handler that would not find them,
+- handlers serving ``/<directory>/`` as the static file
+  ``/<directory>/index.html`` for every directory of the output that has an
+  ``index.html``.
+
+The directories are listed explicitly rather than matched by ``/(.+)/`` so
+that any other path still reaches the app (which redirects legacy paths and
+renders the error page). Paths without their trailing slash are left to the
+app, which redirects them, as serving the page there would break its
+relative links.
+
+``static_handlers_app_yaml`` is not set by default, so that building the
+html leaves the tracked app.yaml alone: ``make appyaml`` sets it to
+``app.yaml`` when deploying.
+
+A ``_redirects`` file (``/from /to 301`` lines) with the legacy prefixes
+and moved pages is also written to the output for static hosts that read
+one.
+"""
+
+import io
+import os
+import re
+
+from sphinx.util import logging
+
+from redirects import find_pages, moved_pages
+
+logger = logging.getLogger(__name__)
+
+BEGIN = '# BEGIN static handlers'
+END = '# END static handlers'
+
+# keep each url regex of the generated handlers reasonably short
+MAX_PATTERN_LENGTH = 1000
+
+INDEX = 'index.html'
+
+
+def _chunks(names, size=MAX_PATTERN_LENGTH):
+    chunk = []
+    length = 0
+    for name in names:
+        if chunk and length + len(name) + 1 > size:
+            yield chunk
+            chunk = []
+            length = 0
+        chunk.append(name)
+        length += len(name) + 1
+    if chunk:
+        yield chunk
+
+
+def index_directories(pages):
+    """
+    Directories (relative, with '/' separators) with an index page
+    """
+    return sorted(
+        page[:-len(INDEX) - 1] for page in pages
+        if page.endswith('/' + INDEX)
+    )
+
+
+def static_handlers(pages, moved):
+    """
+    The app.yaml handlers, as text, for the pages and moved pages
+    """
+    handlers = []
+
+    if moved:
+        handlers.append(
+            '# moved pages\n'
+            '- url: ({})\n'
+            '  script: emgeosci.app\n'
+            '  secure: always\n'.format(
+                '|'.join(re.escape(path) for path in sorted(moved))
+            )
+        )
+
+    patterns = [re.escape(d) for d in index_directories(pages)]
+    for chunk in _chunks(patterns):
+        alternation = '|'.join(chunk)
+        handlers.append(
+            '# directory index pages\n'
+            '- url: /({0})/\n'
+            '  static_files: _build/html/\\1/index.html\n'
+            '  upload: _build/html/({0})/index\\.html\n'
+            '  secure: always\n'.format(alternation)
+        )
+
+    return '\n'.join(handlers)
+
+
+def replace_block(text, block, begin=BEGIN, end=END):
+    """
+    text with the lines between the begin and end markers replaced by
+    block, or None when the markers are missing
+    """
+    start = text.find(begin)
+    stop = text.find(end)
+    if start < 0 or stop < start:
+        return None
+    start = text.index('\n', start) + 1
+    return text[:start] + block + ('\n' if block else '') + text[stop:]
+
+
+def write_block(path, block, begin=BEGIN, end=END):
+    """
+    Replace the block between the begin and end markers of the file path
+    (e.g. app.yaml), leaving the file untouched when nothing changed
+    """
+    with io.open(path, encoding='utf-8') as f:
+        text = f.read()
+    updated = replace_block(text, block, begin, end)
+    if updated is None:
+        logger.warning(
+            '{} has no "{}" ... "{}" block, handlers not written'
+            .format(path, begin, end)
+        )
+        return
+    if updated == text:
+        return
+    tmp = path + '.tmp'
+    with io.open(tmp, 'w', encoding='utf-8') as f:
+        f.write(updated)
+    os.replace(tmp, path)
+    logger.info('updated {} in {}'.format(begin.lstrip('# '), path))
+
+
+def redirects_file(moved, legacy_prefixes):
+    lines = [
+        '/{}/*  /:splat  301'.format(prefix.strip('/'))
+        for prefix in legacy_prefixes
+    ]
+    lines.extend(
+        '{}  {}  301'.format(old, new) for old, new in sorted(moved.items())
+    )
+    return '\n'.join(lines) + '\n'
+
+
+def write_static_handlers(app, exception):
+    if exception is not None or app.builder.format != 'html':
+        return
+
+    config = app.config
+    pages = list(find_pages(app.outdir))
+    moved = moved_pages(pages, config.redirects)
+
+    if config.static_handlers_app_yaml:
+        write_block(
+            os.path.join(app.confdir, config.static_handlers_app_yaml),
+            static_handlers(pages, moved)
+        )
+
+    with io.open(
+        os.path.join(app.outdir, '_redirects'), 'w', encoding='utf-8'
+    ) as f:
+        f.write(redirects_file(moved, config.redirects_legacy_prefixes))
+
+
+def setup(app):
+    app.setup_extension('redirects')
+    app.add_config_value('static_handlers_app_yaml', None, '')
+    app.connect('build-finished', write_static_handlers)
+    return {'parallel_read_safe': True, 'parallel_write_safe': True}
@@ -0,0 +1,152 @@
+/*
+ * Player for the frame sequences of the animation directive
+ * (_ext/animation.py).
+ *
+ * The first frame is in the page as a plain image; playback starts once it
+ * has loaded. Each frame is fetched just before it is shown and the player
+ * waits for a frame that is still loading, so nothing is downloaded ahead
+ * of time and players that are off screen do not play.
+ */
+(function () {
+  'use strict';
+
+  function Player(element) {
+    this.element = element;
+    this.frames = JSON.parse(element.getAttribute('data-frames'));
+    this.delay = 1000 / (parseFloat(element.getAttribute('data-fps')) || 5);
+    this.loop = element.getAttribute('data-loop') !== 'false';
+    this.image = element.querySelector('.animation-frame');
+    this.slider = element.querySelector('input[type=range]');
+    this.playButton = element.querySelector('[data-action=play]');
+    this.loaded = {};
+    this.index = 0;
+    this.timer = null;
+    this.playing = false;
+    this.visible = true;
+
+    var self = this;
+    element.querySelector('[data-action=previous]').addEventListener(
+      'click', function () { self.pause(); self.step(-1); });
+    element.querySelector('[data-action=next]').addEventListener(
+      'click', function () { self.pause(); self.step(1); });
+    this.playButton.addEventListener('click', function () {
+      if (self.playing) { self.pause(); } else { self.play(); }
+    });
+    this.slider.addEventListener('input', function () {
+      self.pause();
+      self.show(parseInt(self.slider.value, 10));
+    });
+
+    if ('IntersectionObserver' in window) {
+      new IntersectionObserver(function (entries) {
+        self.visible = entries[0].isIntersecting;
+        if (self.visible && self.playing && self.timer === null) {
+          self.schedule();
+        }
+      }).observe(element);
+    }
+
+    if (this.image.complete) {
+      this.loaded[0] = true;
+      this.play();
+    } else {
+      this.image.addEventListener('load', function () {
+        self.loaded[0] = true;
+        self.play();
+      });
+    }
+  }
+
+  Player.prototype.load = function (index, callback) {
+    var self = this;
+    if (this.loaded[index] === true) {
+      callback();
+      return;
+    }
+    if (this.loaded[index]) {
+      // already loading
+      this.loaded[index].push(callback);
+      return;
+    }
+    var callbacks = [callback];
+    this.loaded[index] = callbacks;
+    var image = new Image();
+    image.onload = image.onerror = function () {
+      self.loaded[index] = true;
+      callbacks.forEach(function (f) { f(); });
+    };
+    image.src = this.frames[index];
+  };
+
+  Player.prototype.show = function (index) {
+    this.index = index;
+    this.image.src = this.frames[index];
+    this.slider.value = index;
+  };
+
+  Player.prototype.step = function (direction) {
+    var n = this.frames.length;
+    var index = (this.index + direction + n) % n;
+    var self = this;
+    this.load(index, function () { self.show(index); });
+  };
+
+  Player.prototype.schedule = function () {
+    var self = this;
+    this.timer = setTimeout(function () { self.tick(); }, this.delay);
+  };
+
+  Player.prototype.tick = function () {
+    this.timer = null;
+    if (!this.playing || !this.visible) {
+      return;
+    }
+    var next = this.index + 1;
+    if (next >= this.frames.length) {
+      if (!this.loop) {
+        this.pause();
+        return;
+      }
+      next = 0;
+    }
+    var self = this;
+    this.load(next, function () {
+      if (!self.playing) {
+        return;
+      }
+      self.show(next);
+      self.schedule();
+    });
+  };
+
+  Player.prototype.play = function () {
+    if (this.playing || this.frames.length < 2) {
+      return;
+    }
+    this.playing = true;
+    this.playButton.innerHTML = '&#10074;&#10074;';
+    this.schedule();
+  };
+
+  Player.prototype.pause = function () {
+    this.playing = false;
+    this.playButton.innerHTML = '&#9654;';
+    if (this.timer !== null) {
+      clearTimeout(this.timer);
+      this.timer = null;
+    }
+  };
+
+  function init() {
+    var players = document.querySelectorAll('.animation-player[data-frames]');
+    Array.prototype.forEach.call(players, function (element) {
+      new Player(element);
+    });
+  }
+
+  if (document.readyState === 'loading') {
+    document.addEventListener('DOMContentLoaded', init);
+  } else {
+    init();
+  }
+}());
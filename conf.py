@@ -39,14 +39,25 @@ extensions = [
     'sphinx.ext.intersphinx',
     'sphinx.ext.todo',
     'sphinx.ext.coverage',
-    'sphinx.ext.mathjax',
+    'mathPrerender',
     'sphinx.ext.viewcode',
     'sphinxcontrib.bibtex',
+    'bibCache',
     'matplotlib.sphinxext.plot_directive',
+    'plotCache',
     'edit_on_github',
+    'autodoc',
     'purpose',
     'question',
     'geosciapp',
+    'hashedImages',
+    'optimizeImages',
+    'redirects',
+    'staticHandlers',
+    'fingerprint',
+    'precompress',
+    'animation',
+    'includeMath',
     # 'sphinx_nbexamples'
     # 'sphinx_gallery.gen_gallery',
 ]
@@ -382,6 +393,9 @@ htmlhelp_basename = 'emdoc'
 edit_on_github_project = 'geoscixyz/em'
 edit_on_github_branch = 'master'
 
+# pages that moved, {'old/page.html': 'new/page.html'}, redirected by the app
+redirects = {}
+
 # -- Options for LaTeX output ---------------------------------------------
 
 latex_elements = {
@@ -549,11 +563,11 @@ from _ext import (
     # supress_nonlocal_image_and_citation_not_referenced
 )
 
-make_contributorslist()
+# contributors.rst and case_histories.rst are generated by the autodoc
+# extension when the builder is initialized
 # make_formula_sheet()
-make_case_histories()
 # checkDependencies()
 # supress_nonlocal_image_warn()
 # supress_citation_not_referenced()
 # supress_nonlocal_image_and_citation_not_referenced()
-copyImages()
+copyImages(layout='hashed')
@@ -0,0 +1,169 @@
+"""
+        dcSphereForward.py
+        DC resistivity forward modeling on a 3D tensor mesh, used by
+        EMGeosci_DCR_3DFwr_Sphere_Example.py.
+
+        The operator A = Div*Msig*Grad only depends on the mesh and the
+        conductivity model, so it is factored once (LU) and every source of a
+        survey is then solved in one batch with the same factors:
+
+            engine = DCForward(mesh, model)
+            RHS = source_terms(mesh, Tx, stype, dl_x, dl_y, dl_len)
+            phi = engine.solve(RHS)  # one column per source
+
+        The iterative solver ('BiCGStab') is kept for meshes too large to
+        factor; its Jacobi preconditioner is then built once.
+
+        The fields are shown on a vertical section through the mesh.
+        SectionProjection finds the nearest cell of every section point once
+        (a single KD-tree) and keeps the result as a sparse matrix, so
+        sampling a field on the section is a sparse product:
+
+            section = SectionProjection(mesh.gridCC, xyz2d, mesh2d.vnC)
+            Q_sub = section.project(Q)
+"""
+
+import numpy as np
+import scipy.sparse as sp
+import scipy.sparse.linalg
+from scipy.spatial import cKDTree
+
+from SimPEG import Utils
+
+SOLVERS = ['LU', 'BiCGStab']
+
+
+class DCForward(object):
+    """
+    Potentials, currents and charges of a conductivity model for any number
+    of sources
+    """
+
+    def __init__(self, mesh, model, solver='LU', tol=1e-5):
+        if solver not in SOLVERS:
+            raise ValueError(
+                'solver must be one of {}, not {}'.format(SOLVERS, solver)
+            )
+        self.mesh = mesh
+        self.solver = solver
+        self.tol = tol
+
+        # Set boundary conditions
+        mesh.setCellGradBC('neumann')
+        self.Div = mesh.faceDiv
+        self.Grad = mesh.cellGrad
+        self.Msig = Utils.sdiag(1./(mesh.aveF2CC.T*(1./model)))
+
+        A = self.Div*self.Msig*self.Grad
+
+        # Change one corner to deal with nullspace
+        A[0, 0] = 1
+        self.A = sp.csc_matrix(A)
+
+        if solver == 'LU':
+            # Factor A matrix, once for all the sources
+            self.Ainv = sp.linalg.splu(self.A)
+        else:
+            # Jacobi preconditioner
+            self.P = sp.spdiags(
+                1./self.A.diagonal(), 0, self.A.shape[0], self.A.shape[0]
+            )
+            self.PA = (self.P*self.A).tocsr()
+
+    def solve(self, RHS):
+        """
+        Potentials for the sources in the columns of RHS (nC x nSrc)
+        """
+        RHS = np.asarray(RHS, dtype=float)
+        if RHS.ndim == 1:
+            RHS = RHS[:, None]
+
+        if self.solver == 'LU':
+            # Back substitutions only
+            return self.Ainv.solve(RHS)
+
+        phi = np.empty_like(RHS)
+        for ii in range(RHS.shape[1]):
+            # Iterative Solve
+            x, info = sp.linalg.bicgstab(self.PA, self.P*RHS[:, ii],
+                                         tol=self.tol)
+            if info != 0:
+                raise RuntimeError(
+                    'BiCGStab did not converge for source {} ({})'
+                    .format(ii, info)
+                )
+            phi[:, ii] = x
+        return phi
+
+    def currents(self, phi):
+        """
+        Current density averaged to the cell centers (3*nC x nSrc)
+        """
+        j = -self.Msig*(self.Grad*phi)
+        return self.mesh.aveF2CCV*j
+
+    def charges(self, phi):
+        """
+        Charge density from div*grad*phi (nC x nSrc)
+        """
+        return -self.Div*(self.Grad*phi)
+
+
+class SectionProjection(object):
+    """
+    Nearest-cell projection of cell-centered values onto the points of a
+    section (the values NearestNDInterpolator would give)
+    """
+
+    def __init__(self, gridCC, points, shape):
+        gridCC = np.asarray(gridCC)
+        points = np.asarray(points)
+        self.shape = tuple(shape)
+        if np.prod(self.shape) != points.shape[0]:
+            raise ValueError(
+                'a section of shape {} needs {} points, not {}'.format(
+                    self.shape, np.prod(self.shape), points.shape[0])
+            )
+
+        _, inds = cKDTree(gridCC).query(points)
+        nP = points.shape[0]
+        self.P = sp.csr_matrix(
+            (np.ones(nP), (np.arange(nP), inds)),
+            shape=(nP, gridCC.shape[0])
+        )
+
+    def project(self, values):
+        """
+        values (nC, or nC x n for n fields at once) on the section, as
+        (nz, nx) arrays ready for pcolormesh (a list of them for n fields)
+        """
+        sub = self.P*np.asarray(values)
+        if sub.ndim == 1:
+            return np.reshape(sub, self.shape).T
+        return [
+            np.reshape(sub[:, ii], self.shape).T
+            for ii in range(sub.shape[1])
+        ]
+
+
+def source_terms(mesh, Tx, stype, dl_x, dl_y, dl_len):
+    """
+    Right-hand sides of the sources of Tx, one column per source. The
+    return pole of a pole-dipole survey is placed two line lengths away
+    along the line ("infinity").
+    """
+    RHS = np.zeros((mesh.nC, len(Tx)))
+    for ii, src in enumerate(Tx):
+        if stype != 'pole-dipole':
+            locs = np.asarray(src).T
+        else:
+            # Create an "inifinity" pole
+            tx = np.squeeze(src)
+            tinf = tx + np.array([dl_x, dl_y, 0])*2*dl_len
+            locs = np.c_[tx, tinf].T
+
+        inds = Utils.closestPoints(mesh, locs)
+        RHS[:, ii] = mesh.getInterpolationMat(locs, 'CC').T*(
+            [-1, 1] / mesh.vol[inds]
+        )
+    return RHS
@@ -33,25 +33,29 @@ from flask import request
 from webapp2 import Route, RedirectHandler
 import webapp2_extras
 
+import routing
+import templating
+
 
 TEMPLATEFOLDER = '_build/html/'
 
-JINJA_ENVIRONMENT = jinja2.Environment(
-    loader=jinja2.FileSystemLoader(os.path.join(os.path.dirname(__file__).split('/')[:-1])),
-    extensions=['jinja2.ext.autoescape'],
-    autoescape=False)
+# pages of the site, see _ext/redirects.py
+RESOLVER = routing.load_resolver()
+
+# redirects only change with a deploy
+REDIRECT_CACHE_CONTROL = 'public, max-age=86400'
 
 
 def setTemplate(self, template_values, templateFile, _templateFolder=TEMPLATEFOLDER):
     # add Defaults
     template_values['_templateFolder'] = _templateFolder
-    template_values['_year'] = str(datetime.datetime.now().year)
     path = os.path.normpath(_templateFolder+templateFile)
-    template = JINJA_ENVIRONMENT.get_template(path)
-    resp = self.response.write(template.render(template_values))
-
-    if resp is None:
+    try:
+        page = templating.render(path, template_values)
+    except jinja2.TemplateNotFound:
         self.redirect('/error.html', permanent=True)
+        return
+    self.response.write(page)
 
 
 class Images(webapp2.RequestHandler):
@@ -60,16 +64,16 @@ class Images(webapp2.RequestHandler):
 
 
 class Redirect(webapp2.RequestHandler):
-    def get(self):
-        path = str(self.request.path).split(os.path.sep)[3:]
-        self.redirect(('/%s' % os.path.sep.join(path)), permanent=True)
-
-
-class RedirectIndex(webapp2.RequestHandler):
     def get(self, *args, **kwargs):
-        path = str(self.request.path).split(os.path.sep) + ['index.html']
-        path = filter(None, path)
-        self.redirect(('/%s' % os.path.sep.join(path)), permanent=True)
+        target = RESOLVER.resolve(self.request.path)
+        if target is None or target == self.request.path:
+            self.response.set_status(404)
+            setTemplate(self, {}, '/error.html', _templateFolder='_templates/')
+            return
+        if self.request.query_string:
+            target = '{}?{}'.format(target, self.request.query_string)
+        self.response.headers['Cache-Control'] = REDIRECT_CACHE_CONTROL
+        self.redirect(target, permanent=True)
 
 
 class MainPage(webapp2.RequestHandler):
@@ -95,9 +99,8 @@ class Error(webapp2.RequestHandler):
 
 app = webapp2.WSGIApplication([
     ('/_images/.*', Images),
-    ('/en/latest/.*', Redirect),
     Route(r'/', RedirectHandler, defaults={'_uri': 'index.html'}),
-    Route(r'<:(.+)>', RedirectIndex),
+    ('/.*', Redirect),
     # ('/', MainPage),
     # ('/.*', Error),
 ], debug=True)
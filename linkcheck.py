@@ -0,0 +1,443 @@
+"""
+Check the links of the html build.
+
+``sphinx-build -b linkcheck`` checks every external link one after the
+other on every run, with a live network and a timeout of minutes per link,
+so a single slow host holds a CI job for up to an hour. This checks the
+built pages (``_build/html``) instead:
+
+- internal links and anchors are checked against the files and the ``id``
+  attributes of the pages, without network (``--offline`` checks only
+  these),
+- external links are checked concurrently (asyncio, a thread per request)
+  with at most ``--per-host`` requests in flight and ``--delay`` seconds
+  between requests for each host, and each result is kept in a json cache
+  (url -> status, code, checked_at) for ``--ttl`` days (``--broken-ttl``
+  for broken links), so a run only checks the links it has not checked
+  recently.
+
+The ``linkcheck_ignore`` patterns of conf.py are used. The exit status is 1
+when links are broken and 2 when there are no pages to check. Usage::
+
+    python linkcheck.py [directory] [--offline] [--cache FILE]
+"""
+
+import argparse
+import ast
+import asyncio
+import io
+import json
+import os
+import posixpath
+import re
+import sys
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from html.parser import HTMLParser
+from urllib.error import HTTPError, URLError
+from urllib.parse import unquote, urldefrag, urlsplit
+from urllib.request import Request, urlopen
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+HTML = os.path.join(ROOT, '_build', 'html')
+CACHE_FILE = os.path.join(ROOT, '_build', 'linkcheck.json')
+CACHE_VERSION = 1
+
+DAY = 24 * 60 * 60
+
+USER_AGENT = 'Mozilla/5.0 (compatible; em.geosci linkcheck)'
+
+# (tag, attribute) of the links checked
+LINK_ATTRIBUTES = {
+    ('a', 'href'), ('area', 'href'), ('link', 'href'), ('img', 'src'),
+    ('script', 'src'), ('source', 'src'), ('video', 'poster'),
+    ('iframe', 'src'),
+}
+
+Page = namedtuple('Page', ['path', 'ids', 'links'])
+Problem = namedtuple('Problem', ['page', 'url', 'message'])
+Result = namedtuple('Result', ['url', 'status', 'code', 'message',
+                               'checked_at'])
+
+
+class PageParser(HTMLParser):
+    """
+    ids and links of a page
+    """
+
+    def __init__(self):
+        HTMLParser.__init__(self, convert_charrefs=True)
+        self.ids = set()
+        self.links = []
+
+    def handle_starttag(self, tag, attrs):
+        for name, value in attrs:
+            if value is None:
+                continue
+            if name == 'id' or (tag == 'a' and name == 'name'):
+                self.ids.add(value)
+            elif (tag, name) in LINK_ATTRIBUTES:
+                self.links.append(value.strip())
+
+    handle_startendtag = handle_starttag
+
+
+def scan_page(outdir, rel):
+    """
+    The Page of the html file rel (a posix path relative to outdir)
+    """
+    parser = PageParser()
+    with io.open(os.path.join(outdir, *rel.split('/')), encoding='utf-8',
+                 errors='replace') as f:
+        for line in f:
+            parser.feed(line)
+    parser.close()
+    return Page(path=rel, ids=frozenset(parser.ids), links=parser.links)
+
+
+def find_pages(outdir):
+    for root, dirList, fileList in os.walk(outdir):
+        dirList.sort()
+        for filename in sorted(fileList):
+            if filename.endswith('.html'):
+                rel = os.path.relpath(os.path.join(root, filename), outdir)
+                yield rel.replace(os.path.sep, '/')
+
+
+def index_tree(outdir, jobs=None):
+    """
+    {path: Page} of the html files of outdir, scanned on a thread pool
+    """
+    with ThreadPoolExecutor(max_workers=jobs) as pool:
+        pages = pool.map(
+            lambda rel: scan_page(outdir, rel), list(find_pages(outdir))
+        )
+        return dict((page.path, page) for page in pages)
+
+
+def is_external(url):
+    return urlsplit(url).scheme in ('http', 'https')
+
+
+def resolve(page, url):
+    """
+    (path relative to the output directory, fragment) a link of page points
+    at, or None for links that are not files of the output (external,
+    mailto:, data:, ...). The path of a link to a directory ends with '/'.
+    """
+    parts = urlsplit(url)
+    if parts.scheme or parts.netloc:
+        return None
+    path = unquote(parts.path)
+    if not path:
+        return page, unquote(parts.fragment)
+    if path.startswith('/'):
+        target = path.lstrip('/')
+    else:
+        target = posixpath.join(posixpath.dirname(page), path)
+    directory = path.endswith('/')
+    target = posixpath.normpath(target)
+    if target == '.':
+        target = ''
+    elif directory:
+        target += '/'
+    return target, unquote(parts.fragment)
+
+
+def check_internal(outdir, index):
+    """
+    Problems of the links between the files of outdir, index being the
+    Pages of its html files
+    """
+    problems = []
+    exists = {}
+    for path in sorted(index):
+        page = index[path]
+        for url in page.links:
+            resolved = resolve(page.path, url)
+            if resolved is None:
+                continue
+            target, fragment = resolved
+            if target.startswith('../') or target == '..':
+                problems.append(Problem(page.path, url,
+                                        'points outside of the output'))
+                continue
+            if target == '' or target.endswith('/'):
+                target += 'index.html'
+            if target not in index:
+                if target not in exists:
+                    exists[target] = os.path.isfile(
+                        os.path.join(outdir, *target.split('/'))
+                    )
+                if not exists[target]:
+                    problems.append(Problem(page.path, url, 'file not found'))
+                continue
+            if fragment and fragment not in index[target].ids:
+                problems.append(Problem(page.path, url,
+                                        'anchor #{} not found'.format(
+                                            fragment)))
+    return problems
+
+
+class LinkCache(object):
+    """
+    Results of the external links, kept ttl seconds (broken_ttl for broken
+    links) in a json file
+    """
+
+    def __init__(self, path=None, ttl=7 * DAY, broken_ttl=DAY):
+        self.path = path
+        self.ttl = ttl
+        self.broken_ttl = broken_ttl
+        self.results = {}
+        if path is not None and os.path.exists(path):
+            try:
+                with io.open(path, encoding='utf-8') as f:
+                    data = json.load(f)
+            except ValueError:
+                data = {}
+            if data.get('version') == CACHE_VERSION:
+                for url, result in data.get('results', {}).items():
+                    self.results[url] = Result(url=url, **result)
+
+    def get(self, url, now=None):
+        """
+        The cached Result of url if it has not expired, or None
+        """
+        result = self.results.get(url)
+        if result is None:
+            return None
+        ttl = self.ttl if result.status == 'working' else self.broken_ttl
+        if (now if now is not None else time.time()) - result.checked_at > ttl:
+            return None
+        return result
+
+    def add(self, result):
+        self.results[result.url] = result
+
+    def save(self):
+        if self.path is None:
+            return
+        directory = os.path.dirname(self.path)
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory)
+        data = {
+            'version': CACHE_VERSION,
+            'results': dict(
+                (url, {
+                    'status': result.status, 'code': result.code,
+                    'message': result.message,
+                    'checked_at': result.checked_at,
+                })
+                for url, result in self.results.items()
+            ),
+        }
+        with io.open(self.path + '.tmp', 'w', encoding='utf-8') as f:
+            f.write(json.dumps(data, indent=1, sort_keys=True))
+        os.replace(self.path + '.tmp', self.path)
+
+
+def fetch(url, timeout):
+    """
+    (status, code, message) of url: 'working', or 'broken' with the
+    reason. Servers refusing HEAD are asked with GET.
+    """
+    code = None
+    for method in ('HEAD', 'GET'):
+        request = Request(url, method=method,
+                          headers={'User-Agent': USER_AGENT})
+        try:
+            with urlopen(request, timeout=timeout) as response:
+                return 'working', response.status, ''
+        except HTTPError as err:
+            code = err.code
+            if method == 'HEAD' and err.code in (403, 405, 501):
+                continue
+            return 'broken', err.code, str(err.reason)
+        except (URLError, OSError, ValueError) as err:
+            reason = getattr(err, 'reason', err)
+            return 'broken', None, str(reason)
+    return 'broken', code, 'refused'
+
+
+class HostLimiter(object):
+    """
+    At most per_host requests in flight, started at least delay seconds
+    apart, for each host
+    """
+
+    def __init__(self, per_host, delay):
+        self.per_host = per_host
+        self.delay = delay
+        self.semaphores = {}
+        self.locks = {}
+        self.last = {}
+
+    async def acquire(self, host):
+        if host not in self.semaphores:
+            self.semaphores[host] = asyncio.Semaphore(self.per_host)
+            self.locks[host] = asyncio.Lock()
+        await self.semaphores[host].acquire()
+        async with self.locks[host]:
+            wait = self.last.get(host, 0) + self.delay - time.monotonic()
+            if wait > 0:
+                await asyncio.sleep(wait)
+            self.last[host] = time.monotonic()
+
+    def release(self, host):
+        self.semaphores[host].release()
+
+
+async def _check_external(urls, timeout, concurrency, per_host, delay,
+                          retries, fetch):
+    loop = asyncio.get_event_loop()
+    limiter = HostLimiter(per_host, delay)
+    results = {}
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+
+        async def check(url):
+            host = urlsplit(url).netloc.lower()
+            for attempt in range(retries + 1):
+                await limiter.acquire(host)
+                try:
+                    status, code, message = await loop.run_in_executor(
+                        pool, fetch, url, timeout
+                    )
+                finally:
+                    limiter.release(host)
+                # retry timeouts and server errors, not missing pages
+                if status == 'working' or (code is not None and code < 500):
+                    break
+            results[url] = Result(url, status, code, message, time.time())
+
+        await asyncio.gather(*[check(url) for url in urls])
+    return results
+
+
+def check_external(urls, cache=None, timeout=30, concurrency=20,
+                   per_host=2, delay=0.5, retries=1, fetch=fetch):
+    """
+    {url: Result} of the external urls, checking the ones missing from
+    (or expired in) cache, which is updated
+    """
+    cache = cache if cache is not None else LinkCache()
+    now = time.time()
+    results = {}
+    todo = []
+    for url in sorted(set(urls)):
+        result = cache.get(url, now)
+        if result is not None:
+            results[url] = result
+        else:
+            todo.append(url)
+
+    if todo:
+        loop = asyncio.new_event_loop()
+        try:
+            checked = loop.run_until_complete(_check_external(
+                todo, timeout, concurrency, per_host, delay, retries, fetch
+            ))
+        finally:
+            loop.close()
+        for result in checked.values():
+            cache.add(result)
+        results.update(checked)
+    return results
+
+
+def read_ignore(conf=os.path.join(ROOT, 'conf.py')):
+    """
+    The linkcheck_ignore patterns of conf.py (read without running it)
+    """
+    with io.open(conf, encoding='utf-8') as f:
+        tree = ast.parse(f.read())
+    for node in tree.body:
+        if isinstance(node, ast.Assign) and any(
+            isinstance(target, ast.Name) and target.id == 'linkcheck_ignore'
+            for target in node.targets
+        ):
+            return ast.literal_eval(node.value)
+    return []
+
+
+def check(outdir=HTML, offline=False, ignore=(), cache=None, jobs=None,
+          **kwargs):
+    """
+    Problems of the links of the pages of outdir: the internal ones, and
+    the external ones unless offline (kwargs go to check_external). Raises
+    ValueError when outdir has no pages.
+    """
+    index = index_tree(outdir, jobs)
+    if not index:
+        raise ValueError('no html pages in {}'.format(outdir))
+    problems = check_internal(outdir, index)
+    if offline:
+        return problems
+
+    ignore = [re.compile(pattern) for pattern in ignore]
+    pages = {}
+    for page in index.values():
+        for url in page.links:
+            if not is_external(url):
+                continue
+            url = urldefrag(url)[0]
+            if not any(pattern.match(url) for pattern in ignore):
+                pages.setdefault(url, []).append(page.path)
+
+    results = check_external(list(pages), cache, **kwargs)
+    for url, result in sorted(results.items()):
+        if result.status != 'working':
+            message = '{} {}'.format(result.code or '', result.message)
+            for page in sorted(set(pages[url])):
+                problems.append(Problem(page, url, message.strip()))
+    return problems
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('directory', nargs='?', default=HTML)
+    parser.add_argument('--offline', action='store_true',
+                        help='only check the internal links and anchors')
+    parser.add_argument('--cache', default=CACHE_FILE)
+    parser.add_argument('--ttl', type=float, default=7,
+                        help='days a working link is not checked again')
+    parser.add_argument('--broken-ttl', type=float, default=1,
+                        help='days a broken link is not checked again')
+    parser.add_argument('--timeout', type=float, default=30)
+    parser.add_argument('--concurrency', type=int, default=20)
+    parser.add_argument('--per-host', type=int, default=2)
+    parser.add_argument('--delay', type=float, default=0.5,
+                        help='seconds between requests to a host')
+    parser.add_argument('--retries', type=int, default=1)
+    args = parser.parse_args(argv)
+
+    if not os.path.isdir(args.directory):
+        print('{} is not a directory, build the html first'.format(
+            args.directory))
+        return 2
+
+    cache = LinkCache(args.cache, args.ttl * DAY, args.broken_ttl * DAY)
+    try:
+        problems = check(
+            args.directory, offline=args.offline, ignore=read_ignore(),
+            cache=cache, timeout=args.timeout, concurrency=args.concurrency,
+            per_host=args.per_host, delay=args.delay, retries=args.retries
+        )
+    except ValueError as err:
+        print('{}, build the html first'.format(err))
+        return 2
+    if not args.offline:
+        # nothing was checked against the network
+        cache.save()
+
+    for problem in problems:
+        print('{}: {}: {}'.format(*problem))
+    print('{} broken links'.format(len(problems)))
+    return 1 if problems else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
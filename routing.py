@@ -0,0 +1,81 @@
+"""
+Redirects served by emgeosci.py.
+
+The manifest of the built pages is written to
+``_build/html/_redirects.json`` by the redirects Sphinx extension and loaded
+once when an instance starts. A requested path is resolved to a page in a
+single step: the legacy prefix of the old Read the Docs site
+(``/en/latest``) is dropped, moved pages are followed, directory paths
+(with or without their trailing slash) go to their ``index.html`` and the
+result is only returned if it is a page of the site, so every redirect
+lands on a page and everything else is not found.
+"""
+
+import io
+import json
+import os
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+REDIRECTS_FILE = os.path.join(ROOT, '_build', 'html', '_redirects.json')
+REDIRECTS_VERSION = 2
+
+INDEX = 'index.html'
+
+
+class Resolver(object):
+    """
+    Resolve requested paths to the pages of the site.
+
+    pages are the absolute paths of the built pages ('/content/index.html'),
+    moved maps old paths to new ones and legacy_prefixes are the prefixes
+    ('en/latest') of paths of the old site.
+    """
+
+    def __init__(self, pages=(), moved=None, legacy_prefixes=()):
+        self.pages = frozenset(pages)
+        self.moved = dict(moved or {})
+        # longest first, so that nested prefixes are matched fully
+        self.legacy_prefixes = sorted(
+            ('/' + prefix.strip('/') for prefix in legacy_prefixes),
+            key=len, reverse=True
+        )
+
+    def normalize(self, path):
+        """
+        path without its legacy prefix, with a moved page replaced by its
+        new location
+        """
+        for prefix in self.legacy_prefixes:
+            if path == prefix or path.startswith(prefix + '/'):
+                path = path[len(prefix):] or '/'
+                break
+        return self.moved.get(path, path)
+
+    def resolve(self, path):
+        """
+        The page path leads to, or None
+        """
+        path = self.normalize(path)
+        if path in self.pages:
+            return path
+        index = path.rstrip('/') + '/' + INDEX
+        if index in self.pages:
+            return index
+        return None
+
+
+def load_resolver(path=REDIRECTS_FILE):
+    """
+    Resolver for the built site, without any page when it was not built
+    """
+    try:
+        with io.open(path, encoding='utf-8') as f:
+            manifest = json.load(f)
+    except (IOError, OSError, ValueError):
+        return Resolver()
+    if manifest.get('version') != REDIRECTS_VERSION:
+        return Resolver()
+    return Resolver(
+        manifest['pages'], manifest['redirects'], manifest['legacy_prefixes']
+    )
@@ -0,0 +1,128 @@
+"""
+Serve the html build locally, as it is deployed.
+
+The pre-compressed ``.br``/``.gz`` copies written by the precompress
+extension are sent to clients accepting these encodings (``Content-Encoding``
+negotiated from ``Accept-Encoding``), so that the large animation pages are
+never compressed on the fly, and paths that are not files are resolved with
+the redirects of the deployed app (see routing.py).
+
+Usage::
+
+    python serve.py [directory] [--port PORT]
+"""
+
+import argparse
+import mimetypes
+import os
+from http.server import HTTPServer, SimpleHTTPRequestHandler
+from socketserver import ThreadingMixIn
+from urllib.parse import urlsplit
+
+import routing
+
+# preferred first when a client accepts several of them equally
+ENCODINGS = [('br', '.br'), ('gzip', '.gz')]
+
+
+def accepted_encodings(header):
+    """
+    {encoding: quality} of an Accept-Encoding header
+    """
+    accepted = {}
+    for item in (header or '').split(','):
+        parts = [part.strip() for part in item.split(';')]
+        if not parts[0]:
+            continue
+        quality = 1.0
+        for param in parts[1:]:
+            if param.startswith('q='):
+                try:
+                    quality = float(param[2:])
+                except ValueError:
+                    quality = 0.0
+        accepted[parts[0].lower()] = quality
+    return accepted
+
+
+def negotiate(header, available):
+    """
+    The encoding (of available, in order of preference) to send to a client
+    sending the Accept-Encoding header, or None for the identity
+    """
+    accepted = accepted_encodings(header)
+    best = None
+    best_quality = 0.0
+    for encoding in available:
+        quality = accepted.get(encoding, accepted.get('*', 0.0))
+        if quality > best_quality:
+            best, best_quality = encoding, quality
+    return best
+
+
+class Handler(SimpleHTTPRequestHandler):
+
+    resolver = routing.Resolver()
+
+    def send_head(self):
+        path = self.translate_path(self.path)
+        if not os.path.isfile(path):
+            target = self.resolver.resolve(urlsplit(self.path).path)
+            if target is not None and target != urlsplit(self.path).path:
+                self.send_response(301)
+                self.send_header('Location', target)
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return None
+            if not os.path.isdir(path):
+                self.send_error(404)
+                return None
+            return super(Handler, self).send_head()
+
+        available = [
+            encoding for encoding, suffix in ENCODINGS
+            if os.path.isfile(path + suffix)
+        ]
+        encoding = negotiate(self.headers.get('Accept-Encoding'), available)
+        if encoding is None:
+            return super(Handler, self).send_head()
+
+        compressed = path + dict(ENCODINGS)[encoding]
+        f = open(compressed, 'rb')
+        self.send_response(200)
+        self.send_header(
+            'Content-Type',
+            mimetypes.guess_type(path)[0] or 'application/octet-stream'
+        )
+        self.send_header('Content-Encoding', encoding)
+        self.send_header('Vary', 'Accept-Encoding')
+        self.send_header('Content-Length', str(os.fstat(f.fileno()).st_size))
+        self.end_headers()
+        return f
+
+
+class Server(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument(
+        'directory', nargs='?',
+        default=os.path.join(routing.ROOT, '_build', 'html')
+    )
+    parser.add_argument('--port', type=int, default=8000)
+    args = parser.parse_args()
+
+    Handler.resolver = routing.load_resolver(
+        os.path.join(args.directory, '_redirects.json')
+    )
+    os.chdir(args.directory)
+    server = Server(('', args.port), Handler)
+    print('Serving {} on http://localhost:{}/'.format(
+        args.directory, args.port))
+    server.serve_forever()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,158 @@
+"""
+Templates of the pages rendered by emgeosci.py.
+
+The pages are compiled to python modules when the site is deployed
+(``python templating.py``), so that an instance loads them with a plain
+import instead of reading and parsing the html. The rendered pages are
+memoized per template, year and template values, so that after the first
+request a page is served from memory without touching the filesystem.
+When no compiled module exists (e.g. when running the app locally without
+compiling), or when its source changed since it was compiled, the template
+is read from its source. Templates are autoescaped.
+"""
+
+import datetime
+import hashlib
+import json
+import os
+import sys
+
+import jinja2
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+# compiled templates, kept out of _build/html so they are not served
+COMPILED_DIR = os.path.join(ROOT, '_build', 'templates')
+
+# the pages rendered by the app, relative to ROOT
+PAGES = [
+    '_build/html/index.html',
+    '_templates/error.html',
+]
+
+# escape the values rendered into html templates
+AUTOESCAPE = jinja2.select_autoescape(['html'])
+
+# name -> sha1 of the source of each compiled template, next to the modules
+SOURCES = 'sources.json'
+
+
+def source_hash(path):
+    """
+    sha1 hex digest of the template source path, or None if it is missing
+    """
+    try:
+        with open(path, 'rb') as f:
+            return hashlib.sha1(f.read()).hexdigest()
+    except (IOError, OSError):
+        return None
+
+
+class CompiledLoader(jinja2.ModuleLoader):
+    """
+    Load the compiled templates of path, but only while their source (in
+    root) is the one they were compiled from: a stale module is not found,
+    so that the next loader reads the source instead.
+    """
+
+    def __init__(self, path, root=ROOT):
+        super(CompiledLoader, self).__init__(path)
+        self.path = path
+        self.root = root
+
+    def load(self, environment, name, globals=None):
+        try:
+            with open(os.path.join(self.path, SOURCES)) as f:
+                digest = json.load(f).get(name)
+        except (IOError, OSError, ValueError):
+            digest = None
+        path = os.path.join(self.root, *name.split('/'))
+        if digest is None or digest != source_hash(path):
+            raise jinja2.TemplateNotFound(name)
+        return super(CompiledLoader, self).load(environment, name, globals)
+
+
+def environment(compiled=COMPILED_DIR, root=ROOT):
+    """
+    The environment of the app: compiled templates first, then the sources
+    """
+    return jinja2.Environment(
+        loader=jinja2.ChoiceLoader([
+            CompiledLoader(compiled, root),
+            jinja2.FileSystemLoader(root),
+        ]),
+        autoescape=AUTOESCAPE,
+        # templates do not change on a deployed instance: never stat them
+        # again
+        auto_reload=False,
+        cache_size=-1,
+    )
+
+
+JINJA_ENVIRONMENT = environment()
+
+# (template, year, template values) -> rendered page
+_rendered = {}
+
+
+def _key(name, year, values):
+    return (name, year, tuple(sorted(
+        (key, repr(value)) for key, value in values.items()
+    )))
+
+
+def render(name, values=None):
+    """
+    Render the template name (relative to ROOT) with values, adding the
+    current ``_year``.
+    """
+    values = dict(values or {})
+    values['_year'] = str(datetime.datetime.now().year)
+    key = _key(name, values['_year'], values)
+    page = _rendered.get(key)
+    if page is None:
+        page = JINJA_ENVIRONMENT.get_template(name).render(values)
+        _rendered[key] = page
+    return page
+
+
+def precompile(pages=PAGES, target=COMPILED_DIR, root=ROOT):
+    """
+    Compile pages (relative to root) into python modules in target for the
+    CompiledLoader. Run when deploying, after the html is built.
+    """
+    compiler = jinja2.Environment(
+        loader=jinja2.FileSystemLoader(root),
+        autoescape=AUTOESCAPE,
+    )
+    if not os.path.isdir(target):
+        os.makedirs(target)
+    for name in os.listdir(target):
+        if name.startswith('tmpl_') or name == SOURCES:
+            os.remove(os.path.join(target, name))
+    sources = dict(
+        (name, source_hash(os.path.join(root, *name.split('/'))))
+        for name in pages
+    )
+    # plain .py modules (no .pyc: they are not uploaded, see skip_files in
+    # app.yaml)
+    compiler.compile_templates(
+        target, filter_func=lambda name: name in pages, zip=None,
+        ignore_errors=False
+    )
+    missing = [
+        name for name in pages
+        if not os.path.isfile(os.path.join(
+            target, jinja2.ModuleLoader.get_module_filename(name)
+        ))
+    ]
+    if missing:
+        raise IOError('could not compile {}'.format(', '.join(missing)))
+    with open(os.path.join(target, SOURCES), 'w') as f:
+        json.dump(sources, f, indent=1, sort_keys=True)
+
+
+if __name__ == '__main__':
+    precompile()
+    sys.stdout.write('compiled {} templates into {}\n'.format(
+        len(PAGES), COMPILED_DIR))
@@ -0,0 +1,162 @@
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+dirname, filename = os.path.split(os.path.abspath(__file__))
+sys.path.append(os.path.sep.join(dirname.split(os.path.sep)[:-1] + ['_ext']))
+
+from copyImages import copyImages, file_hash, hashed_name, MANIFEST
+
+
+class TestCopyImages(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.content = os.path.join(self.tmp, 'content')
+        self.images = os.path.join(self.tmp, '_build', 'html', '_images')
+        self.write('chapter/images/a.png', b'aaaa')
+        self.write('chapter/images/b.png', b'bbbb')
+        self.write('chapter/figures/c.png', b'cccc')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def write(self, rel, data):
+        path = os.path.join(self.content, *rel.split('/'))
+        if not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        with open(path, 'wb') as f:
+            f.write(data)
+        return path
+
+    def sync(self, **kwargs):
+        return copyImages(self.content, self.images, **kwargs)
+
+    def read(self, name):
+        with open(os.path.join(self.images, name), 'rb') as f:
+            return f.read()
+
+    def test_initial_sync(self):
+        out = self.sync()
+        self.assertEqual(sorted(out['copied']), ['a.png', 'b.png'])
+        self.assertEqual(
+            sorted(os.listdir(self.images)), [MANIFEST, 'a.png', 'b.png']
+        )
+
+    def test_noop_resync(self):
+        self.sync()
+        out = self.sync()
+        self.assertEqual(out['copied'], [])
+        self.assertEqual(out['removed'], [])
+        self.assertEqual(sorted(out['unchanged']), ['a.png', 'b.png'])
+
+    def test_changed_image_is_refreshed(self):
+        self.sync()
+        path = self.write('chapter/images/a.png', b'a new image')
+        st = os.stat(path)
+        os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + 10**9))
+        out = self.sync()
+        self.assertEqual(out['copied'], ['a.png'])
+        self.assertEqual(self.read('a.png'), b'a new image')
+
+    def test_stale_output_is_removed(self):
+        self.sync()
+        os.remove(os.path.join(self.content, 'chapter', 'images', 'b.png'))
+        out = self.sync()
+        self.assertEqual(out['removed'], ['b.png'])
+        self.assertFalse(os.path.exists(os.path.join(self.images, 'b.png')))
+
+    def test_parallel_hardlink(self):
+        out = self.sync(jobs=4, mode='hardlink')
+        self.assertEqual(sorted(out['copied']), ['a.png', 'b.png'])
+        self.assertEqual(self.read('b.png'), b'bbbb')
+
+    def test_bad_mode(self):
+        self.assertRaises(ValueError, self.sync, mode='symlink')
+        self.assertRaises(ValueError, self.sync, layout='nested')
+
+    def test_flat_collision_first_wins(self):
+        self.write('other/images/a.png', b'another a')
+        self.sync()
+        self.assertEqual(self.read('a.png'), b'aaaa')
+
+    def figures(self):
+        # every image is used by a directive, so no flat copies are kept
+        self.write('chapter/index.rst',
+                   b'.. figure:: images/a.png\n\n'
+                   b'.. |b| image:: ./images/b.png\n')
+        self.write('other/index.rst',
+                   b'.. image:: /content/other/images/a.png\n'
+                   b'.. image:: ../other/images/b.png\n')
+
+    def test_hashed_layout(self):
+        self.figures()
+        self.write('other/images/a.png', b'another a')
+        # identical copy of chapter/images/b.png
+        path = self.write('other/images/b.png', b'bbbb')
+        out = self.sync(layout='hashed')
+
+        digest = file_hash(path)
+        self.assertEqual(hashed_name(path, digest), 'b.' + digest[:12] + '.png')
+        names = sorted(out['copied'])
+        self.assertEqual(len(names), 3)
+        self.assertIn(hashed_name(path, digest), names)
+        for name in names:
+            self.assertEqual(file_hash(os.path.join(self.images, name))[:12],
+                             name.split('.')[1])
+
+    def test_hashed_layout_replaces_changed_image(self):
+        self.figures()
+        self.sync(layout='hashed')
+        path = self.write('chapter/images/a.png', b'a new image')
+        st = os.stat(path)
+        os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + 10**9))
+        out = self.sync(layout='hashed')
+        self.assertEqual(out['copied'], [hashed_name(path, file_hash(path))])
+        self.assertEqual(len(out['removed']), 1)
+        self.assertEqual(len(os.listdir(self.images)), 3)
+
+    def test_hashed_layout_keeps_flat_copies_for_raw_html(self):
+        # a.png is a figure, b.png is only used by a raw html widget
+        self.write('chapter/index.rst', b'.. figure:: images/a.png\n')
+        widget = self.write('chapter/images/widget.html',
+                            b'<img src="../../_images/b.png" />')
+        a = os.path.join(self.content, 'chapter', 'images', 'a.png')
+        b = os.path.join(self.content, 'chapter', 'images', 'b.png')
+        hashed_b = hashed_name(b, file_hash(b))
+        out = self.sync(layout='hashed')
+        self.assertEqual(
+            sorted(os.listdir(self.images)),
+            sorted([MANIFEST, hashed_name(a, file_hash(a)), hashed_b,
+                    'b.png', hashed_name(widget, file_hash(widget)),
+                    'widget.html'])
+        )
+        self.assertEqual(self.read('b.png'), b'bbbb')
+
+        out = self.sync(layout='hashed')
+        self.assertEqual(out['copied'], [])
+        self.assertIn('b.png', out['unchanged'])
+
+        # the flat copy follows changes of its source
+        self.write('chapter/images/b.png', b'a new b')
+        st = os.stat(b)
+        os.utime(b, ns=(st.st_atime_ns, st.st_mtime_ns + 10**9))
+        out = self.sync(layout='hashed')
+        self.assertEqual(
+            sorted(out['copied']),
+            sorted(['b.png', hashed_name(b, file_hash(b))])
+        )
+        self.assertEqual(out['removed'], [hashed_b])
+        self.assertEqual(self.read('b.png'), b'a new b')
+
+        # and goes away with it
+        os.remove(b)
+        out = self.sync(layout='hashed')
+        self.assertIn('b.png', out['removed'])
+        self.assertFalse(os.path.exists(os.path.join(self.images, 'b.png')))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,6 +1,7 @@
 import subprocess
 import unittest
 import os
+import sys
 
 class Doc_Test(unittest.TestCase):
 
@@ -37,13 +38,23 @@ class Doc_Test(unittest.TestCase):
     #     assert check == 0
 
     def test_linkcheck(self):
-        doctrees_path = os.path.sep.join(self.path_to_docs.split(os.path.sep) + ['_build']+['doctrees'])
-        link_path = os.path.sep.join(self.path_to_docs.split(os.path.sep) + ['_build'])
+        # internal links and anchors of the html built by test_html, without
+        # network (python linkcheck.py also checks the external links)
+        html_path = os.path.sep.join(self.path_to_docs.split(os.path.sep) + ['_build']+['html'])
 
-        check = subprocess.call(["sphinx-build", "-nW", "-b", "linkcheck", "-d",
-            "%s"%(doctrees_path),
-            "%s"%(self.path_to_docs),
-            "%s"%(link_path)])
+        check = subprocess.call([sys.executable,
+            os.path.join(self.path_to_docs, 'linkcheck.py'),
+            "--offline", "%s"%(html_path)])
+        assert check == 0
+
+    def test_validate(self):
+        # dangling links, missing images and orphaned pages of the html
+        # built by test_html (the check run before deploying)
+        html_path = os.path.sep.join(self.path_to_docs.split(os.path.sep) + ['_build']+['html'])
+
+        check = subprocess.call([sys.executable,
+            os.path.join(self.path_to_docs, 'validate.py'),
+            "%s"%(html_path)])
         assert check == 0
 
 
@@ -0,0 +1,95 @@
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+dirname, filename = os.path.split(os.path.abspath(__file__))
+sys.path.append(os.path.sep.join(dirname.split(os.path.sep)[:-1] + ['_ext']))
+
+import equationBank
+from equationBank import EquationBankError, load_bank, lookup, parse_equation
+
+
+class TestEquationBank(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def write(self, name, text):
+        path = os.path.join(self.tmp, name)
+        with open(path, 'w') as f:
+            f.write(text)
+        return path
+
+    def test_equation_bank(self):
+        bank = load_bank()
+        self.assertTrue(len(bank) > 0)
+        for label, equation in bank.items():
+            self.assertEqual(equation.label, label)
+            self.assertNotIn(':label:', equation.latex)
+        self.assertIs(bank['faraday_time'], load_bank()['faraday_time'])
+
+    def test_label_after_the_equation(self):
+        equation = parse_equation(
+            '.. _eq_ohm:\n\n'
+            '.. math::\n'
+            '        \\mathbf{j} = \\sigma\n'
+            '        \\mathbf{e}\n'
+            '    :label: ohms_law\n',
+            'ohm.rst'
+        )
+        self.assertEqual(equation.label, 'ohms_law')
+        self.assertEqual(equation.target, 'eq_ohm')
+        self.assertEqual(equation.latex, '\\mathbf{j} = \\sigma\n\\mathbf{e}')
+        self.assertFalse(equation.nowrap)
+
+    def test_defaults_and_comments(self):
+        equation = parse_equation(
+            '.. math::\n'
+            '    :nowrap:\n\n'
+            '    a = b\n\n'
+            '.. .. math::\n'
+            '..     c = d\n',
+            'bank/ampere.rst'
+        )
+        self.assertEqual(equation.label, 'ampere')
+        self.assertEqual(equation.target, 'eq_ampere')
+        self.assertEqual(equation.latex, 'a = b')
+        self.assertTrue(equation.nowrap)
+
+    def test_one_equation_per_file(self):
+        with self.assertRaises(EquationBankError):
+            parse_equation('no math here\n', 'empty.rst')
+        with self.assertRaises(EquationBankError):
+            parse_equation('.. math:: a\n\n.. math:: b\n', 'two.rst')
+
+    def test_duplicate_labels(self):
+        self.write('a.rst', '.. math::\n    a\n    :label: same\n')
+        self.write('b.rst', '.. math::\n    b\n    :label: same\n')
+        with self.assertRaises(EquationBankError) as ctx:
+            load_bank(self.tmp)
+        self.assertIn('same', str(ctx.exception))
+
+    def test_lookup(self):
+        self.write('ohms_law.rst', '.. math::\n    j = \\sigma e\n    :label: ohm\n')
+        self.assertEqual(lookup('ohm', self.tmp).latex, 'j = \\sigma e')
+        self.assertEqual(lookup('ohms_law.rst', self.tmp).label, 'ohm')
+        with self.assertRaises(KeyError):
+            lookup('faraday', self.tmp)
+
+    def test_reparsed_when_changed(self):
+        path = self.write('a.rst', '.. math::\n    a\n')
+        first = equationBank.load_equation(path)
+        self.assertIs(first, equationBank.load_equation(path))
+        self.write('a.rst', '.. math::\n    a + b\n')
+        st = os.stat(path)
+        os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + 10**9))
+        self.assertEqual(equationBank.load_equation(path).latex, 'a + b')
+
+
+if __name__ == '__main__':
+    unittest.main()
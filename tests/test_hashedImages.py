@@ -0,0 +1,96 @@
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+from types import SimpleNamespace
+
+dirname, filename = os.path.split(os.path.abspath(__file__))
+sys.path.append(os.path.sep.join(dirname.split(os.path.sep)[:-1] + ['_ext']))
+
+from sphinx.util import FilenameUniqDict
+
+from copyImages import file_hash, hashed_name
+from hashedImages import hash_image_names
+
+
+class TestHashedImages(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.app = SimpleNamespace(
+            srcdir=self.tmp,
+            outdir=os.path.join(self.tmp, '_build', 'html'),
+            config=SimpleNamespace(
+                hashed_images=True, hashed_images_contentdir='content'
+            ),
+        )
+        self.env = SimpleNamespace(images=FilenameUniqDict())
+        self.a = self.write('content/one/images/figure.png', b'one')
+        self.b = self.write('content/two/images/figure.png', b'two')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def write(self, rel, data):
+        path = os.path.join(self.tmp, *rel.split('/'))
+        if not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        with open(path, 'wb') as f:
+            f.write(data)
+        return rel
+
+    def read_doc(self, docname, *images):
+        # what the image collector of Sphinx does for every (re)read doc
+        self.env.images.purge_doc(docname)
+        for image in images:
+            self.env.images.add_file(docname, image)
+
+    def name(self, key):
+        return self.env.images[key][1]
+
+    def expected(self, key):
+        return hashed_name(key, file_hash(os.path.join(self.tmp, key)))
+
+    def test_rename(self):
+        self.read_doc('one', self.a)
+        self.read_doc('two', self.b)
+        # Sphinx would have served the second one as figure1.png
+        self.assertEqual(self.name(self.b), 'figure1.png')
+
+        hash_image_names(self.app, self.env)
+        self.assertEqual(self.name(self.a), self.expected(self.a))
+        self.assertEqual(self.name(self.b), self.expected(self.b))
+        self.assertEqual(
+            self.env.images._existing,
+            {self.expected(self.a), self.expected(self.b)}
+        )
+
+    def test_incremental(self):
+        self.read_doc('one', self.a)
+        self.read_doc('two', self.b)
+        hash_image_names(self.app, self.env)
+        first = self.name(self.a)
+
+        # the image of 'two' changes and the doc is read again
+        self.write(self.b, b'two, again')
+        self.read_doc('two', self.b)
+        hash_image_names(self.app, self.env)
+        self.assertEqual(self.name(self.a), first)
+        self.assertEqual(self.name(self.b), self.expected(self.b))
+
+        # a removed doc releases its image and its hashed name
+        self.read_doc('one')
+        hash_image_names(self.app, self.env)
+        self.assertNotIn(self.a, self.env.hashed_images)
+        self.assertNotIn(first, self.env.images._existing)
+
+    def test_disabled(self):
+        self.app.config.hashed_images = False
+        self.read_doc('one', self.a)
+        hash_image_names(self.app, self.env)
+        self.assertEqual(self.name(self.a), 'figure.png')
+
+
+if __name__ == '__main__':
+    unittest.main()
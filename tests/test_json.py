@@ -1,7 +1,11 @@
 import subprocess
 import unittest
 import os
+import sys
+import io
 import json
+import re
+import tempfile
 
 # relative to em/
 jsonFiles = ['contributors.json', 'content/case_histories/case_histories.json']
@@ -47,5 +51,93 @@ for test in jsonFiles:
 
 TestJson = type('TestJSON', (unittest.TestCase,), attrs)
 
+sys.path.append(os.path.sep.join(
+    os.path.dirname(os.path.abspath(__file__)).split(os.path.sep)[:-1] +
+    ['_ext']
+))
+
+import metadata
+
+
+class TestMetadata(unittest.TestCase):
+
+    def test_contributors(self):
+        contributors = metadata.load_contributors()
+        self.assertTrue(len(contributors) > 0)
+        self.assertIs(contributors, metadata.load_contributors())
+
+    def test_case_histories(self):
+        casehistories = metadata.load_case_histories()
+        self.assertTrue(len(casehistories) > 0)
+        for casehistory in casehistories.values():
+            self.assertTrue(casehistory.title)
+
+    def test_citations(self):
+        # the case histories cite the bibliography of the references page
+        with io.open(os.path.join(metadata.ROOT, 'content', 'references.bib'),
+                     encoding='utf-8') as f:
+            keys = set(re.findall(r'^@\w+\{([^,\s]+),', f.read(), re.M))
+        for casehistory in metadata.load_case_histories().values():
+            for citation in casehistory.citations:
+                self.assertIn(citation, keys, casehistory.uid)
+
+    def test_generated_pages(self):
+        # the committed pages were generated from the current inputs
+        # (regenerate them with python _ext/autodoc.py)
+        import autodoc
+        for fpaths, fout in [
+            ([metadata.CONTRIBUTORS_JSON], 'contributors.rst'),
+            ([metadata.CASE_HISTORIES_JSON, metadata.CONTRIBUTORS_JSON],
+             'content/case_histories/case_histories.rst'),
+        ]:
+            digest = autodoc.source_hash(*[
+                os.path.join(metadata.ROOT, *fpath.split('/'))
+                for fpath in fpaths
+            ])
+            self.assertTrue(autodoc.is_up_to_date(
+                os.path.join(metadata.ROOT, *fout.split('/')), digest), fout)
+
+    def load(self, data, loader):
+        fd, path = tempfile.mkstemp(suffix='.json')
+        self.addCleanup(os.remove, path)
+        with os.fdopen(fd, 'w') as f:
+            json.dump(data, f)
+        return loader(path)
+
+    def test_missing_key(self):
+        with self.assertRaises(metadata.MetadataError) as ctx:
+            self.load({'someone': {'email': 'a@b.c'}},
+                      metadata.load_contributors)
+        self.assertEqual(ctx.exception.location, '/someone')
+        self.assertIn("'name'", str(ctx.exception))
+
+    def test_bad_value(self):
+        with self.assertRaises(metadata.MetadataError) as ctx:
+            self.load({'someone': {'name': 'Some One', 'ORCID': '123'}},
+                      metadata.load_contributors)
+        self.assertEqual(ctx.exception.location, '/someone/ORCID')
+
+    def test_optional_blocks(self):
+        casehistories = self.load(
+            {'site': {'title': 'Site', 'source': './site/',
+                      'thumbnail': './site/images/a.png'}},
+            lambda path: metadata.load_case_histories(path, contributors={})
+        )
+        site = casehistories['site']
+        self.assertEqual(site.description, 'Site')
+        self.assertEqual(site.contributors, ())
+        self.assertEqual(site.tags, ())
+
+    def test_unknown_contributor(self):
+        data = {'site': {
+            'title': 'Site', 'source': './site/',
+            'thumbnail': './site/images/a.png',
+            'contributors': [{'as': 'author', 'uid': 'user:nobody'}]
+        }}
+        with self.assertRaises(metadata.MetadataError) as ctx:
+            self.load(data, lambda path: metadata.load_case_histories(
+                path, contributors={}))
+        self.assertEqual(ctx.exception.location, '/site/contributors/0')
+
 if __name__ == '__main__':
     unittest.main()
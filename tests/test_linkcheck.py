@@ -0,0 +1,193 @@
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import unittest
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+
+dirname, filename = os.path.split(os.path.abspath(__file__))
+sys.path.append(os.path.sep.join(dirname.split(os.path.sep)[:-1]))
+
+import linkcheck
+from linkcheck import LinkCache, check, check_external, read_ignore, resolve
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    """
+    /ok answers 200, /head-refused only answers GET, everything else 404
+    """
+
+    requests = []
+
+    def respond(self):
+        StubHandler.requests.append((self.command, self.path))
+        if self.path == '/ok' or (
+            self.path == '/head-refused' and self.command == 'GET'
+        ):
+            code = 200
+        elif self.path == '/head-refused':
+            code = 405
+        else:
+            code = 404
+        self.send_response(code)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    do_HEAD = respond
+    do_GET = respond
+
+    def log_message(self, *args):
+        pass
+
+
+class Server(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class TestLinkCheck(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        StubHandler.requests = []
+        self.server = Server(('localhost', 0), StubHandler)
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.start()
+        self.url = 'http://localhost:{}'.format(self.server.server_address[1])
+
+        self.write('index.html',
+                   '<a href="content/page.html#section">page</a>'
+                   '<a href="content/">content</a>'
+                   '<a href="content/page.html#missing">missing anchor</a>'
+                   '<a href="content/gone.html">gone</a>'
+                   '<a href="mailto:someone@example.com">mail</a>'
+                   '<a href="{0}/ok">ok</a>'
+                   '<a href="{0}/ok#fragment">ok again</a>'
+                   '<a href="{0}/missing">missing</a>'
+                   '<a href="{0}/ignored">ignored</a>'.format(self.url))
+        self.write('content/index.html',
+                   '<a href="../index.html">up</a>'
+                   '<img src="../_images/figure.png" />')
+        self.write('content/page.html',
+                   '<div id="section"><a href="#section">here</a></div>'
+                   '<link href="../_static/theme.css?v=1" />')
+        self.write('_images/figure.png', '')
+        self.write('_static/theme.css', '')
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.thread.join()
+        shutil.rmtree(self.tmp)
+
+    def write(self, rel, text):
+        path = os.path.join(self.tmp, *rel.split('/'))
+        if not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        with open(path, 'w') as f:
+            f.write(text)
+
+    def test_resolve(self):
+        self.assertEqual(resolve('a/b.html', '../c.html#x'), ('c.html', 'x'))
+        self.assertEqual(resolve('a/b.html', '#x'), ('a/b.html', 'x'))
+        self.assertEqual(resolve('a/b.html', './'), ('a/', ''))
+        self.assertEqual(resolve('a/b.html', '/d/e%20f.png'), ('d/e f.png', ''))
+        self.assertIsNone(resolve('a/b.html', 'https://example.com/'))
+        self.assertIsNone(resolve('a/b.html', 'mailto:someone@example.com'))
+
+    def test_offline(self):
+        problems = check(self.tmp, offline=True)
+        self.assertEqual(
+            sorted((problem.page, problem.url) for problem in problems),
+            [('index.html', 'content/gone.html'),
+             ('index.html', 'content/page.html#missing')]
+        )
+        self.assertEqual(StubHandler.requests, [])
+
+    def test_main_offline(self):
+        cache = os.path.join(self.tmp, 'cache', 'linkcheck.json')
+        sys.stdout, stdout = open(os.devnull, 'w'), sys.stdout
+        try:
+            self.assertEqual(
+                linkcheck.main([self.tmp, '--offline', '--cache', cache]), 1
+            )
+            # nothing to fail on is not a pass
+            empty = os.path.join(self.tmp, 'empty')
+            os.makedirs(empty)
+            self.assertEqual(linkcheck.main([empty, '--offline']), 2)
+            self.assertEqual(linkcheck.main(
+                [os.path.join(self.tmp, 'missing'), '--offline']), 2)
+        finally:
+            sys.stdout.close()
+            sys.stdout = stdout
+        self.assertFalse(os.path.exists(cache))
+        self.assertRaises(ValueError, check, empty, offline=True)
+
+    def test_online(self):
+        cache = LinkCache()
+        problems = check(self.tmp, ignore=[r'.*/ignored$'], cache=cache,
+                         delay=0)
+        external = [problem.url for problem in problems
+                    if problem.url.startswith('http')]
+        self.assertEqual(external, [self.url + '/missing'])
+        # the fragment is not requested again, the ignored url never
+        self.assertEqual(
+            sorted(path for method, path in StubHandler.requests),
+            ['/missing', '/ok']
+        )
+
+    def test_head_refused(self):
+        results = check_external([self.url + '/head-refused'], delay=0)
+        self.assertEqual(results[self.url + '/head-refused'].status,
+                         'working')
+        self.assertEqual(StubHandler.requests,
+                         [('HEAD', '/head-refused'), ('GET', '/head-refused')])
+
+    def test_cache(self):
+        path = os.path.join(self.tmp, 'cache', 'linkcheck.json')
+        urls = [self.url + '/ok', self.url + '/missing']
+        cache = LinkCache(path)
+        check_external(urls, cache, delay=0)
+        cache.save()
+        self.assertEqual(len(StubHandler.requests), 2)
+
+        # fresh results are not checked again
+        cache = LinkCache(path)
+        results = check_external(urls, cache, delay=0)
+        self.assertEqual(len(StubHandler.requests), 2)
+        self.assertEqual(results[self.url + '/missing'].code, 404)
+
+        # broken links expire first
+        cache = LinkCache(path, ttl=3600, broken_ttl=0)
+        checked_at = cache.results[self.url + '/missing'].checked_at
+        self.assertIsNone(cache.get(self.url + '/missing', checked_at + 1))
+        self.assertIsNotNone(cache.get(self.url + '/ok', checked_at + 1))
+
+    def test_per_host_limit(self):
+        in_flight = []
+        peak = []
+        lock = threading.Lock()
+
+        def fetch(url, timeout):
+            with lock:
+                in_flight.append(url)
+                peak.append(len(in_flight))
+            threading.Event().wait(0.02)
+            with lock:
+                in_flight.remove(url)
+            return 'working', 200, ''
+
+        urls = ['http://example.com/{}'.format(i) for i in range(8)]
+        results = check_external(urls, per_host=2, delay=0, fetch=fetch)
+        self.assertEqual(len(results), 8)
+        self.assertLessEqual(max(peak), 2)
+
+    def test_read_ignore(self):
+        ignore = read_ignore()
+        self.assertTrue(len(ignore) > 0)
+        self.assertTrue(all(isinstance(pattern, str) for pattern in ignore))
+
+
+if __name__ == '__main__':
+    unittest.main()
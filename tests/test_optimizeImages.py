@@ -0,0 +1,177 @@
+import json
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+from types import SimpleNamespace
+
+dirname, filename = os.path.split(os.path.abspath(__file__))
+sys.path.append(os.path.sep.join(dirname.split(os.path.sep)[:-1] + ['_ext']))
+
+from PIL import Image
+
+from copyImages import file_hash, hashed_name
+from optimizeImages import (
+    VARIANTS_MANIFEST, PictureTranslatorMixin, encode_image, encode_images,
+    optimized_name, write_variants
+)
+
+
+class ImageTranslator(object):
+
+    def __init__(self, builder):
+        self.builder = builder
+        self.body = []
+
+    def visit_image(self, node):
+        self.body.append('<img src="{}/{}" />'.format(
+            self.builder.imgpath, self.builder.images[node['uri']]))
+
+    def depart_image(self, node):
+        pass
+
+
+class PictureTranslator(PictureTranslatorMixin, ImageTranslator):
+    pass
+
+
+class TestOptimizeImages(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.key = 'content/images/figure.png'
+        self.src = os.path.join(self.tmp, *self.key.split('/'))
+        os.makedirs(os.path.dirname(self.src))
+        # uncompressed, so that the lossless recompression is smaller
+        img = Image.new('RGB', (64, 32))
+        img.putdata([(x * 4, y * 8, 0) for y in range(32) for x in range(64)])
+        img.save(self.src, 'PNG', compress_level=0)
+
+        self.name = hashed_name(self.key, file_hash(self.src))
+        self.imagedir = os.path.join(self.tmp, '_build', 'html', '_images')
+        os.makedirs(self.imagedir)
+        shutil.copyfile(self.src, os.path.join(self.imagedir, self.name))
+
+        self.app = SimpleNamespace(
+            srcdir=self.tmp,
+            outdir=os.path.join(self.tmp, '_build', 'html'),
+            builder=SimpleNamespace(format='html', imagedir='_images'),
+            config=SimpleNamespace(
+                optimize_images=True, optimize_images_widths=[16, 128],
+                optimize_images_quality=85, optimize_images_jobs=2,
+                optimize_images_cache='cache',
+                hashed_images_contentdir='content',
+            ),
+            env=SimpleNamespace(images={self.key: ({'index'}, self.name)}),
+        )
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def test_encode_image(self):
+        cachedir = os.path.join(self.tmp, 'entry')
+        meta = encode_image(self.src, cachedir, [16, 128], 85)
+        self.assertEqual((meta['width'], meta['height']), (64, 32))
+        # no upscaled variants
+        self.assertEqual(meta['widths'], [16])
+        self.assertEqual(
+            meta['optimized'],
+            file_hash(os.path.join(cachedir, 'optimized.png'))
+        )
+        self.assertEqual(
+            sorted(os.listdir(cachedir)),
+            ['16w.png', '16w.webp', 'full.webp', 'meta.json', 'optimized.png']
+        )
+
+    def test_cache(self):
+        encode_images(self.app, self.app.env)
+        meta, cachedir = self.app.optimized_images[self.key]
+
+        # a second build reads the cached entry instead of encoding again
+        with open(os.path.join(cachedir, 'meta.json'), 'w') as f:
+            json.dump(dict(meta, cached=True), f)
+        encode_images(self.app, self.app.env)
+        self.assertTrue(self.app.optimized_images[self.key][0]['cached'])
+
+        # other settings are other entries
+        self.app.config.optimize_images_quality = 50
+        encode_images(self.app, self.app.env)
+        self.assertNotIn('cached', self.app.optimized_images[self.key][0])
+
+    def test_write_variants(self):
+        encode_images(self.app, self.app.env)
+        write_variants(self.app, None)
+
+        meta = self.app.optimized_images[self.key][0]
+        base = self.name[:-len('.png')]
+        self.assertEqual(sorted(os.listdir(self.imagedir)), sorted([
+            self.name, optimized_name(self.key, meta), VARIANTS_MANIFEST,
+            base + '.webp', base + '.16w.png', base + '.16w.webp',
+        ]))
+        # every content-addressed name still matches the content
+        for name in [self.name, optimized_name(self.key, meta)]:
+            self.assertEqual(
+                hashed_name(self.key, file_hash(
+                    os.path.join(self.imagedir, name))),
+                name
+            )
+
+    def test_changed_variants(self):
+        encode_images(self.app, self.app.env)
+        write_variants(self.app, None)
+        meta, cachedir = self.app.optimized_images[self.key]
+        webp = os.path.join(self.imagedir, self.name[:-len('.png')] + '.webp')
+
+        # a cache entry of the same size but another mtime is copied again
+        full = os.path.join(cachedir, 'full.webp')
+        with open(full, 'rb') as f:
+            data = f.read()
+        with open(full, 'wb') as f:
+            f.write(data[::-1])
+        st = os.stat(full)
+        os.utime(full, ns=(st.st_atime_ns, st.st_mtime_ns + 10**9))
+        write_variants(self.app, None)
+        with open(webp, 'rb') as f:
+            self.assertEqual(f.read(), data[::-1])
+
+        # the image is removed: so are its variants
+        self.app.env.images = {}
+        write_variants(self.app, None)
+        self.assertEqual(
+            sorted(os.listdir(self.imagedir)), [VARIANTS_MANIFEST, self.name]
+        )
+
+    def test_picture(self):
+        encode_images(self.app, self.app.env)
+        meta = self.app.optimized_images[self.key][0]
+        builder = SimpleNamespace(
+            app=self.app, imgpath='../_images',
+            images={self.key: self.name, 'other.gif': 'other.gif'},
+        )
+        translator = PictureTranslator(builder)
+        base = '../_images/' + self.name[:-len('.png')]
+
+        translator.visit_image({'uri': self.key})
+        translator.depart_image({'uri': self.key})
+        self.assertEqual(translator.body, [
+            '<picture>',
+            '<source type="image/webp" srcset="{0}.16w.webp 16w, '
+            '{0}.webp 64w" sizes="(max-width: 64px) 100vw, 64px" />'.format(
+                base),
+            '<source srcset="{0}.16w.png 16w, ../_images/{1} 64w" '
+            'sizes="(max-width: 64px) 100vw, 64px" />'.format(
+                base, optimized_name(self.key, meta)),
+            '<img src="../_images/{}" />'.format(self.name),
+            '</picture>',
+        ])
+
+        # images without variants are left alone
+        translator.body = []
+        translator.visit_image({'uri': 'other.gif'})
+        translator.depart_image({'uri': 'other.gif'})
+        self.assertEqual(translator.body, ['<img src="../_images/other.gif" />'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,100 @@
+import json
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+dirname, filename = os.path.split(os.path.abspath(__file__))
+sys.path.append(os.path.sep.join(dirname.split(os.path.sep)[:-1]))
+
+from routing import Resolver, load_resolver, REDIRECTS_VERSION
+
+
+PAGES = [
+    '/index.html',
+    '/content/index.html',
+    '/content/maxwell/index.html',
+    '/content/maxwell/faraday.html',
+    '/content/new.html',
+]
+
+
+class TestResolver(unittest.TestCase):
+
+    def setUp(self):
+        self.resolver = Resolver(
+            PAGES, {'/content/old.html': '/content/new.html'}, ['en/latest']
+        )
+
+    def test_pages(self):
+        for page in PAGES:
+            self.assertEqual(self.resolver.resolve(page), page)
+
+    def test_directories(self):
+        for path in ['/content/maxwell', '/content/maxwell/']:
+            self.assertEqual(
+                self.resolver.resolve(path), '/content/maxwell/index.html'
+            )
+        self.assertEqual(self.resolver.resolve('/'), '/index.html')
+
+    def test_legacy(self):
+        cases = {
+            '/en/latest': '/index.html',
+            '/en/latest/': '/index.html',
+            '/en/latest/content/maxwell/': '/content/maxwell/index.html',
+            '/en/latest/content/maxwell': '/content/maxwell/index.html',
+            '/en/latest/content/maxwell/faraday.html':
+                '/content/maxwell/faraday.html',
+            '/en/latest/content/old.html': '/content/new.html',
+        }
+        for path, target in cases.items():
+            self.assertEqual(self.resolver.resolve(path), target)
+
+    def test_moved(self):
+        self.assertEqual(
+            self.resolver.resolve('/content/old.html'), '/content/new.html'
+        )
+
+    def test_not_found(self):
+        for path in [
+            '/missing.html', '/content/missing/', '/en/latest/missing.html',
+            '/en/latestcontent/index.html', '/_images/missing.png'
+        ]:
+            self.assertIsNone(self.resolver.resolve(path))
+
+
+class TestLoadResolver(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp, '_redirects.json')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def write(self, manifest):
+        with open(self.path, 'w') as f:
+            json.dump(manifest, f)
+
+    def test_load(self):
+        self.write({
+            'version': REDIRECTS_VERSION, 'pages': PAGES,
+            'redirects': {}, 'legacy_prefixes': ['en/latest']
+        })
+        resolver = load_resolver(self.path)
+        self.assertEqual(
+            resolver.resolve('/en/latest/content/'), '/content/index.html'
+        )
+
+    def test_missing(self):
+        resolver = load_resolver(self.path)
+        self.assertIsNone(resolver.resolve('/content/'))
+
+    def test_old_version(self):
+        self.write({'version': 1, 'redirects': {'/a': '/a/index.html'}})
+        self.assertIsNone(load_resolver(self.path).resolve('/a'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,95 @@
+import functools
+import gzip
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import unittest
+from urllib.request import Request, urlopen
+from urllib.error import HTTPError
+
+dirname, filename = os.path.split(os.path.abspath(__file__))
+sys.path.append(os.path.sep.join(dirname.split(os.path.sep)[:-1]))
+
+import routing
+from serve import Handler, Server, negotiate
+
+
+class TestNegotiate(unittest.TestCase):
+
+    def test_preference(self):
+        self.assertEqual(negotiate('gzip, deflate, br', ['br', 'gzip']), 'br')
+        self.assertEqual(negotiate('gzip', ['br', 'gzip']), 'gzip')
+        self.assertEqual(negotiate('br;q=0.5, gzip', ['br', 'gzip']), 'gzip')
+
+    def test_identity(self):
+        self.assertIsNone(negotiate(None, ['br', 'gzip']))
+        self.assertIsNone(negotiate('gzip;q=0', ['gzip']))
+        self.assertIsNone(negotiate('br', ['gzip']))
+
+    def test_wildcard(self):
+        self.assertEqual(negotiate('*', ['gzip']), 'gzip')
+        self.assertIsNone(negotiate('*, gzip;q=0', ['gzip']))
+
+
+class QuietHandler(Handler):
+
+    def log_message(self, *args):
+        pass
+
+
+class TestServe(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        os.makedirs(os.path.join(self.tmp, 'content'))
+        self.page = b'<html>' + b'x' * 2048 + b'</html>'
+        path = os.path.join(self.tmp, 'content', 'index.html')
+        with open(path, 'wb') as f:
+            f.write(self.page)
+        with open(path + '.gz', 'wb') as f:
+            f.write(gzip.compress(self.page))
+
+        QuietHandler.resolver = routing.Resolver(['/content/index.html'])
+        handler = functools.partial(QuietHandler, directory=self.tmp)
+        self.server = Server(('localhost', 0), handler)
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.start()
+        self.url = 'http://localhost:{}'.format(self.server.server_address[1])
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.thread.join()
+        shutil.rmtree(self.tmp)
+
+    def get(self, path, encoding=None):
+        request = Request(self.url + path)
+        if encoding is not None:
+            request.add_header('Accept-Encoding', encoding)
+        return urlopen(request)
+
+    def test_compressed(self):
+        response = self.get('/content/index.html', 'gzip, br')
+        self.assertEqual(response.headers['Content-Encoding'], 'gzip')
+        self.assertEqual(response.headers['Content-Type'], 'text/html')
+        self.assertEqual(gzip.decompress(response.read()), self.page)
+
+    def test_identity(self):
+        response = self.get('/content/index.html')
+        self.assertIsNone(response.headers['Content-Encoding'])
+        self.assertEqual(response.read(), self.page)
+
+    def test_redirect(self):
+        response = self.get('/content')
+        self.assertEqual(response.url, self.url + '/content/index.html')
+
+    def test_not_found(self):
+        with self.assertRaises(HTTPError) as ctx:
+            self.get('/missing.html')
+        self.assertEqual(ctx.exception.code, 404)
+
+
+if __name__ == '__main__':
+    unittest.main()
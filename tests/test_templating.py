@@ -0,0 +1,81 @@
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+dirname, filename = os.path.split(os.path.abspath(__file__))
+sys.path.append(os.path.sep.join(dirname.split(os.path.sep)[:-1]))
+
+import jinja2
+
+from templating import CompiledLoader, environment, precompile
+
+
+class TestTemplating(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.compiled = os.path.join(self.tmp, 'compiled')
+        self.write('html/page.html',
+                   '<p>{{ _year }}: {{ name }}</p>'
+                   '{% for item in items %}<li>{{ item }}</li>{% endfor %}')
+        self.write('html/other.html', '<p>{{ name }}</p>')
+        self.values = {'_year': '2026', 'name': '<b>Name</b>',
+                       'items': ['a', 'b & c']}
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def write(self, rel, text):
+        path = os.path.join(self.tmp, *rel.split('/'))
+        if not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        with open(path, 'w') as f:
+            f.write(text)
+
+    def render(self, name, compiled):
+        return environment(compiled, self.tmp).get_template(name).render(
+            self.values)
+
+    def test_precompiled_matches_source(self):
+        source = self.render('html/page.html', os.path.join(self.tmp, 'none'))
+        self.assertEqual(
+            source,
+            '<p>2026: &lt;b&gt;Name&lt;/b&gt;</p><li>a</li><li>b &amp; c</li>'
+        )
+
+        precompile(['html/page.html'], self.compiled, self.tmp)
+        loader = CompiledLoader(self.compiled, self.tmp)
+        env = environment(self.compiled, self.tmp)
+        # served from the compiled module
+        template = loader.load(env, 'html/page.html')
+        self.assertEqual(template.render(self.values), source)
+        self.assertEqual(self.render('html/page.html', self.compiled), source)
+
+        # pages that were not compiled are read from their source
+        self.assertRaises(jinja2.TemplateNotFound,
+                          loader.load, env, 'html/other.html')
+        self.assertEqual(self.render('html/other.html', self.compiled),
+                         '<p>&lt;b&gt;Name&lt;/b&gt;</p>')
+
+    def test_stale_module_is_not_used(self):
+        precompile(['html/page.html'], self.compiled, self.tmp)
+        self.write('html/page.html', '<p>rebuilt {{ name }}</p>')
+
+        loader = CompiledLoader(self.compiled, self.tmp)
+        env = environment(self.compiled, self.tmp)
+        self.assertRaises(jinja2.TemplateNotFound,
+                          loader.load, env, 'html/page.html')
+        self.assertEqual(self.render('html/page.html', self.compiled),
+                         '<p>rebuilt &lt;b&gt;Name&lt;/b&gt;</p>')
+
+        # compiling again makes the module current
+        precompile(['html/page.html'], self.compiled, self.tmp)
+        template = loader.load(env, 'html/page.html')
+        self.assertEqual(template.render(self.values),
+                         '<p>rebuilt &lt;b&gt;Name&lt;/b&gt;</p>')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,81 @@
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+dirname, filename = os.path.split(os.path.abspath(__file__))
+sys.path.append(os.path.sep.join(dirname.split(os.path.sep)[:-1]))
+
+from validate import find_orphans, main, validate
+from linkcheck import index_tree
+
+
+class TestValidate(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.write('index.html',
+                   '<a href="content/">content</a>'
+                   '<a href="content/page.html#eq-1">equation</a>')
+        self.write('search.html', '')
+        self.write('content/index.html',
+                   '<a href="page.html">page</a>'
+                   '<a href="page.html#nowhere">nowhere</a>'
+                   '<img src="../_images/figure.1a2b3c4d5e6f.png" />'
+                   '<img src="../_images/gone.png" />')
+        self.write('content/page.html',
+                   '<span id="eq-1"></span><a href="removed.html">removed</a>')
+        self.write('content/orphan.html', '<a href="../index.html">home</a>')
+        self.write('_modules/code.html', '')
+        self.write('_images/figure.1a2b3c4d5e6f.png', '')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def write(self, rel, text):
+        path = os.path.join(self.tmp, *rel.split('/'))
+        if not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        with open(path, 'w') as f:
+            f.write(text)
+
+    def test_report(self):
+        report = validate(self.tmp)
+        self.assertEqual(report.pages, 6)
+        self.assertEqual(
+            sorted((problem.page, problem.url) for problem in report.dangling),
+            [('content/index.html', 'page.html#nowhere'),
+             ('content/page.html', 'removed.html')]
+        )
+        self.assertEqual(
+            [(problem.page, problem.url) for problem in report.images],
+            [('content/index.html', '../_images/gone.png')]
+        )
+        self.assertEqual(report.orphans, ['content/orphan.html'])
+
+    def test_roots(self):
+        index = index_tree(self.tmp)
+        self.assertEqual(
+            find_orphans(index, ['content/orphan.html']), ['search.html']
+        )
+
+    def test_gate(self):
+        sys.stdout, stdout = open(os.devnull, 'w'), sys.stdout
+        try:
+            self.assertEqual(main([self.tmp]), 1)
+
+            self.write('content/index.html',
+                       '<a href="page.html">page</a>'
+                       '<img src="../_images/figure.1a2b3c4d5e6f.png" />')
+            self.write('content/page.html', '<span id="eq-1"></span>')
+            self.assertEqual(main([self.tmp]), 0)
+            self.assertEqual(main([self.tmp, '--fail-on-orphans']), 1)
+            self.assertEqual(main([os.path.join(self.tmp, 'missing')]), 2)
+        finally:
+            sys.stdout.close()
+            sys.stdout = stdout
+
+
+if __name__ == '__main__':
+    unittest.main()
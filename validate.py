@@ -0,0 +1,130 @@
+"""
+Validate the cross-references of the html build before it is deployed.
+
+Finding a broken internal link used to take a full ``sphinx-build -nW``.
+This reads the built pages instead: every page of ``_build/html`` is
+scanned once (on a thread pool, see linkcheck.index_tree) for its ids and
+links, and the index is checked for
+
+- dangling links: internal links to files or anchors that do not exist,
+- missing images: links into ``_images`` to files that were not copied,
+- orphaned pages: pages that cannot be reached by following the links from
+  the entry pages (``index.html``, ``search.html``, ``genindex.html``, ...).
+
+It runs as a test (tests/test_docs.py) and before ``gcloud app deploy``
+(.travis.yml). Usage::
+
+    python validate.py [directory] [--root PAGE ...] [--fail-on-orphans]
+
+Dangling links and missing images fail the validation. Orphaned pages only
+do with ``--fail-on-orphans``: pages of removed documents stay in the
+output directory until it is cleaned.
+"""
+
+import argparse
+import os
+import sys
+import time
+from collections import namedtuple
+
+from linkcheck import HTML, check_internal, index_tree, resolve
+
+IMAGES = '_images/'
+
+# pages reached without a link from another page
+ROOTS = ['index.html', 'search.html', 'genindex.html', 'py-modindex.html',
+         'error.html']
+
+Report = namedtuple('Report', ['pages', 'dangling', 'images', 'orphans'])
+
+
+def reachable(index, roots):
+    """
+    Paths of the pages of index reached from roots by following links
+    """
+    seen = set(root for root in roots if root in index)
+    todo = list(seen)
+    while todo:
+        page = index[todo.pop()]
+        for url in page.links:
+            resolved = resolve(page.path, url)
+            if resolved is None:
+                continue
+            target = resolved[0]
+            if target == '' or target.endswith('/'):
+                target += 'index.html'
+            if target in index and target not in seen:
+                seen.add(target)
+                todo.append(target)
+    return seen
+
+
+def find_orphans(index, roots=ROOTS):
+    """
+    Pages of index that are not reachable from roots (the pages of the
+    directories starting with '_', e.g. _modules and _static, excepted)
+    """
+    seen = reachable(index, roots)
+    return sorted(
+        path for path in index
+        if path not in seen and not path.startswith('_')
+    )
+
+
+def validate(outdir=HTML, roots=ROOTS, jobs=None):
+    """
+    The Report of the html build in outdir
+    """
+    index = index_tree(outdir, jobs)
+    dangling = []
+    images = []
+    for problem in check_internal(outdir, index):
+        resolved = resolve(problem.page, problem.url)
+        if resolved is not None and resolved[0].startswith(IMAGES):
+            images.append(problem)
+        else:
+            dangling.append(problem)
+    return Report(
+        pages=len(index), dangling=dangling, images=images,
+        orphans=find_orphans(index, roots),
+    )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('directory', nargs='?', default=HTML)
+    parser.add_argument('--root', action='append', dest='roots',
+                        help='entry page (default: {})'.format(
+                            ', '.join(ROOTS)))
+    parser.add_argument('--fail-on-orphans', action='store_true',
+                        help='fail when there are orphaned pages')
+    parser.add_argument('--jobs', type=int)
+    args = parser.parse_args(argv)
+
+    if not os.path.isdir(args.directory):
+        print('{} is not a directory, build the html first'.format(
+            args.directory))
+        return 2
+
+    start = time.time()
+    report = validate(args.directory, args.roots or ROOTS, args.jobs)
+
+    for problem in report.dangling:
+        print('dangling link: {}: {}: {}'.format(*problem))
+    for problem in report.images:
+        print('missing image: {}: {}'.format(problem.page, problem.url))
+    for path in report.orphans:
+        print('orphaned page: {}'.format(path))
+    print('{} pages, {} dangling links, {} missing images, {} orphaned pages '
+          '({:.1f}s)'.format(
+              report.pages, len(report.dangling), len(report.images),
+              len(report.orphans), time.time() - start))
+
+    failed = report.dangling or report.images or (
+        report.orphans and args.fail_on_orphans
+    )
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())